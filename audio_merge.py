@@ -0,0 +1,170 @@
+"""
+仅音频模式：只下载音频流，把各曲目与短静音间隔一次拼接为带章节标记的 MP3 / M4A 音乐合集。
+不生成标题卡、不转码视频，整个合并只有一次纯音频编码。
+"""
+import os
+import traceback
+from typing import List
+
+from log import get_logger
+from probe import probe_many
+from utils import move_file, run_ffmpeg
+
+logger = get_logger('audio_merge')
+
+AUDIO_GAP_SECONDS = 1.0
+AUDIO_SAMPLE_RATE = 48000
+# 输出格式 -> 编码参数（两种容器都支持章节）
+AUDIO_FORMATS = {
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '320k', '-id3v2_version', '3'],
+    'm4a': ['-c:a', 'aac', '-b:a', '256k', '-movflags', '+faststart'],
+}
+
+
+def _escape_ffmetadata(value: str) -> str:
+    for ch in ('\\', '=', ';', '#', '\n'):
+        value = value.replace(ch, '\\' + ch)
+    return value
+
+
+def write_chapters(path: str, titles: List[str], starts: List[float], durations: List[float],
+                   album: str | None = None) -> None:
+    """写入 ffmetadata 章节文件（时间基 1/1000）"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(';FFMETADATA1\n')
+        if album:
+            f.write(f"title={_escape_ffmetadata(album)}\nalbum={_escape_ffmetadata(album)}\n")
+        for title, start, duration in zip(titles, starts, durations):
+            f.write('[CHAPTER]\nTIMEBASE=1/1000\n')
+            f.write(f"START={int(round(start * 1000))}\nEND={int(round((start + duration) * 1000))}\n")
+            f.write(f"title={_escape_ffmetadata(title)}\n")
+
+
+def build_audio_concat_cmd(files: List[str], output: str, chapters_path: str, audio_format: str,
+                           gap: float = AUDIO_GAP_SECONDS, loudnorm: List[str | None] | None = None) -> List[str]:
+    """
+    各曲目统一重采样为 48 kHz 立体声，曲目之间插入静音，单个 concat 滤镜输出。
+    loudnorm[i] 为第 i 首的响度归一化滤镜（None 表示不处理），直接放在该曲目的滤镜链开头。
+    """
+    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error']
+    for f in files:
+        cmd += ['-i', f]
+    cmd += ['-f', 'ffmetadata', '-i', chapters_path]
+
+    fmt = f"aresample={AUDIO_SAMPLE_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo"
+    chains: List[str] = []
+    labels: List[str] = []
+    for i in range(len(files)):
+        if i > 0 and gap > 0:
+            chains.append(f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo,atrim=duration={gap},{fmt}[g{i}]")
+            labels.append(f"[g{i}]")
+        norm = loudnorm[i] if loudnorm else None
+        chains.append(f"[{i}:a:0]{norm + ',' if norm else ''}{fmt}[a{i}]")
+        labels.append(f"[a{i}]")
+    chains.append(f"{''.join(labels)}concat=n={len(labels)}:v=0:a=1[out]")
+
+    cmd += [
+        '-filter_complex', ';'.join(chains),
+        '-map', '[out]',
+        '-map_metadata', str(len(files)),
+        '-map_chapters', str(len(files)),
+    ]
+    cmd += AUDIO_FORMATS[audio_format]
+    cmd.append(output)
+    return cmd
+
+
+def merge_audio_files(files: List[str], work_dir: str, audio_format: str = 'mp3',
+                      gap: float = AUDIO_GAP_SECONDS, album: str | None = None,
+                      loudnorm: bool | None = None) -> str | None:
+    """
+    把曲目按给定顺序合并为一个带章节的音频文件，返回其路径；没有可用音轨时返回 None。
+    章节标题取源文件名，起始时间由各曲目时长与静音间隔的前缀和得出。
+    loudnorm 为 True（默认读取 BILI_LOUDNORM）时各曲目按 EBU R128 归一化，仍只有一次编码。
+    """
+    from loudness import loudnorm_enabled, loudnorm_filter, measure_loudness_many
+    from subtitles import clip_start_offsets
+
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"不支持的音频格式: {audio_format}（可选 {', '.join(AUDIO_FORMATS)}）")
+    infos = probe_many(files)
+    tracks = []
+    for f in files:
+        info = infos.get(f)
+        if info is None or not info.has_audio:
+            print(f"⚠️ 没有音轨，已跳过：{os.path.basename(f)}")
+            continue
+        tracks.append((f, info.duration))
+    if not tracks:
+        print("❌ 没有可用的音轨")
+        return None
+
+    os.makedirs(work_dir, exist_ok=True)
+    paths = [f for f, _ in tracks]
+    durations = [d for _, d in tracks]
+    starts = clip_start_offsets(durations, [0.0] + [gap] * (len(tracks) - 1))
+    titles = [os.path.splitext(os.path.basename(f))[0] for f in paths]
+    chapters_path = os.path.join(work_dir, 'chapters.txt')
+    write_chapters(chapters_path, titles, starts, durations, album)
+    filters = None
+    if loudnorm_enabled(loudnorm):
+        print("🔊 正在分析响度（已分析过的曲目直接使用缓存）...")
+        measurements = measure_loudness_many(paths)
+        filters = [loudnorm_filter(measurements[f], AUDIO_SAMPLE_RATE) if measurements.get(f) else None
+                   for f in paths]
+
+    output = os.path.join(work_dir, f"merged_audio.{audio_format}")
+    total = starts[-1] + durations[-1]
+    print(f"🎵 正在合并 {len(tracks)} 首曲目（共 {total / 60:.1f} 分钟）...")
+    from progress import ProgressAggregator
+    tracker = ProgressAggregator("音频合并进度", {0: total})
+    run_ffmpeg(build_audio_concat_cmd(paths, output, chapters_path, audio_format, gap, filters),
+               output_paths=[output], on_progress=tracker.report(0), duration=total)
+    logger.debug("音频合并完成: %s", output)
+    return output
+
+
+def save_audio_output(path: str, new_name: str | None = None, target_dir: str | None = None) -> str | None:
+    """把合并好的音频移动到 target_dir（默认脚本所在目录）；未指定 new_name 时交互询问"""
+    from merge import is_valid_output_name
+    if new_name is None:
+        while True:
+            new_name = input("请输入音乐合集的文件名（不含扩展名，如 monthly）：").strip()
+            if is_valid_output_name(new_name):
+                break
+            print("❌ 文件名无效，请重新输入（不能包含特殊字符）")
+    elif not is_valid_output_name(new_name):
+        raise ValueError(f"文件名无效（不能包含特殊字符）: {new_name}")
+    base_dir = target_dir or os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(base_dir, exist_ok=True)
+    target = move_file(path, base_dir, new_name)
+    if target:
+        print(f"✅ 音乐合集已保存为：{target}")
+    return target
+
+
+def run_audio_compilation(audio_format: str | None = None) -> bool:
+    """交互式：只下载音频，合并为带章节的音乐合集"""
+    from download import get_save_path, get_sessdata, read_bv_list, download_bvs, print_download_summary
+    from merge import work_dir_path
+    try:
+        save_path = get_save_path(audio_only=True)
+        sessdata = get_sessdata()
+        bv_list = read_bv_list()
+        if not bv_list:
+            print("❌ 未识别任何 BV")
+            return False
+        if audio_format is None:
+            choice = input("输出格式：1. MP3（默认）  2. M4A：").strip()
+            audio_format = 'm4a' if choice == '2' else 'mp3'
+        results = download_bvs(bv_list, save_path, sessdata, audio_only=True)
+        print_download_summary(results)
+        files = [f for r in results for f in r.files]
+        output = merge_audio_files(files, work_dir_path(save_path), audio_format)
+        if output is None:
+            return False
+        return save_audio_output(output) is not None
+    except Exception as e:
+        print(f"❌ 程序运行失败：{e}")
+        traceback.print_exc()
+        return False
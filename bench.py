@@ -0,0 +1,509 @@
+"""
+离线基准测试：用 ffmpeg lavfi（testsrc + sine）生成合成素材，分阶段计时合并流程，结果写入 JSON。
+
+    python bench.py                        # 默认矩阵，libx264，结果写入 bench_results.json
+    python bench.py --matrix full --repeat 3 --out bench_full.json
+    python bench.py --download-sim --out bench_download.json
+
+阶段与 merge_videos_with_best_hevc 一一对应：探测、间隔片段、逐片段转码、拼接（含 MP3 第二输出）、字幕合并；
+音频提取为 MP3 第二输出的增量成本（拼接耗时减去只输出视频的同样拼接），不另计入总耗时。
+素材矩阵同时包含未标注与标注 BT.709 色彩的源，两类源都应走流复制拼接。
+全程使用 CPU 编码器与独立的临时缓存目录，不读写用户的探测缓存和标题卡缓存。
+
+--download-sim 不需要 ffmpeg 与网络：本地 HTTP 服务模拟 B 站（首包延迟、单连接限速、总带宽、
+并发过高时返回 412），用真实的 _download_one（重试、退避、失败分类）分别以固定并发与自适应并发下载，
+比较总耗时、412 次数与并发轨迹；--sim-bandwidth-cap 另跑一次带总带宽上限的自适应并发，检查上限是否守住。
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from typing import Dict, List
+
+# 合成素材矩阵：(宽, 高, 帧率, 时长秒, 是否带 .ass 字幕, 是否标注 BT.709 色彩)
+# B 站的源通常带 BT.709 标注，ffmpeg lavfi 生成的默认不带；两种都要覆盖
+SOURCE_MATRICES = {
+    'small': [
+        (1280, 720, 30, 6, True, False),
+        (1920, 1080, 60, 6, False, True),
+        (854, 480, 25, 4, True, True),
+    ],
+    'full': [
+        (640, 360, 24, 10, False, False),
+        (854, 480, 25, 10, True, True),
+        (1280, 720, 30, 20, True, False),
+        (1920, 1080, 30, 20, False, True),
+        (1920, 1080, 60, 30, True, True),
+        (2560, 1440, 60, 15, False, True),
+    ],
+}
+BT709_ARGS = ['-color_primaries', 'bt709', '-color_trc', 'bt709', '-colorspace', 'bt709', '-color_range', 'tv']
+
+ASS_TEMPLATE = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,48,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def _format_ass_time(seconds: float) -> str:
+    h = int(seconds // 3600)
+    m = int(seconds % 3600 // 60)
+    return f"{h}:{m:02d}:{seconds % 60:05.2f}"
+
+
+def write_synthetic_subtitle(path: str, width: int, height: int, duration: float) -> None:
+    """每秒一条 Dialogue 的 ASS 字幕"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(ASS_TEMPLATE.format(width=width, height=height))
+        for second in range(int(duration)):
+            start, end = _format_ass_time(second), _format_ass_time(second + 0.9)
+            f.write(f"Dialogue: 0,{start},{end},Default,,0,0,0,,第 {second + 1} 秒\n")
+
+
+def generate_source(path: str, width: int, height: int, fps: int, duration: float, bt709: bool = False) -> None:
+    """
+    用 lavfi testsrc/sine 生成带音轨的 H.264 MP4（44.1 kHz，故意与段格式不一致以覆盖完整转码路径）；
+    bt709=True 时在码流与容器中标注 BT.709 色彩
+    """
+    cmd = [
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc=size={width}x{height}:rate={fps}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}',
+        *(BT709_ARGS if bt709 else []),
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k', '-shortest',
+        path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def generate_sources(source_dir: str, matrix: List[tuple]) -> List[Dict]:
+    sources = []
+    for i, (width, height, fps, duration, with_subtitle, bt709) in enumerate(matrix):
+        tag = '_bt709' if bt709 else ''
+        path = os.path.join(source_dir, f"src_{i:02d}_{width}x{height}_{fps}fps_{duration}s{tag}.mp4")
+        generate_source(path, width, height, fps, duration, bt709)
+        if with_subtitle:
+            write_synthetic_subtitle(os.path.splitext(path)[0] + '.ass', width, height, duration)
+        sources.append({
+            'path': path, 'width': width, 'height': height, 'fps': fps,
+            'duration': duration, 'subtitle': with_subtitle, 'bt709': bt709, 'bytes': os.path.getsize(path),
+        })
+    return sources
+
+
+@contextmanager
+def _stage(timings: Dict[str, float], name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 4)
+        print(f"⏱️  {name}: {timings[name]:.3f}s")
+
+
+def run_once(sources: List[Dict], work_dir: str, encoder: str, max_workers: int | None) -> Dict:
+    """按合并流程的顺序执行一次，返回各阶段耗时与逐片段耗时"""
+    from concurrent.futures import ThreadPoolExecutor
+    from merge import (
+        ClipJob, GAP_SECONDS, concat_segments_copy, encode_concat, find_subtitle, generate_gap_segments,
+        get_transcode_workers, plan_clip_mode, run_clip_job, segment_signature, segments_compatible,
+    )
+    from probe import probe_many
+    from subtitles import SubtitleSource, clip_start_offsets, merge_subtitles
+
+    os.makedirs(work_dir, exist_ok=True)
+    files = [s['path'] for s in sources]
+    timings: Dict[str, float] = {}
+
+    with _stage(timings, 'probe'):
+        infos = probe_many(files, use_cache=False)
+
+    with _stage(timings, 'gap_generation'):
+        names = [os.path.splitext(os.path.basename(f))[0] for f in files]
+        gaps, gap_failures = generate_gap_segments(work_dir, names, encoder, max_workers=max_workers)
+    if gap_failures:
+        raise RuntimeError(f"间隔片段生成失败: {gap_failures}")
+    reference = segment_signature(probe_many([gaps[0]], use_cache=False).get(gaps[0]))
+
+    jobs = []
+    for i, f in enumerate(files):
+        info = infos.get(f)
+        width, height = info.resolution if info and info.resolution else (1920, 1080)
+        jobs.append(ClipJob(f, os.path.join(work_dir, f"clip_{i:03d}.ts"), width, height,
+                            plan_clip_mode(info, encoder, reference)))
+
+    clip_timings: List[Dict] = []
+
+    def _timed_clip(job: ClipJob) -> None:
+        start = time.perf_counter()
+        run_clip_job(job, encoder)
+        clip_timings.append({
+            'source': os.path.basename(job.src), 'mode': job.mode,
+            'seconds': round(time.perf_counter() - start, 4),
+        })
+
+    with _stage(timings, 'transcode'):
+        with ThreadPoolExecutor(max_workers=get_transcode_workers(encoder, max_workers)) as pool:
+            list(pool.map(_timed_clip, jobs))
+
+    segments: List[str] = []
+    for i, job in enumerate(jobs):
+        segments += [gaps[i], job.dst]
+    output = os.path.join(work_dir, 'merged.mp4')
+    concat_mode = 'copy'
+
+    def _concat(out: str, audio_out: str | None) -> None:
+        # 与 assemble_segments 相同：段参数一致时流复制，否则（或流复制失败时）一次编码拼接；MP3 为同一进程的第二个输出
+        nonlocal concat_mode
+        if concat_mode == 'copy':
+            try:
+                concat_segments_copy(segments, out, os.path.join(work_dir, 'concat_list.txt'), audio_out)
+                return
+            except Exception as e:
+                print(f"⚠️ 流复制拼接失败，改为一次编码拼接：{e}")
+                concat_mode = 'encode'
+        encode_concat(segments, out, encoder, audio_out)
+
+    with _stage(timings, 'concat'):
+        if not segments_compatible(segments):
+            concat_mode = 'encode'
+        _concat(output, os.path.join(work_dir, 'merged.mp3'))
+    print(f"🎬 拼接方式: {concat_mode}")
+
+    with _stage(timings, 'subtitle_merge'):
+        clip_infos = probe_many([job.dst for job in jobs], use_cache=False)
+        durations = [clip_infos[job.dst].duration if clip_infos.get(job.dst) else 0.0 for job in jobs]
+        offsets = clip_start_offsets(durations, [GAP_SECONDS] * len(jobs))
+        entries = []
+        for i, f in enumerate(files):
+            subtitle = find_subtitle(f)
+            if subtitle:
+                entries.append(SubtitleSource(subtitle, offsets[i]))
+        if entries:
+            merge_subtitles(entries, os.path.join(work_dir, 'merged.ass'))
+
+    # MP3 已在 concat 阶段作为第二个输出生成；以同样的方式只输出视频再拼接一次，差值即音频提取的增量成本
+    video_only: Dict[str, float] = {}
+    with _stage(video_only, 'concat_video_only'):
+        _concat(os.path.join(work_dir, 'merged_video_only.mp4'), None)
+
+    timings['total'] = round(sum(timings.values()), 4)
+    # 已含在 concat 中，不计入 total
+    timings['audio_extraction'] = round(max(0.0, timings['concat'] - video_only['concat_video_only']), 4)
+    print(f"⏱️  audio_extraction: {timings['audio_extraction']:.3f}s（MP3 第二输出的增量）")
+    return {'stages': timings, 'concat_mode': concat_mode, 'concat_video_only': video_only['concat_video_only'],
+            'clips': sorted(clip_timings, key=lambda c: c['source'])}
+
+
+# ---- 下载并发模拟 ----
+
+# 模拟参数：条目数、每个文件大小、首包延迟、单连接速度、服务端总带宽、超过多少并发连接时返回 412
+DOWNLOAD_SIM_DEFAULTS = {
+    'items': 40,
+    'size': 1024 * 1024,
+    'latency': 0.1,
+    'per_connection': 1024 * 1024,
+    'server_bandwidth': 4 * 1024 * 1024,
+    'throttle_above': 6,
+}
+SIM_CHUNK_BYTES = 64 * 1024
+
+
+class _SimState:
+    """模拟服务端的共享状态：活动连接数与总带宽调度（虚拟时钟式令牌桶）"""
+
+    def __init__(self, params: Dict):
+        self.params = params
+        self.lock = threading.Lock()
+        self.active = 0
+        self.throttled = 0
+        self.requests = 0
+        self._next_free = time.monotonic()
+
+    def reserve(self, n: int) -> float:
+        """为 n 字节预约总带宽，返回可发送的时刻"""
+        with self.lock:
+            start = max(time.monotonic(), self._next_free)
+            self._next_free = start + n / self.params['server_bandwidth']
+            return self._next_free
+
+
+def _make_sim_handler(state: _SimState):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            params = state.params
+            with state.lock:
+                state.active += 1
+                state.requests += 1
+                active = state.active
+            try:
+                time.sleep(params['latency'])
+                if active > params['throttle_above']:
+                    with state.lock:
+                        state.throttled += 1
+                    self.send_response(412)
+                    self.end_headers()
+                    return
+                size = params['size']
+                self.send_response(200)
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+                sent = 0
+                conn_next = time.monotonic()
+                while sent < size:
+                    n = min(SIM_CHUNK_BYTES, size - sent)
+                    conn_next = max(conn_next, time.monotonic()) + n / params['per_connection']
+                    time.sleep(max(0.0, max(conn_next, state.reserve(n)) - time.monotonic()))
+                    self.wfile.write(b'\0' * n)
+                    sent += n
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+    return Handler
+
+
+class _SimYutto:
+    """替代 yutto 工作进程池（同样的 run(args, log_path, on_start) 接口）：从模拟服务下载到 -d 目录"""
+
+    def __init__(self, port: int):
+        self.port = port
+
+    def run(self, args: List[str], log_path: str, on_start=None) -> int:
+        import urllib.error
+        import urllib.request
+        bv = args[-1]
+        target_dir = args[args.index('-d') + 1]
+        cancelled = threading.Event()
+        paused = threading.Event()
+        if on_start is not None:
+            on_start(cancelled.set, lambda pause: paused.set() if pause else paused.clear())
+        with open(log_path, 'a', encoding='utf-8') as log:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/{bv}", timeout=30) as resp, \
+                        open(os.path.join(target_dir, f"{bv}.mp4"), 'wb') as out:
+                    while not cancelled.is_set():
+                        if paused.is_set():
+                            time.sleep(0.05)
+                            continue
+                        chunk = resp.read(SIM_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        out.flush()
+                return 1 if cancelled.is_set() else 0
+            except urllib.error.HTTPError as e:
+                # 与 yutto 错误级日志行的格式一致，失败分类才会识别
+                log.write(f" ERROR  HTTP {e.code} {e.reason}\n")
+            except OSError as e:
+                log.write(f" ERROR  connection error: {e}\n")
+            return 1
+
+
+def _run_download_scenario(port: int, state: _SimState, root: str, name: str, threads: int, limiter) -> Dict:
+    from concurrent.futures import ThreadPoolExecutor
+    from download import _download_one
+
+    save_path = os.path.join(root, name)
+    os.makedirs(save_path)
+    bv_list = [f"BV1sim{i:06d}" for i in range(state.params['items'])]
+    runner = _SimYutto(port)
+    with state.lock:
+        state.throttled = state.requests = 0
+    start = time.perf_counter()
+    if limiter is not None:
+        limiter.start()
+    # _download_one 的逐条输出很多，模拟时丢弃，只保留汇总
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda item: _download_one(item[0], item[1], save_path, '', False, runner, limiter),
+                                enumerate(bv_list)))
+    elapsed = time.perf_counter() - start
+    if limiter is not None:
+        limiter.stop()
+    total_bytes = sum(r.bytes for r in results)
+    summary = {
+        'scenario': name,
+        'seconds': round(elapsed, 3),
+        'ok': sum(1 for r in results if r.ok),
+        'failed': sum(1 for r in results if not r.ok),
+        'attempts': sum(r.attempts for r in results),
+        'requests': state.requests,
+        'http_412': state.throttled,
+        'throughput_mb_s': round(total_bytes / elapsed / 1024 / 1024, 3),
+    }
+    if limiter is not None:
+        summary['final_limit'] = int(limiter.limit)
+        summary['limit_history'] = limiter.history
+        summary['pause_events'] = limiter.pause_events
+    print(f"⏱️  {name}: {summary['seconds']:.2f}s，{summary['throughput_mb_s']:.2f} MB/s，"
+          f"412 × {summary['http_412']}，成功 {summary['ok']}/{len(bv_list)}")
+    return summary
+
+
+def run_download_sim(root: str, params: Dict, fixed: List[int], initial: int, maximum: int,
+                     bandwidth_cap: float | None = None) -> List[Dict]:
+    """
+    固定并发（fixed 中的每个值）与自适应并发（从 initial 起步，上限 maximum）各跑一次；
+    给出 bandwidth_cap（字节/秒）时再跑一次带总带宽上限的自适应并发
+    """
+    from http.server import ThreadingHTTPServer
+    from concurrency import AdaptiveLimiter
+
+    # 模拟时缩短退避与统计窗口，让控制器在几十秒内收敛
+    os.environ['BILI_RETRY_BASE_SECONDS'] = '0.2'
+    os.environ['BILI_DOWNLOAD_RETRIES'] = '8'
+    state = _SimState(params)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _make_sim_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    try:
+        runs = [_run_download_scenario(port, state, root, f"fixed_{n}", n, None) for n in fixed]
+        limiter = AdaptiveLimiter(initial, maximum, window=2.0, poll_interval=0.2, stall_seconds=5.0,
+                                  on_change=lambda line: None)
+        runs.append(_run_download_scenario(port, state, root, 'adaptive', maximum, limiter))
+        if bandwidth_cap:
+            limiter = AdaptiveLimiter(initial, maximum, window=2.0, poll_interval=0.2, stall_seconds=5.0,
+                                      bandwidth_limit=bandwidth_cap, on_change=lambda line: None)
+            runs.append(_run_download_scenario(port, state, root, 'adaptive_capped', maximum, limiter))
+        return runs
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _git_commit() -> str | None:
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _ffmpeg_version() -> str | None:
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+        return result.stdout.splitlines()[0] if result.stdout else None
+    except OSError:
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="合并流程的离线基准测试")
+    parser.add_argument('--matrix', choices=sorted(SOURCE_MATRICES), default='small', help="合成素材矩阵")
+    parser.add_argument('--encoder', default='libx264', help="CPU 编码器（libx264 或 libx265）")
+    parser.add_argument('--repeat', type=int, default=1, help="重复次数（每次使用全新工作目录）")
+    parser.add_argument('--workers', type=int, help="转码并发数（默认同 BILI_TRANSCODE_WORKERS 规则）")
+    parser.add_argument('--out', default='bench_results.json', help="JSON 结果文件")
+    parser.add_argument('--keep', action='store_true', help="保留临时目录")
+    parser.add_argument('--download-sim', action='store_true', help="改为运行下载并发模拟（不需要 ffmpeg 与网络）")
+    parser.add_argument('--sim-fixed', default='1,3,8', help="模拟中对比的固定并发数，逗号分隔")
+    parser.add_argument('--sim-initial', type=int, default=3, help="自适应并发的初始值")
+    parser.add_argument('--sim-max', type=int, default=10, help="自适应并发的上限")
+    parser.add_argument('--sim-bandwidth-cap', type=float, help="另跑一次带总带宽上限（MB/s）的自适应并发")
+    for key, value in DOWNLOAD_SIM_DEFAULTS.items():
+        parser.add_argument(f"--sim-{key.replace('_', '-')}", dest=f"sim_{key}", type=type(value), default=value,
+                            help=f"模拟参数 {key}（默认 {value}）")
+    args = parser.parse_args(argv)
+
+    if args.download_sim:
+        return _main_download_sim(args)
+
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("❌ 需要 ffmpeg 与 ffprobe")
+        return 1
+
+    root = tempfile.mkdtemp(prefix='bili_bench_')
+    # 独立的缓存目录：每次都是冷缓存，且不污染用户缓存
+    os.environ['BILI_CACHE_DIR'] = os.path.join(root, 'cache')
+    try:
+        source_dir = os.path.join(root, 'sources')
+        os.makedirs(source_dir)
+        print(f"🧪 生成合成素材（{args.matrix}）...")
+        sources = generate_sources(source_dir, SOURCE_MATRICES[args.matrix])
+        runs = []
+        for n in range(args.repeat):
+            print(f"\n🏁 第 {n + 1}/{args.repeat} 轮")
+            shutil.rmtree(os.environ['BILI_CACHE_DIR'], ignore_errors=True)
+            runs.append(run_once(sources, os.path.join(root, f'run_{n}'), args.encoder, args.workers))
+
+        stage_names = list(runs[0]['stages'])
+        report = {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'platform': platform.platform(),
+            'python': sys.version.split()[0],
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': _ffmpeg_version(),
+            'encoder': args.encoder,
+            'matrix': args.matrix,
+            'sources': [{k: v for k, v in s.items() if k != 'path'} for s in sources],
+            'runs': runs,
+            'best': {name: min(run['stages'][name] for run in runs) for name in stage_names},
+        }
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 结果已写入 {args.out}")
+        return 0
+    finally:
+        if args.keep:
+            print(f"📁 临时目录保留在 {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _main_download_sim(args) -> int:
+    root = tempfile.mkdtemp(prefix='bili_bench_dl_')
+    os.environ['BILI_CACHE_DIR'] = os.path.join(root, 'cache')
+    try:
+        params = {key: getattr(args, f"sim_{key}") for key in DOWNLOAD_SIM_DEFAULTS}
+        fixed = [int(n) for n in args.sim_fixed.split(',') if n.strip().isdigit()]
+        print(f"🧪 下载并发模拟：{params}")
+        cap = args.sim_bandwidth_cap * 1024 * 1024 if args.sim_bandwidth_cap else None
+        runs = run_download_sim(root, params, fixed, args.sim_initial, args.sim_max, cap)
+        report = {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'platform': platform.platform(),
+            'python': sys.version.split()[0],
+            'params': params,
+            'runs': runs,
+        }
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 结果已写入 {args.out}")
+        return 0
+    finally:
+        if args.keep:
+            print(f"📁 临时目录保留在 {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
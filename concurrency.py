@@ -0,0 +1,305 @@
+"""
+自适应下载并发（AIMD）：根据实测吞吐与限流信号调整同时进行的下载数。
+
+- 加性增加：下载成功完成且总吞吐仍随并发上升时，并发上限每轮（约 limit 次完成）加 1
+- 乘性减少：出现风控 412 / 限流 429 或传输停滞时上限减半，并在冷却期内不再增加；
+  停滞的那次尝试会被终止（通过 set_cancel 登记的回调），由下载线程按可重试失败退避重试
+- 吞吐不再随并发上升（比低一档并发时的最好成绩低 10% 以上）时减 1，停在平台期的起点
+- 总带宽上限：近期总吞吐达到上限时不再启动新的下载，并逐个暂停正在进行的下载（SIGSTOP，最晚开始的优先），
+  回落到上限的 90% 以下后逐个恢复（SIGCONT）。yutto 在独立进程中传输，无法逐字节限速；
+  Windows 没有暂停进程的信号，只能限制启动新的下载
+
+吞吐由监视线程每秒统计各下载暂存目录中媒体文件（含临时分片）的大小增量得到，不依赖 yutto 的输出格式。
+"""
+import os
+import signal
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+from log import get_logger
+
+logger = get_logger('concurrency')
+
+POLL_INTERVAL_SECONDS = 1.0
+THROUGHPUT_WINDOW_SECONDS = 10.0
+PLATEAU_TOLERANCE = 0.9
+# 不计入传输量的文件：yutto.log 在卡住时仍可能增长（重试、进度输出），不能当作下载进度
+NON_PAYLOAD_SUFFIXES = ('.log',)
+# 能否暂停/恢复正在运行的下载进程（POSIX 的 SIGSTOP/SIGCONT）
+CAN_PAUSE = hasattr(signal, 'SIGSTOP')
+
+
+def pause_process(proc, paused: bool) -> None:
+    """暂停（SIGSTOP）或恢复（SIGCONT）一个仍在运行的子进程"""
+    if CAN_PAUSE and proc.poll() is None:
+        proc.send_signal(signal.SIGSTOP if paused else signal.SIGCONT)
+
+
+def _dir_size(path: str) -> int:
+    """目录中下载产物（媒体文件及临时分片）的总大小"""
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for name in names:
+            if name.endswith(NON_PAYLOAD_SUFFIXES):
+                continue
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class _Transfer:
+    __slots__ = ('path', 'size', 'last_growth', 'stalled', 'cancel', 'pause', 'paused')
+
+    def __init__(self, path: str | None, now: float):
+        self.path = path
+        self.size = _dir_size(path) if path else 0
+        self.last_growth = now
+        self.stalled = False
+        # 终止本次尝试的回调（下载进程启动后由 set_cancel 登记）
+        self.cancel: Callable[[], None] | None = None
+        # 暂停/恢复本次尝试的回调（参数 True 暂停、False 恢复）；平台不支持时为 None
+        self.pause: Callable[[bool], None] | None = None
+        self.paused = False
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 并发控制器。下载线程在每次尝试前后调用 acquire(key, path) / release(key, ...)；
+    path 为该下载写入的目录（用于统计吞吐与检测停滞），set_cancel(key, cancel, pause) 登记停滞时终止本次尝试、
+    超过总带宽上限时暂停本次尝试的回调。
+    start()/stop() 控制监视线程。
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, bandwidth_limit: float | None = None,
+                 stall_seconds: float = 60.0, on_change: Callable[[str], None] | None = None,
+                 window: float = THROUGHPUT_WINDOW_SECONDS, poll_interval: float = POLL_INTERVAL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        # 字节/秒；None 表示不限
+        self.bandwidth_limit = bandwidth_limit
+        self.stall_seconds = stall_seconds
+        self.window = window
+        self.poll_interval = poll_interval
+        self.on_change = on_change or print
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._active: Dict[str, _Transfer] = {}
+        self._samples: deque = deque()
+        # 各整数并发档位下观察到的最好吞吐
+        self._best: Dict[int, float] = {}
+        self._cooldown_until = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # (时间, 并发上限, 吞吐) 轨迹，供基准测试输出
+        self.history: List[tuple] = []
+        self.throttle_events = 0
+        self.stall_events = 0
+        self.pause_events = 0
+
+    # ---- 统计 ----
+
+    def throughput(self, now: float | None = None) -> float:
+        """最近 window 秒内的总吞吐（字节/秒）"""
+        now = self._clock() if now is None else now
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        return sum(n for _, n in self._samples) / self.window
+
+    def _over_ceiling(self, now: float) -> bool:
+        return self.bandwidth_limit is not None and self.throughput(now) >= self.bandwidth_limit
+
+    def _set_limit(self, value: float, reason: str, now: float) -> None:
+        old = int(self.limit)
+        self.limit = min(float(self.maximum), max(float(self.minimum), value))
+        self.history.append((round(now, 3), round(self.limit, 3), round(self.throughput(now))))
+        if int(self.limit) != old:
+            arrow = '📈' if int(self.limit) > old else '📉'
+            self.on_change(f"{arrow} 下载并发 {old} → {int(self.limit)}（{reason}）")
+        self._cond.notify_all()
+
+    def _decrease(self, reason: str, now: float) -> None:
+        """乘性减少，并在一个统计窗口内不再增加；同一窗口内的后续信号视为同一次拥塞，不重复减半"""
+        if now < self._cooldown_until:
+            return
+        self._cooldown_until = now + self.window
+        self._set_limit(self.limit / 2, reason, now)
+
+    def _increase(self, now: float, saturated: bool) -> None:
+        # 并发槽没有用满时（如批次末尾）吞吐不能说明并发是否合适，不做调整
+        if not saturated or now < self._cooldown_until or self.limit >= self.maximum:
+            return
+        rate = self.throughput(now)
+        level = int(self.limit)
+        self._best[level] = max(self._best.get(level, 0.0), rate)
+        lower = self._best.get(level - 1)
+        if lower and rate < lower * PLATEAU_TOLERANCE:
+            # 增加并发反而变慢：退回上一档
+            self._cooldown_until = now + self.window
+            self._set_limit(level - 1, "吞吐不再随并发上升", now)
+            return
+        if self.bandwidth_limit is not None and rate >= self.bandwidth_limit * PLATEAU_TOLERANCE:
+            return
+        self._set_limit(self.limit + 1.0 / self.limit, "吞吐随并发上升", now)
+
+    # ---- 下载线程接口 ----
+
+    def acquire(self, key: str, path: str | None = None) -> None:
+        """等待一个并发槽（已达上限或总带宽已满时阻塞）"""
+        with self._cond:
+            while len(self._active) >= int(self.limit) or (self._active and self._over_ceiling(self._clock())) \
+                    or any(t.paused for t in self._active.values()):
+                self._cond.wait(self.poll_interval)
+            self._active[key] = _Transfer(path, self._clock())
+
+    def set_cancel(self, key: str, cancel: Callable[[], None] | None,
+                   pause: Callable[[bool], None] | None = None) -> None:
+        """登记终止、暂停/恢复 key 当前尝试的回调；已判定停滞时立即终止"""
+        with self._cond:
+            transfer = self._active.get(key)
+            if transfer is None:
+                return
+            transfer.cancel = cancel
+            transfer.pause = pause
+            if transfer.stalled and cancel is not None:
+                self._cancel(key, transfer)
+
+    def release(self, key: str, ok: bool = True, throttled: bool = False) -> None:
+        """一次尝试结束：throttled=True（412/429）时减半，成功时尝试加性增加"""
+        with self._cond:
+            saturated = len(self._active) >= int(self.limit)
+            transfer = self._active.pop(key, None)
+            if transfer is not None and transfer.paused:
+                # 尝试可能恰在暂停前结束：恢复进程，否则常驻工作进程会停在下一个任务上
+                self._pause(key, transfer, False, self._clock())
+            if transfer is not None and transfer.path:
+                self._account(transfer, self._clock())
+            now = self._clock()
+            if throttled:
+                self.throttle_events += 1
+                self._decrease("检测到风控/限流", now)
+            elif ok:
+                self._increase(now, saturated)
+            self._cond.notify_all()
+
+    # ---- 监视线程 ----
+
+    def _account(self, transfer: _Transfer, now: float) -> None:
+        size = _dir_size(transfer.path)
+        if size > transfer.size:
+            self._samples.append((now, size - transfer.size))
+            transfer.last_growth = now
+            transfer.stalled = False
+        transfer.size = size
+
+    def _cancel(self, key: str, transfer: _Transfer) -> None:
+        cancel, transfer.cancel = transfer.cancel, None
+        logger.debug("传输停滞，终止本次尝试: %s", key)
+        try:
+            cancel()
+        except Exception as e:
+            logger.debug("终止停滞的下载失败: %s, %s", key, e)
+
+    def _pause(self, key: str, transfer: _Transfer, paused: bool, now: float) -> None:
+        try:
+            transfer.pause(paused)
+        except Exception as e:
+            logger.debug("暂停/恢复下载失败: %s, %s", key, e)
+            return
+        transfer.paused = paused
+        if paused:
+            self.pause_events += 1
+            logger.debug("超过总带宽上限，暂停下载: %s", key)
+        else:
+            # 暂停期间没有增长不算停滞
+            transfer.last_growth = now
+            logger.debug("总带宽回落，恢复下载: %s", key)
+
+    def _enforce_ceiling(self, now: float) -> None:
+        """超过总带宽上限时每次暂停一个正在传输的下载（最晚开始的优先），回落到上限的 90% 以下时每次恢复一个"""
+        if self.bandwidth_limit is None:
+            return
+        rate = self.throughput(now)
+        if rate >= self.bandwidth_limit:
+            running = [(k, t) for k, t in self._active.items() if t.pause is not None and not t.paused]
+            if running:
+                self._pause(*running[-1], True, now)
+        elif rate < self.bandwidth_limit * PLATEAU_TOLERANCE:
+            paused = [(k, t) for k, t in self._active.items() if t.paused]
+            if paused:
+                self._pause(*paused[0], False, now)
+
+    def poll(self) -> None:
+        """
+        统计一次各下载的字节增量并检测停滞，停滞的尝试被终止；按总带宽上限暂停或恢复下载
+        （监视线程每 poll_interval 秒调用一次）
+        """
+        with self._cond:
+            now = self._clock()
+            for key, transfer in self._active.items():
+                if not transfer.path:
+                    continue
+                self._account(transfer, now)
+                if not transfer.stalled and not transfer.paused and now - transfer.last_growth >= self.stall_seconds:
+                    transfer.stalled = True
+                    self.stall_events += 1
+                    self._decrease("传输停滞", now)
+                    if transfer.cancel is not None:
+                        self._cancel(key, transfer)
+            self._enforce_ceiling(now)
+            # 总带宽回落后唤醒等待中的下载
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
+
+    def start(self) -> 'AdaptiveLimiter':
+        self._thread = threading.Thread(target=self._run, name='download-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._cond:
+            for key, transfer in self._active.items():
+                if transfer.paused:
+                    self._pause(key, transfer, False, self._clock())
+        logger.debug("并发轨迹: %s", self.history)
+
+
+def _env_float(name: str) -> float | None:
+    value = os.environ.get(name, '').strip()
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def download_limiter(initial: int, maximum: int | None = None) -> AdaptiveLimiter | None:
+    """
+    按环境变量构造下载并发控制器：
+    BILI_DOWNLOAD_ADAPTIVE=0 关闭（固定并发）；BILI_DOWNLOAD_MAX_WORKERS 为上限（默认 max(2×初始值, 6)）；
+    BILI_DOWNLOAD_BANDWIDTH_MB 为总带宽上限（MB/s）；BILI_DOWNLOAD_STALL_SECONDS 为停滞判定时间（默认 60 秒）。
+    显式给出 maximum（如命令行 --workers）时以它为硬上限，优先于环境变量。
+    """
+    if os.environ.get('BILI_DOWNLOAD_ADAPTIVE', '1').strip() == '0':
+        return None
+    if maximum is None:
+        env_maximum = _env_float('BILI_DOWNLOAD_MAX_WORKERS')
+        maximum = int(env_maximum) if env_maximum else max(initial * 2, 6)
+    bandwidth = _env_float('BILI_DOWNLOAD_BANDWIDTH_MB')
+    stall = _env_float('BILI_DOWNLOAD_STALL_SECONDS')
+    return AdaptiveLimiter(
+        initial,
+        maximum,
+        bandwidth_limit=bandwidth * 1024 * 1024 if bandwidth else None,
+        stall_seconds=stall or 60.0,
+    )
@@ -1,339 +1,675 @@
-import os
-import sys
-import time
-import re
-import subprocess
-import shlex
-import traceback
-from typing import List, Tuple
-
-
-def _project_root() -> str:
-    root = os.path.dirname(os.path.abspath(__file__))
-    print(f"[DEBUG] 项目根目录: {root}")
-    return root
-
-
-def _resolve_venv_python() -> str:
-    """解析虚拟环境中 Python 解释器的路径，提供健壮的路径验证和回退机制"""
-    root = _project_root()
-    print(f"[DEBUG] 开始解析虚拟环境Python路径")
-    
-    # 构建候选路径
-    if sys.platform.startswith('win'):
-        candidate = os.path.join(root, '.venv', 'Scripts', 'python.exe')
-    else:
-        candidate = os.path.join(root, '.venv', 'bin', 'python')
-    
-    print(f"[DEBUG] 候选虚拟环境Python路径: {candidate}")
-    
-    # 验证候选路径的有效性
-    if os.path.exists(candidate) and os.path.isfile(candidate):
-        try:
-            # 检查文件可执行性
-            if os.access(candidate, os.X_OK):
-                print(f"[DEBUG] 找到可执行的虚拟环境Python: {candidate}")
-                return candidate
-            else:
-                print(f"⚠️ 警告：发现 Python 路径但不可执行 - {candidate}")
-        except Exception as e:
-            print(f"⚠️ 警告：验证 Python 路径时发生错误 - {e}")
-            traceback.print_exc()
-    
-    # 回退到当前解释器，并提供路径信息用于调试
-    print(f"⚠️ 未找到虚拟环境 Python，回退到主环境解释器：{sys.executable}")
-    print(f"    项目根目录：{root}")
-    print(f"    尝试的虚拟环境路径：{candidate}")
-    
-    return sys.executable
-
-
-def get_sessdata() -> str:
-    print("🔐 获取账号凭据（登录 Bilibili）")
-    cache = "SESSDATA.txt"
-    print(f"[DEBUG] 检查缓存文件: {cache}")
-    if os.path.exists(cache):
-        print("[DEBUG] 发现缓存文件，尝试读取")
-        try:
-            sess = open(cache, 'r', encoding='utf-8').read().strip()
-            print(f"[DEBUG] 缓存文件内容长度: {len(sess)}")
-            if len(sess) > 10 and input("使用缓存凭据？(Y/n): ").lower() in ("", "y"):
-                print("[DEBUG] 使用缓存凭据")
-                return sess
-        except Exception as e:
-            print(f"[DEBUG] 读取缓存文件失败: {e}")
-            traceback.print_exc()
-
-    # 检查是否有图形界面环境
-    has_display = os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')
-    print(f"[DEBUG] 图形界面环境检测结果: DISPLAY={os.environ.get('DISPLAY')}, WAYLAND_DISPLAY={os.environ.get('WAYLAND_DISPLAY')}, has_display={has_display}")
-    
-    # 只在有图形界面的非Windows系统上尝试使用Playwright
-    if has_display and not sys.platform.startswith('win'):
-        print("[DEBUG] 检测到有图形界面的非Windows环境，尝试使用Playwright")
-        # 有图形界面，使用 Playwright 自动获取
-        try:
-            # 延迟导入，确保依赖已安装且当前解释器已切换到虚拟环境
-            print("[DEBUG] 尝试导入Playwright")
-            from playwright.sync_api import sync_playwright
-            print("[DEBUG] Playwright导入成功")
-
-            with sync_playwright() as p:
-                print("[DEBUG] 启动Chromium浏览器")
-                browser = p.chromium.launch(headless=False)
-                context = browser.new_context()
-                page = context.new_page()
-                print("[DEBUG] 访问Bilibili主页")
-                page.goto("https://www.bilibili.com", wait_until="networkidle")
-                sessdata = None
-                print("[DEBUG] 开始监听SESSDATA Cookie")
-                for _ in range(60):
-                    cookies = context.cookies()
-                    for c in cookies:
-                        # 使用 get 方法安全访问可能不存在的键
-                        if c.get('name') == 'SESSDATA':
-                            sessdata = c.get('value')
-                            print(f"[DEBUG] 获取到SESSDATA: {sessdata[:10] if sessdata else ''}...")
-                            break
-                    if sessdata:
-                        break
-                    time.sleep(2)
-                browser.close()
-                if not sessdata:
-                    print("❌ 未能获取登录凭据，切换到手动输入模式")
-                else:
-                    print("[DEBUG] 保存SESSDATA到缓存文件")
-                    with open(cache, 'w', encoding='utf-8') as f:
-                        f.write(sessdata)
-                    print("✅ 成功获取登录凭据")
-                    return sessdata
-        except ImportError as e:
-            print(f"⚠️ Playwright 未安装，切换到手动输入模式: {e}")
-            traceback.print_exc()
-        except Exception as e:
-            print(f"⚠️ Playwright 获取凭据失败: {e}")
-            traceback.print_exc()
-            print("切换到手动输入模式")
-    else:
-        if sys.platform.startswith('win'):
-            print("📝 Windows 系统默认使用手动输入 SESSDATA（从浏览器开发者工具中获取）")
-        else:
-            print("📝 检测到无图形界面环境，使用手动输入 SESSDATA")
-    
-    # 无图形界面或 Playwright 失败，使用手动输入
-    print("📝 请手动输入 SESSDATA（从浏览器开发者工具中获取）")
-    print("💡 获取方法：")
-    print("   1. 在浏览器中登录 Bilibili")
-    print("   2. 按 F12 打开开发者工具")
-    print("   3. 切换到 Application/Storage 标签")
-    print("   4. 在 Cookies 中找到 SESSDATA 的值")
-    print("   5. 复制该值并粘贴到下方")
-    print()
-    
-    while True:
-        sessdata = input("请输入 SESSDATA: ").strip()
-        print(f"[DEBUG] 用户输入的SESSDATA长度: {len(sessdata)}")
-        if len(sessdata) > 10:
-            # 保存到缓存文件
-            print("[DEBUG] 保存用户输入的SESSDATA到缓存文件")
-            with open(cache, 'w', encoding='utf-8') as f:
-                f.write(sessdata)
-            print("✅ SESSDATA 已保存")
-            return sessdata
-        else:
-            print("❌ SESSDATA 格式不正确，请重新输入")
-
-
-def generate_download_bat(bv_list: List[str], save_path: str, sessdata: str) -> str:
-    bat = 'download_videos.bat'
-    print(f"📝 生成下载脚本（共 {len(bv_list)} 个 BV）...")
-    print(f"[DEBUG] 下载脚本路径: {bat}")
-    print(f"[DEBUG] 保存路径: {save_path}")
-    print(f"[DEBUG] SESSDATA: {sessdata[:10]}...")
-    with open(bat, 'w', encoding='utf-8', newline='\r\n') as f:
-        f.write('@echo off\nchcp 65001 >nul\n')
-        for bv in bv_list:
-            exe = _resolve_venv_python().replace('\\', '/')  # 标准化路径分隔符
-            print(f"[DEBUG] 为BV号生成命令: {bv}")
-            f.write(f'"{exe}" -m yutto -c "{sessdata}" -d "{save_path}" {bv}\n')
-    return bat
-
-
-def get_save_path() -> str:
-    """获取视频保存路径"""
-    print("[DEBUG] 获取视频保存路径")
-    save_path = os.path.abspath("download")
-    print(f"[DEBUG] 创建保存目录: {save_path}")
-    os.makedirs(save_path, exist_ok=True)
-    return save_path
-
-
-def extract_bv(text: str) -> List[str]:
-    """从文本中提取所有BV号"""
-    print(f"[DEBUG] 从文本中提取BV号: {text[:50]}...")
-    # BV号的正则表达式
-    bv_pattern = r'BV[0-9A-Za-z]{10}'
-    bv_list = re.findall(bv_pattern, text)
-    print(f"[DEBUG] 提取到 {len(bv_list)} 个BV号: {bv_list}")
-    # 去重但保持顺序
-    seen = set()
-    unique_bv_list = []
-    for bv in bv_list:
-        if bv not in seen:
-            seen.add(bv)
-            unique_bv_list.append(bv)
-    print(f"[DEBUG] 去重后 {len(unique_bv_list)} 个BV号: {unique_bv_list}")
-    return unique_bv_list
-
-
-def generate_download_sh(bv_list: List[str], save_path: str, sessdata: str) -> str:
-    project_root = _project_root()
-    sh = os.path.join(project_root, 'download_videos.sh')
-    print(f"📝 生成下载脚本（共 {len(bv_list)} 个 BV）...")
-    lines = [
-        '#!/usr/bin/env bash',
-        'set -euo pipefail'
-    ]
-    py = shlex.quote(_resolve_venv_python())
-    save_q = shlex.quote(save_path)
-    sess_q = shlex.quote(sessdata)
-    for bv in bv_list:
-        bv_q = shlex.quote(bv)
-        lines.append(f"{py} -m yutto -c {sess_q} -d {save_q} {bv_q}")
-    with open(sh, 'w', encoding='utf-8', newline='\n') as f:
-        f.write('\n'.join(lines) + '\n')
-    try:
-        os.chmod(sh, os.stat(sh).st_mode | 0o111)
-    except Exception:
-        pass
-    return sh
-
-
-def _run_yutto_batch(bv_list: List[str], save_path: str, sessdata: str) -> None:
-    """使用项目虚拟环境中的 Python 逐个调用 yutto 下载。"""
-    py = _resolve_venv_python()
-    for bv in bv_list:
-        print(f"⏬ 开始下载 {bv} ...")
-        cmd = [py, '-m', 'yutto']
-        if sessdata:
-            cmd += ['-c', sessdata]
-        cmd += ['-d', save_path, bv]
-        subprocess.run(cmd, shell=False, check=False)
-
-
-def run_download() -> Tuple[str, float, float]:
-    print("[DEBUG] 开始执行下载任务")
-    save_path = get_save_path()
-    sessdata = get_sessdata()
-    print("📋 请输入包含 BV 号的文本，使用 Ctrl+Z 与回车结束输入：")
-    input_lines: List[str] = []
-    while True:
-        try:
-            input_lines.append(input())
-        except EOFError:
-            break
-    bv_list = extract_bv('\n'.join(input_lines))
-    if not bv_list:
-        sys.exit("❌ 未识别任何 BV")
-    # 生成并执行下载脚本
-    if sys.platform.startswith('win'):
-        script = generate_download_bat(bv_list, save_path, sessdata)
-        print("⚠  接下来的过程可能出错，如果出错了请手动执行一次文件夹下的 download_videos.bat！")
-        print("▶️ 正在启动下载脚本（新窗口），请等待其完成...")
-    else:
-        script = generate_download_sh(bv_list, save_path, sessdata)
-        print("⚠  接下来的过程可能出错，如果出错了请手动执行一次文件夹下的 download_videos.sh！")
-        print(f"▶️ 正在执行下载脚本：{script}，请等待其完成...")
-
-    # 记录下载前的文件状态
-    before_files = set(os.listdir(save_path)) if os.path.exists(save_path) else set()
-
-    start_time = time.time()
-    if sys.platform.startswith('win'):
-        subprocess.run(f'start "" /wait cmd /c "{script}"', shell=True)
-    else:
-        subprocess.run(['bash', script], shell=False, cwd=os.path.dirname(script))
-    end_time = time.time()
-    print("✅ 下载完成，继续后续操作...")
-
-    after_files = set(os.listdir(save_path)) if os.path.exists(save_path) else set()
-    new_files = after_files - before_files
-    new_video_files = [
-        os.path.join(save_path, f) for f in new_files
-        if f.lower().endswith(('.mp4', '.mkv', '.avi'))
-    ]
-    # 保持加入顺序（目录枚举差异可能导致顺序不稳定，优先用输入顺序）
-
-    # 保存新增文件列表供后续使用
-    # 记录顺序给合并模块使用
-    try:
-        from utils import set_last_download_files
-        set_last_download_files(new_video_files)
-    except Exception:
-        pass
-    return save_path, start_time, end_time
-
-
-def run_download_videos_only() -> None:
-    save_path = os.path.abspath("download")
-    os.makedirs(save_path, exist_ok=True)
-    print("请粘贴所有 BV 号（每行一个），输入完后按 Ctrl+Z（Win）或 Ctrl+D（Mac/Linux）结束：")
-    before_files = set(os.listdir(save_path))
-    start_time = time.time()
-
-    # 读取或获取 SESSDATA
-    sessdata: str = ""  # 明确指定类型
-    cache = "SESSDATA.txt"
-    if os.path.exists(cache):
-        try:
-            sessdata = open(cache, 'r', encoding='utf-8').read().strip()
-        except Exception:
-            sessdata = ""
-    if not sessdata:
-        try:
-            sessdata = get_sessdata()
-        except Exception:
-            sessdata = ""
-
-    try:
-        bv_list: List[str] = []
-        while True:
-            line = input()
-            if not line:
-                continue
-            bv = line.strip()
-            if bv.startswith("BV") and len(bv) == 12:
-                bv_list.append(bv)
-    except EOFError:
-        pass
-
-    if not bv_list:
-        print("❌ 未识别任何 BV")
-        return
-
-    _run_yutto_batch(bv_list, save_path, sessdata)
-
-    end_time = time.time()
-    print("✅ 下载流程结束。")
-
-    after_files = set(os.listdir(save_path))
-    new_files = [
-        os.path.join(save_path, f) for f in (after_files - before_files)
-        if f.lower().endswith(('.mp4', '.mkv', '.avi'))
-    ]
-    new_files = [
-        f for f in new_files
-        if os.path.getmtime(f) >= start_time - 2
-    ]
-    if not new_files:
-        print("⚠️ 未检测到新增视频文件。")
-    else:
-        print("📝 本次下载新增视频文件：")
-        for f in new_files:
-            print("   •", os.path.basename(f))
-
-    try:
-        from utils import set_last_download_files
-        set_last_download_files(new_files)
-    except Exception:
-        pass
+import os
+import sys
+import time
+import json
+import random
+import re
+import shutil
+import subprocess
+import traceback
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from log import get_logger
+
+logger = get_logger('download')
+
+
+def _project_root() -> str:
+    root = os.path.dirname(os.path.abspath(__file__))
+    logger.debug("项目根目录: %s", root)
+    return root
+
+
+def _resolve_venv_python() -> str:
+    """解析虚拟环境中 Python 解释器的路径，提供健壮的路径验证和回退机制"""
+    root = _project_root()
+    logger.debug("开始解析虚拟环境Python路径")
+    
+    # 构建候选路径
+    if sys.platform.startswith('win'):
+        candidate = os.path.join(root, '.venv', 'Scripts', 'python.exe')
+    else:
+        candidate = os.path.join(root, '.venv', 'bin', 'python')
+    
+    logger.debug("候选虚拟环境Python路径: %s", candidate)
+    
+    # 验证候选路径的有效性
+    if os.path.exists(candidate) and os.path.isfile(candidate):
+        try:
+            # 检查文件可执行性
+            if os.access(candidate, os.X_OK):
+                logger.debug("找到可执行的虚拟环境Python: %s", candidate)
+                return candidate
+            else:
+                print(f"⚠️ 警告：发现 Python 路径但不可执行 - {candidate}")
+        except Exception as e:
+            print(f"⚠️ 警告：验证 Python 路径时发生错误 - {e}")
+            traceback.print_exc()
+    
+    # 回退到当前解释器，并提供路径信息用于调试
+    print(f"⚠️ 未找到虚拟环境 Python，回退到主环境解释器：{sys.executable}")
+    print(f"    项目根目录：{root}")
+    print(f"    尝试的虚拟环境路径：{candidate}")
+    
+    return sys.executable
+
+
+def get_sessdata() -> str:
+    print("🔐 获取账号凭据（登录 Bilibili）")
+    cache = "SESSDATA.txt"
+    logger.debug("检查缓存文件: %s", cache)
+    if os.path.exists(cache):
+        logger.debug("发现缓存文件，尝试读取")
+        try:
+            sess = open(cache, 'r', encoding='utf-8').read().strip()
+            logger.debug("缓存文件内容长度: %s", len(sess))
+            if len(sess) > 10 and input("使用缓存凭据？(Y/n): ").lower() in ("", "y"):
+                logger.debug("使用缓存凭据")
+                return sess
+        except Exception as e:
+            logger.debug("读取缓存文件失败: %s", e)
+            traceback.print_exc()
+
+    # 检查是否有图形界面环境
+    has_display = os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')
+    logger.debug("图形界面环境检测结果: DISPLAY=%s, WAYLAND_DISPLAY=%s, has_display=%s", os.environ.get('DISPLAY'), os.environ.get('WAYLAND_DISPLAY'), has_display)
+    
+    # 只在有图形界面的非Windows系统上尝试使用Playwright
+    if has_display and not sys.platform.startswith('win'):
+        logger.debug("检测到有图形界面的非Windows环境，尝试使用Playwright")
+        # 有图形界面，使用 Playwright 自动获取
+        try:
+            # 延迟导入，确保依赖已安装且当前解释器已切换到虚拟环境
+            logger.debug("尝试导入Playwright")
+            from playwright.sync_api import sync_playwright
+            logger.debug("Playwright导入成功")
+
+            with sync_playwright() as p:
+                logger.debug("启动Chromium浏览器")
+                browser = p.chromium.launch(headless=False)
+                context = browser.new_context()
+                page = context.new_page()
+                logger.debug("访问Bilibili主页")
+                page.goto("https://www.bilibili.com", wait_until="networkidle")
+                sessdata = None
+                logger.debug("开始监听SESSDATA Cookie")
+                for _ in range(60):
+                    cookies = context.cookies()
+                    for c in cookies:
+                        # 使用 get 方法安全访问可能不存在的键
+                        if c.get('name') == 'SESSDATA':
+                            sessdata = c.get('value')
+                            logger.debug("获取到SESSDATA: %s...", sessdata[:10] if sessdata else '')
+                            break
+                    if sessdata:
+                        break
+                    time.sleep(2)
+                browser.close()
+                if not sessdata:
+                    print("❌ 未能获取登录凭据，切换到手动输入模式")
+                else:
+                    logger.debug("保存SESSDATA到缓存文件")
+                    with open(cache, 'w', encoding='utf-8') as f:
+                        f.write(sessdata)
+                    print("✅ 成功获取登录凭据")
+                    return sessdata
+        except ImportError as e:
+            print(f"⚠️ Playwright 未安装，切换到手动输入模式: {e}")
+            traceback.print_exc()
+        except Exception as e:
+            print(f"⚠️ Playwright 获取凭据失败: {e}")
+            traceback.print_exc()
+            print("切换到手动输入模式")
+    else:
+        if sys.platform.startswith('win'):
+            print("📝 Windows 系统默认使用手动输入 SESSDATA（从浏览器开发者工具中获取）")
+        else:
+            print("📝 检测到无图形界面环境，使用手动输入 SESSDATA")
+    
+    # 无图形界面或 Playwright 失败，使用手动输入
+    print("📝 请手动输入 SESSDATA（从浏览器开发者工具中获取）")
+    print("💡 获取方法：")
+    print("   1. 在浏览器中登录 Bilibili")
+    print("   2. 按 F12 打开开发者工具")
+    print("   3. 切换到 Application/Storage 标签")
+    print("   4. 在 Cookies 中找到 SESSDATA 的值")
+    print("   5. 复制该值并粘贴到下方")
+    print()
+    
+    while True:
+        sessdata = input("请输入 SESSDATA: ").strip()
+        logger.debug("用户输入的SESSDATA长度: %s", len(sessdata))
+        if len(sessdata) > 10:
+            # 保存到缓存文件
+            logger.debug("保存用户输入的SESSDATA到缓存文件")
+            with open(cache, 'w', encoding='utf-8') as f:
+                f.write(sessdata)
+            print("✅ SESSDATA 已保存")
+            return sessdata
+        else:
+            print("❌ SESSDATA 格式不正确，请重新输入")
+
+
+def load_sessdata() -> str:
+    """无交互地读取凭据：优先环境变量 BILI_SESSDATA，其次 SESSDATA.txt 缓存；都没有时返回空字符串"""
+    sess = os.environ.get('BILI_SESSDATA', '').strip()
+    if sess:
+        return sess
+    cache = "SESSDATA.txt"
+    if os.path.exists(cache):
+        try:
+            return open(cache, 'r', encoding='utf-8').read().strip()
+        except Exception as e:
+            logger.debug("读取缓存文件失败: %s", e)
+    return ""
+
+
+def get_save_path(audio_only: bool = False) -> str:
+    """获取视频保存路径；仅音频模式使用独立的 download/audio 目录（有自己的下载清单）"""
+    logger.debug("获取视频保存路径")
+    save_path = os.path.abspath(os.path.join("download", AUDIO_SUBDIR) if audio_only else "download")
+    logger.debug("创建保存目录: %s", save_path)
+    os.makedirs(save_path, exist_ok=True)
+    return save_path
+
+
+def extract_bv(text: str) -> List[str]:
+    """从文本中提取所有BV号"""
+    logger.debug("从文本中提取BV号: %s...", text[:50])
+    # BV号的正则表达式
+    bv_pattern = r'BV[0-9A-Za-z]{10}'
+    bv_list = re.findall(bv_pattern, text)
+    logger.debug("提取到 %s 个BV号: %s", len(bv_list), bv_list)
+    # 去重但保持顺序
+    seen = set()
+    unique_bv_list = []
+    for bv in bv_list:
+        if bv not in seen:
+            seen.add(bv)
+            unique_bv_list.append(bv)
+    logger.debug("去重后 %s 个BV号: %s", len(unique_bv_list), unique_bv_list)
+    return unique_bv_list
+
+
+@dataclass
+class DownloadResult:
+    """单个 BV 的下载结果"""
+    bv: str
+    index: int
+    returncode: int | None = None
+    files: List[str] = field(default_factory=list)
+    bytes: int = 0
+    elapsed: float = 0.0
+    log_path: str = ''
+    skipped: bool = False
+    attempts: int = 0
+    # 失败原因（日志中匹配到的错误行）；permanent=True 表示不可重试的错误（稿件不存在、地区限制等）
+    error: str = ''
+    permanent: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and bool(self.files)
+
+    @property
+    def throughput(self) -> float:
+        """平均下载速度（字节/秒）；跳过的 BV 为 0"""
+        return self.bytes / self.elapsed if self.elapsed > 0 and not self.skipped else 0.0
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi')
+AUDIO_EXTENSIONS = ('.m4a', '.aac', '.mp3', '.flac', '.opus', '.ogg', '.wav')
+AUDIO_SUBDIR = 'audio'
+# 仅音频模式：只下载音频流，不要弹幕与字幕
+YUTTO_AUDIO_ONLY_ARGS = ['--audio-only', '--no-danmaku', '--no-subtitle']
+
+
+def get_download_workers(requested: int | None = None) -> int:
+    """下载并发数：优先使用参数，其次环境变量 BILI_DOWNLOAD_WORKERS，默认 3"""
+    if requested is None:
+        env_value = os.environ.get('BILI_DOWNLOAD_WORKERS', '').strip()
+        requested = int(env_value) if env_value.isdigit() else 3
+    return max(1, requested)
+
+
+# 只有 yutto 的错误级日志行（" ERROR  ..."、"[ERROR] ..."）、Python 异常行（"XxxError: ..."）
+# 以及 B 站接口错误响应（同一行带非 0 的 code 与 message，如 {"code": -404, "message": "啥都木有"}）参与分类；
+# 标题、进度、文件信息等普通输出一律忽略，code 0 表示成功，不算错误码
+ERROR_LINE_PATTERN = re.compile(
+    r'^\s*(?:\[?\s*(?:ERROR|CRITICAL|FATAL)\s*\]?(?:\s|:)|[\w.]*(?:Error|Exception)\s*:)', re.IGNORECASE
+)
+API_CODE_PATTERN = re.compile(r'\bcode["\']?\s*[:=]\s*(-?\d+)', re.IGNORECASE)
+API_MESSAGE_PATTERN = re.compile(r'\b(?:message|msg)["\']?\s*[:=]', re.IGNORECASE)
+ANSI_ESCAPE_PATTERN = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+# 接口错误码：稿件不存在/不可见/审核中、地区限制、充电专属；风控拦截 -412 与 HTTP 412/429
+PERMANENT_API_CODES = {-404, 62002, 62004, -10403, 87008}
+THROTTLE_API_CODES = {-412, 412, 429}
+# 错误行中表示不可重试错误的提示语
+PERMANENT_ERROR_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'啥都木有', r'稿件不可见', r'审核中', r'视频已失效', r'(?:所在)?地区(?:不可观看|限制)',
+        r'大会员专享', r'充电专属', r'\bnot\s+found\b', r'invalid\s+url', r'url\s*(?:不正确|无效)', r'不支持的\s*url',
+    )
+]
+# 错误行中的 HTTP 412/429（必须带状态码上下文，避免匹配到大小、编号等数字）
+THROTTLE_ERROR_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'\b(?:HTTP|status(?:\s*code)?)\D{0,3}(?:412|429)\b', r'\b(?:412|429)\s+(?:Precondition\s+Failed|Too\s+Many\s+Requests)',
+    )
+]
+# 其他可重试错误（5xx、网络异常）；都不匹配的未知错误同样按可重试处理
+TRANSIENT_ERROR_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'\b(?:HTTP|status(?:\s*code)?)\D{0,3}50[0234]\b', r'timed?\s*out', r'超时', r'connection', r'reset', r'EOF',
+    )
+]
+LOG_TAIL_BYTES = 64 * 1024
+DOWNLOAD_REPORT_NAME = 'download_report.json'
+
+
+def get_download_retries() -> int:
+    """单个 BV 失败后的最大重试次数（环境变量 BILI_DOWNLOAD_RETRIES，默认 3）"""
+    value = os.environ.get('BILI_DOWNLOAD_RETRIES', '').strip()
+    return int(value) if value.isdigit() else 3
+
+
+def retry_delay(attempt: int, base: float | None = None, cap: float = 60.0) -> float:
+    """第 attempt 次重试前的等待秒数：指数退避 + 全抖动（0 ~ base·2^(attempt-1)，不超过 cap）"""
+    if base is None:
+        try:
+            base = float(os.environ.get('BILI_RETRY_BASE_SECONDS', '') or 2.0)
+        except ValueError:
+            base = 2.0
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _error_kind(line: str) -> str | None:
+    """错误行的类型：'throttle'、'permanent'、'transient'；不是错误行时返回 None"""
+    codes = {int(c) for c in API_CODE_PATTERN.findall(line)} - {0}
+    if not ERROR_LINE_PATTERN.match(line) and not (codes and API_MESSAGE_PATTERN.search(line)):
+        return None
+    if codes & THROTTLE_API_CODES or any(p.search(line) for p in THROTTLE_ERROR_PATTERNS):
+        return 'throttle'
+    if codes & PERMANENT_API_CODES or any(p.search(line) for p in PERMANENT_ERROR_PATTERNS):
+        return 'permanent'
+    return 'transient'
+
+
+def classify_failure(log_path: str, offset: int = 0) -> Tuple[bool, str]:
+    """
+    根据本次尝试的日志（从 offset 开始的末尾部分）判断失败类型，返回 (是否不可重试, 错误行)。
+    只看错误行（见 ERROR_LINE_PATTERN）：任一行为风控/限流时可重试，否则任一行为不可重试错误时放弃；
+    其余情况（含没有错误行）按可重试处理。
+    """
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(offset, f.tell() - LOG_TAIL_BYTES))
+            text = f.read().decode('utf-8', errors='ignore')
+    except OSError:
+        return False, ''
+    lines = [ANSI_ESCAPE_PATTERN.sub('', line).strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    errors = [(kind, line) for line in lines for kind in (_error_kind(line),) if kind]
+    for wanted, permanent in (('throttle', False), ('permanent', True)):
+        for kind, line in reversed(errors):
+            if kind == wanted:
+                return permanent, line[-300:]
+    if errors:
+        return False, errors[-1][1][-300:]
+    return False, lines[-1][-300:] if lines else ''
+
+
+def is_throttled(error: str) -> bool:
+    """错误行是否为风控 412 / 限流 429（并发控制器据此减半并发）"""
+    return bool(error) and _error_kind(error) == 'throttle'
+
+
+def get_yutto_backend() -> str:
+    """
+    yutto 调用方式（环境变量 BILI_YUTTO_BACKEND）：
+    'worker'（默认）为常驻工作进程，解释器与 yutto 只加载一次；'process' 为每个 BV 启动一次 python -m yutto。
+    """
+    backend = os.environ.get('BILI_YUTTO_BACKEND', 'worker').strip().lower()
+    return backend if backend in ('worker', 'process') else 'worker'
+
+
+def _collect_staged_files(staging_dir: str, save_path: str) -> List[str]:
+    """把暂存目录中的文件移到保存目录（保持相对路径），返回移动后的路径"""
+    from utils import move_file
+    moved: List[str] = []
+    for dirpath, _, names in os.walk(staging_dir):
+        rel = os.path.relpath(dirpath, staging_dir)
+        target_dir = save_path if rel == '.' else os.path.join(save_path, rel)
+        os.makedirs(target_dir, exist_ok=True)
+        for name in sorted(names):
+            if name == 'yutto.log':
+                continue
+            src = os.path.join(dirpath, name)
+            target = os.path.join(target_dir, name)
+            if not os.path.exists(target):
+                shutil.move(src, target)
+            else:
+                target = move_file(src, target_dir, os.path.splitext(name)[0])
+            if target:
+                moved.append(target)
+    return moved
+
+
+def _run_yutto_process(args: List[str], log_path: str, on_start=None) -> int:
+    """
+    每次启动一个 python -m yutto 进程，输出追加到 log_path；
+    on_start 收到终止该进程的回调与暂停/恢复它的回调（平台不支持暂停时为 None）
+    """
+    from concurrency import CAN_PAUSE, pause_process
+    cmd = [_resolve_venv_python(), '-m', 'yutto'] + args
+    with open(log_path, 'ab') as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        if on_start is not None:
+            on_start(proc.kill, (lambda paused: pause_process(proc, paused)) if CAN_PAUSE else None)
+        return proc.wait()
+
+
+def _download_one(index: int, bv: str, save_path: str, sessdata: str, audio_only: bool = False,
+                  workers=None, limiter=None) -> DownloadResult:
+    """
+    在独立的暂存目录中调用 yutto 下载一个 BV，便于准确归属该 BV 产生的文件。
+    提供 workers（yutto_worker.YuttoWorkerPool）时在常驻工作进程中执行，否则单独启动进程。
+    失败时按日志判断类型：可重试错误以指数退避重试（至多 get_download_retries() 次），不可重试错误立即放弃；
+    重试在同一暂存目录中进行，yutto 可续传已下载的部分。
+    提供 limiter（concurrency.AdaptiveLimiter）时每次尝试占用一个并发槽，退避等待期间不占用；
+    传输停滞时 limiter 终止本次尝试，按可重试失败处理；超过总带宽上限时 limiter 暂停本次尝试，回落后恢复。
+    """
+    from yutto_worker import WorkerUnavailable
+    result = DownloadResult(bv=bv, index=index)
+    staging_dir = os.path.join(save_path, '.staging', bv)
+    os.makedirs(staging_dir, exist_ok=True)
+    result.log_path = os.path.join(staging_dir, 'yutto.log')
+    args: List[str] = []
+    if sessdata:
+        args += ['-c', sessdata]
+    if audio_only:
+        args += YUTTO_AUDIO_ONLY_ARGS
+    args += ['-d', staging_dir, bv]
+    print(f"⏬ 开始下载 {bv} ...")
+    start = time.time()
+    # 清空上次运行残留的日志，各次尝试依次追加
+    open(result.log_path, 'wb').close()
+    max_attempts = get_download_retries() + 1
+    # 等待并发槽的时间不计入该 BV 的耗时（否则吞吐统计偏低）
+    queued = 0.0
+
+    def _on_start(kill, pause):
+        def cancel():
+            # 写成错误级日志行，失败分类据此给出原因（可重试）
+            with open(result.log_path, 'a', encoding='utf-8') as log:
+                log.write(f"\n[ERROR] 传输停滞超过 {limiter.stall_seconds:g} 秒，已终止本次尝试\n")
+            kill()
+        limiter.set_cancel(bv, cancel, pause)
+
+    on_start = _on_start if limiter is not None else None
+    while True:
+        result.attempts += 1
+        with open(result.log_path, 'ab') as log:
+            log.write(f"\n===== 第 {result.attempts} 次尝试 =====\n".encode('utf-8'))
+            offset = log.tell()
+        result.returncode = None
+        if limiter is not None:
+            wait_start = time.time()
+            limiter.acquire(bv, staging_dir)
+            queued += time.time() - wait_start
+        try:
+            if workers is not None:
+                try:
+                    result.returncode = workers.run(args, result.log_path, on_start)
+                except WorkerUnavailable:
+                    pass
+            if result.returncode is None:
+                result.returncode = _run_yutto_process(args, result.log_path, on_start)
+        finally:
+            if result.returncode == 0:
+                result.error, result.permanent = '', False
+            else:
+                result.permanent, result.error = classify_failure(result.log_path, offset)
+            if limiter is not None:
+                limiter.release(bv, ok=result.returncode == 0, throttled=is_throttled(result.error))
+        if result.returncode == 0:
+            break
+        if result.permanent or result.attempts >= max_attempts:
+            break
+        delay = retry_delay(result.attempts)
+        logger.debug("%s 第 %s 次失败: %s", bv, result.attempts, result.error)
+        print(f"🔁 {bv} 下载失败（{result.error or f'返回码 {result.returncode}'}），{delay:.1f} 秒后重试"
+              f"（{result.attempts}/{max_attempts - 1}）")
+        time.sleep(delay)
+    result.elapsed = time.time() - start - queued
+    if result.returncode == 0:
+        moved = _collect_staged_files(staging_dir, save_path)
+        result.files = [f for f in moved if f.lower().endswith(AUDIO_EXTENSIONS if audio_only else VIDEO_EXTENSIONS)]
+        result.bytes = sum(os.path.getsize(f) for f in moved if os.path.exists(f))
+        if not result.files:
+            result.error = result.error or "yutto 未产生任何媒体文件"
+    # 失败时不移动任何文件：不完整的分段留在暂存目录，下次运行时 yutto 可续传
+    if result.ok:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return result
+
+
+def download_bvs(bv_list: List[str], save_path: str, sessdata: str, max_workers: int | None = None, on_result=None, skip_existing: bool = True, audio_only: bool = False) -> List[DownloadResult]:
+    """
+    并发下载多个 BV，逐个记录进程返回码、文件、字节数与耗时；结果按输入顺序返回。
+    on_result(DownloadResult) 在每个 BV 完成时立即回调（用于边下载边处理）。
+    下载清单中已有且文件仍存在的 BV 直接复用（skip_existing=False 时强制重新下载）。
+    audio_only=True 时只下载音频流（save_path 应为独立目录，见 get_save_path）。
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from library import DownloadLibrary
+
+    library = DownloadLibrary(save_path)
+    library.new_batch(bv_list)
+    results: List[DownloadResult | None] = [None] * len(bv_list)
+    pending: List[int] = []
+    for i, bv in enumerate(bv_list):
+        existing = library.files_for(bv) if skip_existing else None
+        if existing:
+            res = DownloadResult(bv=bv, index=i, returncode=0, files=existing, skipped=True,
+                                 bytes=sum(os.path.getsize(f) for f in existing))
+            results[i] = res
+            print(f"♻️ {bv} 已下载，跳过")
+            if on_result is not None:
+                on_result(res)
+        else:
+            pending.append(i)
+
+    def _finish(res: DownloadResult) -> None:
+        if not res.ok:
+            return
+        from probe import probe_many
+        infos = probe_many(res.files)
+        duration = sum(info.duration for info in infos.values() if info is not None)
+        library.record(res.bv, res.files, duration)
+
+    from concurrency import download_limiter
+    workers = min(get_download_workers(max_workers), max(1, len(pending)))
+    # 自适应并发：从 workers 起步，按吞吐与限流信号在 [1, 上限] 间调整；线程数按上限分配。
+    # 显式指定 max_workers（--workers）时它就是硬上限，只会因限流/停滞向下调整
+    limiter = download_limiter(workers, workers if max_workers else None) if len(pending) > 1 else None
+    threads = min(limiter.maximum, len(pending)) if limiter is not None else workers
+    print(f"⏬ 并发下载 {len(pending)} 个 BV（并发数 {workers}{f'，自适应上限 {threads}' if limiter else ''}）...")
+    yutto_workers = None
+    if pending and get_yutto_backend() == 'worker':
+        from yutto_worker import YuttoWorkerPool
+        yutto_workers = YuttoWorkerPool(threads, _resolve_venv_python())
+    if limiter is not None:
+        limiter.start()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {
+            pool.submit(_download_one, i, bv_list[i], save_path, sessdata, audio_only, yutto_workers, limiter): i
+            for i in pending
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                res = future.result()
+            except Exception as e:
+                print(f"❌ {bv_list[i]} 下载异常: {e}")
+                traceback.print_exc()
+                res = DownloadResult(bv=bv_list[i], index=i)
+            results[i] = res
+            _finish(res)
+            if res.ok:
+                print(f"✅ {res.bv} 完成：{len(res.files)} 个{'音频' if audio_only else '视频'}，{res.bytes / 1024 / 1024:.1f} MB，{res.elapsed:.1f} 秒")
+            else:
+                kind = '不可重试' if res.permanent else f'已尝试 {res.attempts} 次'
+                print(f"❌ {res.bv} 失败（{kind}，返回码 {res.returncode}）：{res.error}，日志：{res.log_path}")
+            if on_result is not None:
+                try:
+                    on_result(res)
+                except Exception as e:
+                    print(f"⚠️ 处理 {res.bv} 的下载结果时出错: {e}")
+                    traceback.print_exc()
+    if limiter is not None:
+        limiter.stop()
+    if yutto_workers is not None:
+        yutto_workers.close()
+    library.close()
+    ordered = [r for r in results if r is not None]
+    write_download_report(ordered, os.path.join(save_path, DOWNLOAD_REPORT_NAME))
+    return ordered
+
+
+def download_status(result: DownloadResult) -> str:
+    if result.skipped:
+        return 'skipped'
+    if result.ok:
+        return 'ok'
+    return 'failed_permanent' if result.permanent else 'failed'
+
+
+def write_download_report(results: List[DownloadResult], path: str) -> None:
+    """写出机器可读的下载报告（每个 BV 的状态、尝试次数、错误与日志路径），供批处理或重新下载失败项使用"""
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r.ok),
+        'failed': [r.bv for r in results if not r.ok],
+        'items': [
+            {
+                'bv': r.bv, 'index': r.index, 'status': download_status(r), 'attempts': r.attempts,
+                'returncode': r.returncode, 'error': r.error, 'files': r.files, 'bytes': r.bytes,
+                'elapsed': round(r.elapsed, 3), 'throughput': round(r.throughput),
+                'log': r.log_path if not r.ok else '',
+            }
+            for r in results
+        ],
+    }
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        logger.debug("下载报告: %s", path)
+    except OSError as e:
+        print(f"⚠️ 写入下载报告失败: {e}")
+
+
+def print_download_summary(results: List[DownloadResult], elapsed: float | None = None) -> None:
+    """elapsed 为整批下载的墙钟时间，提供时额外输出总吞吐"""
+    ok = [r for r in results if r.ok]
+    total_bytes = sum(r.bytes for r in results)
+    summary = f"\n📋 下载汇总：成功 {len(ok)}/{len(results)}，共 {total_bytes / 1024 / 1024:.1f} MB"
+    if elapsed:
+        downloaded = sum(r.bytes for r in results if not r.skipped)
+        summary += f"，用时 {elapsed:.1f} 秒，平均 {downloaded / elapsed / 1024 / 1024:.2f} MB/s"
+    print(summary)
+    for r in results:
+        status = '♻️' if r.skipped else '✅' if r.ok else '❌'
+        line = f"   {status} {r.bv}  返回码={r.returncode}  {r.bytes / 1024 / 1024:.1f} MB  {r.elapsed:.1f}s"
+        if r.throughput:
+            line += f"  {r.throughput / 1024 / 1024:.2f} MB/s"
+        if r.attempts > 1:
+            line += f"  尝试 {r.attempts} 次"
+        if not r.ok and r.error:
+            line += f"  {r.error}"
+        print(line)
+    if len(ok) < len(results):
+        print(f"📝 失败明细见下载目录中的 {DOWNLOAD_REPORT_NAME}")
+
+
+def read_bv_list() -> List[str]:
+    """从标准输入读取包含 BV 号的文本（直到 EOF），返回去重后按出现顺序的 BV 列表"""
+    print("📋 请输入包含 BV 号的文本，使用 Ctrl+Z 与回车结束输入：")
+    input_lines: List[str] = []
+    while True:
+        try:
+            input_lines.append(input())
+        except EOFError:
+            break
+    return extract_bv('\n'.join(input_lines))
+
+
+def run_download() -> Tuple[str, float, float]:
+    logger.debug("开始执行下载任务")
+    save_path = get_save_path()
+    sessdata = get_sessdata()
+    bv_list = read_bv_list()
+    if not bv_list:
+        sys.exit("❌ 未识别任何 BV")
+    # 进程内并发调度 yutto，不再生成带明文 SESSDATA 的下载脚本
+    start_time = time.time()
+    results = download_bvs(bv_list, save_path, sessdata)
+    end_time = time.time()
+    print_download_summary(results, end_time - start_time)
+    print("✅ 下载完成，继续后续操作...")
+
+    # 下载结果已按 BV 输入顺序写入下载清单，供合并模块使用
+    return save_path, start_time, end_time
+
+
+def run_download_videos_only() -> None:
+    save_path = os.path.abspath("download")
+    os.makedirs(save_path, exist_ok=True)
+    print("请粘贴所有 BV 号（每行一个），输入完后按 Ctrl+Z（Win）或 Ctrl+D（Mac/Linux）结束：")
+
+    # 读取或获取 SESSDATA
+    sessdata: str = ""  # 明确指定类型
+    cache = "SESSDATA.txt"
+    if os.path.exists(cache):
+        try:
+            sessdata = open(cache, 'r', encoding='utf-8').read().strip()
+        except Exception:
+            sessdata = ""
+    if not sessdata:
+        try:
+            sessdata = get_sessdata()
+        except Exception:
+            sessdata = ""
+
+    try:
+        bv_list: List[str] = []
+        while True:
+            line = input()
+            if not line:
+                continue
+            bv = line.strip()
+            if bv.startswith("BV") and len(bv) == 12:
+                bv_list.append(bv)
+    except EOFError:
+        pass
+
+    if not bv_list:
+        print("❌ 未识别任何 BV")
+        return
+
+    results = download_bvs(bv_list, save_path, sessdata)
+    print_download_summary(results)
+    print("✅ 下载流程结束。")
+
+    new_files = [f for r in results for f in r.files]
+    if not new_files:
+        print("⚠️ 未检测到新增视频文件。")
+    else:
+        print("📝 本次下载新增视频文件：")
+        for f in new_files:
+            print("   •", os.path.basename(f))
@@ -0,0 +1,210 @@
+"""
+编码器能力探测：对每个候选编码器做一次极短的试编码（与片段转码相同的参数），
+只有真正能打开设备并输出的编码器才算可用。
+
+结果缓存在 get_cache_dir()/encoders.json，以 ffmpeg 可执行文件（真实路径 + 大小 + 修改时间）与版本号为键，
+ffmpeg 未变化时直接返回缓存；超过 ENCODER_CACHE_TTL 或设置 BILI_ENCODER_RECHECK=1 时重新探测
+（用于驱动/显卡变化后）。
+"""
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from log import get_logger
+from utils import get_cache_dir, get_ffmpeg_path
+
+logger = get_logger('encoders')
+
+# 自动选择时的优先级：先硬件 HEVC，再 CPU HEVC，再 H.264
+ENCODER_PRIORITY = [
+    'hevc_nvenc', 'hevc_amf', 'hevc_qsv', 'hevc_vaapi', 'hevc_videotoolbox', 'libx265',
+    'h264_nvenc', 'h264_amf', 'h264_qsv', 'h264_vaapi', 'h264_videotoolbox', 'libx264',
+]
+CPU_ENCODERS = {'libx264': 'CPU H.264', 'libx265': 'CPU H.265'}
+ENCODER_CACHE_TTL = 7 * 24 * 3600
+TRIAL_TIMEOUT_SECONDS = 20
+
+_LOCK = threading.Lock()
+_MEMO: Dict[str, List[Tuple[str, str]]] = {}
+
+
+def encoder_candidates() -> Dict[str, str]:
+    """当前平台可能存在的编码器：名称 -> 描述（CPU 编码器始终在列）"""
+    system = platform.system().lower()
+    if 'windows' in system:
+        candidates = {
+            'h264_nvenc': 'NVIDIA H.264 (NVENC)',
+            'hevc_nvenc': 'NVIDIA H.265 (NVENC)',
+            'h264_amf': 'AMD H.264 (AMF)',
+            'hevc_amf': 'AMD H.265 (AMF)',
+            'h264_qsv': 'Intel H.264 (QSV)',
+            'hevc_qsv': 'Intel H.265 (QSV)',
+        }
+    elif 'linux' in system:
+        candidates = {
+            'h264_nvenc': 'NVIDIA H.264 (NVENC)',
+            'hevc_nvenc': 'NVIDIA H.265 (NVENC)',
+            'h264_amf': 'AMD H.264 (AMF)',
+            'hevc_amf': 'AMD H.265 (AMF)',
+            'h264_vaapi': 'VAAPI H.264',
+            'hevc_vaapi': 'VAAPI H.265',
+            'h264_qsv': 'Intel H.264 (QSV)',
+            'hevc_qsv': 'Intel H.265 (QSV)',
+        }
+    elif 'darwin' in system:
+        candidates = {
+            'h264_videotoolbox': 'Apple H.264 (VideoToolbox)',
+            'hevc_videotoolbox': 'Apple H.265 (VideoToolbox)',
+        }
+    else:
+        candidates = {}
+    candidates.update(CPU_ENCODERS)
+    return candidates
+
+
+def _ffmpeg_identity(ffmpeg: str) -> str | None:
+    """ffmpeg 的缓存键：真实路径、大小、修改时间与版本行"""
+    try:
+        real = os.path.realpath(ffmpeg)
+        st = os.stat(real)
+        result = subprocess.run([real, '-version'], capture_output=True, text=True, timeout=10)
+        version = result.stdout.splitlines()[0] if result.stdout else ''
+        return f"{real}|{st.st_size}|{st.st_mtime_ns}|{version}"
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug("无法识别 ffmpeg: %s, %s", ffmpeg, e)
+        return None
+
+
+def _compiled_encoders(ffmpeg: str) -> set:
+    """ffmpeg -encoders 中列出的编码器名称（按列精确匹配，而非子串）"""
+    result = subprocess.run([ffmpeg, '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=10)
+    names = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # 形如 " V....D libx264  libx264 H.264 / AVC ..."
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            names.add(parts[1])
+    return names
+
+
+def trial_encode_cmd(ffmpeg: str, encoder: str) -> List[str]:
+    """与片段转码相同的设备与输出参数，对 0.2 秒的合成画面试编码，输出丢弃"""
+    from merge import TRANSCODE_PARAMS, _hw_device_args, _segment_encode_args
+    cmd = [ffmpeg, '-hide_banner', '-nostats', '-loglevel', 'error']
+    cmd += _hw_device_args(encoder, for_decode=False)
+    cmd += [
+        '-f', 'lavfi', '-i', 'testsrc2=size=320x240:rate=30:duration=0.2',
+        '-f', 'lavfi', '-i', f"anullsrc=r={TRANSCODE_PARAMS['audio_rate']}:cl=stereo",
+        '-map', '0:v:0', '-map', '1:a:0', '-shortest',
+    ]
+    cmd += _segment_encode_args(encoder, [], '-')
+    return cmd
+
+
+def trial_encode(ffmpeg: str, encoder: str) -> Tuple[bool, str]:
+    """返回 (是否可用, 失败原因)"""
+    try:
+        result = subprocess.run(trial_encode_cmd(ffmpeg, encoder), stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, timeout=TRIAL_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        return False, "试编码超时"
+    except OSError as e:
+        return False, str(e)
+    if result.returncode != 0:
+        err = (result.stderr or b'').decode('utf-8', errors='ignore').strip()
+        return False, err.splitlines()[-1] if err else f"ffmpeg 返回码 {result.returncode}"
+    return True, ''
+
+
+def _cache_path() -> str:
+    return os.path.join(get_cache_dir(), 'encoders.json')
+
+
+def _load_cache() -> dict:
+    try:
+        with open(_cache_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(data: dict) -> None:
+    path = _cache_path()
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.debug("写入编码器缓存失败: %s", e)
+
+
+def verified_encoders(refresh: bool = False) -> List[Tuple[str, str]]:
+    """
+    返回经试编码验证可用的编码器 [(名称, 描述)]，按候选顺序排列。
+    同一 ffmpeg 只探测一次；没有任何编码器通过时退回 CPU 编码器列表。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    ffmpeg = get_ffmpeg_path() or 'ffmpeg'
+    identity = _ffmpeg_identity(ffmpeg)
+    if identity is None:
+        return list(CPU_ENCODERS.items())
+    refresh = refresh or os.environ.get('BILI_ENCODER_RECHECK') == '1'
+    candidates = encoder_candidates()
+
+    with _LOCK:
+        if not refresh and identity in _MEMO:
+            return list(_MEMO[identity])
+        cache = _load_cache()
+        entry = cache.get(identity)
+        if (not refresh and entry and time.time() - entry.get('checked_at', 0) < ENCODER_CACHE_TTL
+                and set(entry.get('tested', [])) >= set(candidates)):
+            available = [(enc, candidates.get(enc, enc)) for enc in entry.get('available', [])]
+            _MEMO[identity] = available
+            logger.debug("编码器缓存命中: %s", [enc for enc, _ in available])
+            return list(available)
+
+        print("🔍 正在验证可用的编码器（首次运行或 ffmpeg 已变化）...")
+        try:
+            compiled = _compiled_encoders(ffmpeg)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug("获取编码器列表失败: %s", e)
+            compiled = set()
+        to_test = [enc for enc in candidates if enc in compiled]
+        failures: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(to_test))) as pool:
+            results = dict(zip(to_test, pool.map(lambda enc: trial_encode(ffmpeg, enc), to_test)))
+        for enc, (ok, reason) in results.items():
+            if not ok:
+                failures[enc] = reason
+                logger.debug("编码器试编码失败: %s: %s", enc, reason)
+        available = [(enc, candidates[enc]) for enc in to_test if results[enc][0]]
+        cache[identity] = {
+            'checked_at': time.time(),
+            'tested': sorted(candidates),
+            'available': [enc for enc, _ in available],
+            'failures': failures,
+        }
+        _save_cache(cache)
+        if not available:
+            print("⚠️ 没有编码器通过试编码，使用 CPU 编码器")
+            available = list(CPU_ENCODERS.items())
+        _MEMO[identity] = available
+        return list(available)
+
+
+def best_encoder(available: List[Tuple[str, str]] | None = None, hevc_only: bool = False) -> str:
+    """按 ENCODER_PRIORITY 从已验证的编码器中选出最佳的一个"""
+    names = [enc for enc, _ in (available if available is not None else verified_encoders())]
+    for enc in ENCODER_PRIORITY:
+        if hevc_only and not (enc.startswith('hevc_') or enc == 'libx265'):
+            continue
+        if enc in names:
+            return enc
+    return 'libx265' if hevc_only else 'libx264'
@@ -0,0 +1,175 @@
+"""
+无交互的任务接口：下载 / 合并 / 流水线，可在 cron、工作进程或脚本中直接导入使用。
+
+    from jobs import DownloadJob, MergeJob
+    DownloadJob(bv_list=['BV1xx411c7mD']).run()
+    MergeJob(output_name='playlist', encoder='libx265').run()
+
+任务规格也可以写在 JSON 配置文件中（见 load_job_spec），字段与命令行参数一一对应。
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+from download import DownloadResult, download_bvs, extract_bv, load_sessdata, print_download_summary
+
+
+def read_bv_file(path: str) -> List[str]:
+    """从文本文件中提取 BV 号（去重、按出现顺序）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return extract_bv(f.read())
+
+
+def resolve_encoder(encoder: str | None) -> str:
+    """未指定编码器时自动选择最佳 HEVC 编码器（不询问）"""
+    if encoder:
+        return encoder
+    from utils import select_best_hevc_encoder
+    return select_best_hevc_encoder()
+
+
+@dataclass
+class DownloadJob:
+    bv_list: List[str] = field(default_factory=list)
+    bv_file: str | None = None
+    save_path: str = 'download'
+    sessdata: str | None = None
+    max_workers: int | None = None
+    skip_existing: bool = True
+    # 只下载音频流（保存到 save_path/audio，见 download.get_save_path）
+    audio_only: bool = False
+
+    @property
+    def target_dir(self) -> str:
+        from download import AUDIO_SUBDIR
+        base = os.path.abspath(self.save_path)
+        return os.path.join(base, AUDIO_SUBDIR) if self.audio_only else base
+
+    def resolve_bv_list(self) -> List[str]:
+        bv_list = list(self.bv_list)
+        if self.bv_file:
+            bv_list.extend(bv for bv in read_bv_file(self.bv_file) if bv not in bv_list)
+        return bv_list
+
+    def resolve_sessdata(self) -> str:
+        sessdata = self.sessdata if self.sessdata is not None else load_sessdata()
+        if not sessdata:
+            print("⚠️ 未提供 SESSDATA（BILI_SESSDATA 或 SESSDATA.txt），将以未登录状态下载")
+        return sessdata
+
+    def run(self) -> List[DownloadResult]:
+        bv_list = self.resolve_bv_list()
+        if not bv_list:
+            raise ValueError("未识别任何 BV")
+        save_path = self.target_dir
+        os.makedirs(save_path, exist_ok=True)
+        results = download_bvs(bv_list, save_path, self.resolve_sessdata(), max_workers=self.max_workers,
+                               skip_existing=self.skip_existing, audio_only=self.audio_only)
+        print_download_summary(results)
+        return results
+
+
+@dataclass
+class MergeResult:
+    video: str | None = None
+    audio: str | None = None
+    subtitle: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.video is not None or self.audio is not None
+
+
+@dataclass
+class MergeJob:
+    download_dir: str = 'download'
+    files: List[str] = field(default_factory=list)
+    selection: str = 'new'
+    encoder: str | None = None
+    output_name: str = 'merged'
+    output_dir: str | None = None
+    # 仅音频：从 download_dir/audio 选取曲目，合并为带章节的 audio_format（mp3/m4a）
+    audio_only: bool = False
+    audio_format: str = 'mp3'
+    # EBU R128 响度归一化；None 时读取 BILI_LOUDNORM
+    loudnorm: bool | None = None
+
+    @property
+    def source_dir(self) -> str:
+        from download import AUDIO_SUBDIR
+        base = os.path.abspath(self.download_dir)
+        return os.path.join(base, AUDIO_SUBDIR) if self.audio_only else base
+
+    def resolve_files(self) -> List[str]:
+        if self.files:
+            return list(self.files)
+        from merge import select_merge_files
+        return select_merge_files(self.source_dir, self.selection, audio_only=self.audio_only)
+
+    @property
+    def work_name(self) -> str:
+        """工作目录按输出名区分（merge.work_dir_path），同一下载目录上并行的任务互不干扰"""
+        return self.output_name
+
+    def run_audio(self, files: List[str]) -> MergeResult:
+        from audio_merge import merge_audio_files, save_audio_output
+        from merge import work_dir_path
+        output = merge_audio_files(files, work_dir_path(self.source_dir, self.work_name), self.audio_format,
+                                   album=self.output_name, loudnorm=self.loudnorm)
+        if output is None:
+            return MergeResult()
+        return MergeResult(audio=save_audio_output(output, self.output_name, self.output_dir))
+
+    def save(self, merged) -> MergeResult:
+        from merge import save_merge_outputs
+        if merged is None:
+            return MergeResult()
+        video, audio, subtitle = save_merge_outputs(*merged, new_name=self.output_name, target_dir=self.output_dir)
+        return MergeResult(video=video, audio=audio, subtitle=subtitle)
+
+    def run(self) -> MergeResult:
+        from merge import merge_files
+        files = self.resolve_files()
+        if not files:
+            raise ValueError("未找到可合并的视频文件")
+        print(f"🔎 本次将要合并 {len(files)} 个文件")
+        if self.audio_only:
+            return self.run_audio(files)
+        return self.save(merge_files(files, os.path.abspath(self.download_dir), resolve_encoder(self.encoder),
+                                     loudnorm=self.loudnorm, work_name=self.work_name))
+
+
+def run_pipeline(download_job: DownloadJob, merge_job: MergeJob) -> MergeResult:
+    """边下载边转码，下载目录取 download_job.save_path，合并参数取 merge_job"""
+    from merge import pipelined_merge
+    if download_job.audio_only or merge_job.audio_only:
+        # 仅音频没有转码可以并行：下载完直接按本批顺序合并
+        download_job.audio_only = merge_job.audio_only = True
+        results = download_job.run()
+        return merge_job.run_audio([f for r in results for f in r.files])
+    bv_list = download_job.resolve_bv_list()
+    if not bv_list:
+        raise ValueError("未识别任何 BV")
+    save_path = os.path.abspath(download_job.save_path)
+    os.makedirs(save_path, exist_ok=True)
+    _, merged = pipelined_merge(bv_list, save_path, download_job.resolve_sessdata(),
+                                resolve_encoder(merge_job.encoder),
+                                max_workers=download_job.max_workers,
+                                skip_existing=download_job.skip_existing,
+                                loudnorm=merge_job.loudnorm,
+                                work_name=merge_job.work_name)
+    return merge_job.save(merged)
+
+
+def load_job_spec(path: str) -> dict:
+    """
+    读取 JSON 任务配置，例如：
+    {"bv": ["BV..."], "bv_file": "list.txt", "encoder": "hevc_nvenc",
+     "output": "playlist", "select": "new", "pipeline": true, "download": true}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError(f"任务配置必须是 JSON 对象: {path}")
+    return spec
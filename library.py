@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List
+
+from log import get_logger
+
+logger = get_logger('library')
+
+
+class DownloadLibrary:
+    """
+    下载目录的持久清单（SQLite）：记录每个 BV 的输出文件、大小、时长与下载时间，
+    以及每批下载的 BV 输入顺序。用于跳过已下载的 BV、按输入顺序取回文件，
+    以及在不遍历目录的情况下列出合并候选。
+    """
+
+    DB_NAME = '.downloads.sqlite3'
+
+    def __init__(self, save_path: str):
+        self.path = os.path.join(os.path.abspath(save_path), self.DB_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS downloads (
+                    bv TEXT PRIMARY KEY,
+                    files TEXT NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    duration REAL NOT NULL DEFAULT 0,
+                    downloaded_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS batch_items (
+                    batch_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    bv TEXT NOT NULL,
+                    PRIMARY KEY (batch_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS idx_downloads_time ON downloads (downloaded_at);
+            ''')
+        logger.debug("下载清单: %s", self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def new_batch(self, bv_list: List[str]) -> int:
+        """登记一批下载及其 BV 输入顺序，返回批次号"""
+        with self._lock, self._conn:
+            cur = self._conn.execute('INSERT INTO batches (created_at) VALUES (?)', (time.time(),))
+            batch_id = cur.lastrowid
+            self._conn.executemany(
+                'INSERT INTO batch_items (batch_id, position, bv) VALUES (?, ?, ?)',
+                [(batch_id, i, bv) for i, bv in enumerate(bv_list)],
+            )
+        return batch_id
+
+    def record(self, bv: str, files: List[str], duration: float = 0.0) -> None:
+        """记录（或更新）一个 BV 的下载结果"""
+        size = sum(os.path.getsize(f) for f in files if os.path.exists(f))
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO downloads (bv, files, size, duration, downloaded_at) VALUES (?, ?, ?, ?, ?)',
+                (bv, json.dumps([os.path.abspath(f) for f in files], ensure_ascii=False), size, duration, time.time()),
+            )
+
+    def files_for(self, bv: str) -> List[str] | None:
+        """已下载且文件仍全部存在时返回其文件列表，否则返回 None"""
+        with self._lock:
+            row = self._conn.execute('SELECT files FROM downloads WHERE bv = ?', (bv,)).fetchone()
+        if row is None:
+            return None
+        files = json.loads(row['files'])
+        if not files or not all(os.path.exists(f) for f in files):
+            return None
+        return files
+
+    def batch_files(self, batch_id: int | None = None) -> List[str]:
+        """按 BV 输入顺序返回某批次（默认最近一批）的文件"""
+        with self._lock:
+            if batch_id is None:
+                row = self._conn.execute('SELECT MAX(id) AS id FROM batches').fetchone()
+                batch_id = row['id'] if row else None
+            if batch_id is None:
+                return []
+            rows = self._conn.execute(
+                '''SELECT d.files FROM batch_items b JOIN downloads d ON d.bv = b.bv
+                   WHERE b.batch_id = ? ORDER BY b.position''',
+                (batch_id,),
+            ).fetchall()
+        files: List[str] = []
+        for row in rows:
+            files.extend(f for f in json.loads(row['files']) if os.path.exists(f))
+        return files
+
+    def list_files(self) -> List[str]:
+        """列出清单中仍存在的全部文件（最近下载的在前），作为合并候选"""
+        with self._lock:
+            rows = self._conn.execute('SELECT files FROM downloads ORDER BY downloaded_at DESC').fetchall()
+        files: List[str] = []
+        for row in rows:
+            files.extend(f for f in json.loads(row['files']) if os.path.exists(f))
+        return files
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS size, COALESCE(SUM(duration), 0) AS duration FROM downloads'
+            ).fetchone()
+        return {'count': row['count'], 'size': row['size'], 'duration': row['duration']}
+
+
+def open_library(save_path: str) -> DownloadLibrary | None:
+    """打开下载目录的清单；目录不存在时返回 None"""
+    if not os.path.isdir(save_path):
+        return None
+    try:
+        return DownloadLibrary(save_path)
+    except sqlite3.Error as e:
+        logger.debug("打开下载清单失败: %s", e)
+        return None
@@ -0,0 +1,54 @@
+"""
+日志：统一的分级日志层，替代各模块中无条件输出的 [DEBUG] print。
+
+- 默认级别 INFO，可通过 BILI_LOG_LEVEL（DEBUG/INFO/WARNING/ERROR）或 setup_logging(level=...) 调整
+- BILI_LOG_FILE 或 setup_logging(log_file=...) 额外写入日志文件（始终记录 DEBUG 级别，便于事后排查）
+- 消息使用 logger.debug("...%s", value) 的延迟格式化：级别未启用时不做字符串拼接
+"""
+import logging
+import os
+import sys
+
+_ROOT = 'bili'
+_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """返回 bili.<name> 子日志器；未配置时按环境变量自动配置一次"""
+    if not _configured:
+        setup_logging()
+    return logging.getLogger(f"{_ROOT}.{name}")
+
+
+def setup_logging(level: str | int | None = None, log_file: str | None = None) -> logging.Logger:
+    """配置根日志器（可重复调用，后一次覆盖前一次）"""
+    global _configured
+    _configured = True
+    level = level or os.environ.get('BILI_LOG_LEVEL', 'INFO')
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    log_file = log_file or os.environ.get('BILI_LOG_FILE')
+
+    root = logging.getLogger(_ROOT)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.propagate = False
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(level)
+    console.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    root.addHandler(console)
+    effective = level
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'))
+        root.addHandler(file_handler)
+        effective = logging.DEBUG
+    # 根日志器的级别取各处理器中最低的一个，未启用的级别在 logger 层直接短路
+    root.setLevel(effective)
+    return root
@@ -0,0 +1,114 @@
+"""
+EBU R128 响度归一化（两遍 loudnorm）。
+
+- 第一遍：对每个源文件做一次只解码音频的 loudnorm 测量，结果写入探测缓存条目（与 MediaInfo 同一键），
+  同一文件再次合并时不会重新分析
+- 第二遍：由 loudnorm_filter 生成带实测值的线性 loudnorm 滤镜，直接并入逐片段转码的音频滤镜链，
+  不额外解码一次
+
+设置 BILI_LOUDNORM=1（或命令行 --loudnorm）启用。
+"""
+import json
+import os
+import subprocess
+from typing import Dict, List
+
+from log import get_logger
+from probe import probe_media, save_probe_cache, update_probe_cache
+from utils import get_ffmpeg_path
+
+logger = get_logger('loudness')
+
+# 目标：综合响度 -16 LUFS、真峰值 -1.5 dBTP、响度范围 11 LU（与常见流媒体平台一致）
+LOUDNORM_TARGET = {'I': -16.0, 'TP': -1.5, 'LRA': 11.0}
+# loudnorm 首遍输出中第二遍需要的字段
+MEASURED_FIELDS = ('input_i', 'input_tp', 'input_lra', 'input_thresh')
+MEASURE_TIMEOUT_SECONDS = 1800
+
+
+def loudnorm_enabled(value: bool | None = None) -> bool:
+    """显式参数优先，否则读取 BILI_LOUDNORM"""
+    if value is not None:
+        return value
+    return os.environ.get('BILI_LOUDNORM', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _target_args() -> str:
+    return ':'.join(f"{k}={v}" for k, v in LOUDNORM_TARGET.items())
+
+
+def _parse_loudnorm_json(stderr: str) -> Dict[str, float] | None:
+    """loudnorm print_format=json 的结果是 stderr 末尾的一个 JSON 对象"""
+    start, end = stderr.rfind('{'), stderr.rfind('}')
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(stderr[start:end + 1])
+        measured = {k: float(data[k]) for k in MEASURED_FIELDS}
+    except (ValueError, KeyError, TypeError):
+        return None
+    # 静音轨道的 input_i 为 -inf，无法归一化
+    if any(v != v or v in (float('inf'), float('-inf')) for v in measured.values()):
+        return None
+    return measured
+
+
+def _run_measurement(path: str) -> Dict[str, float] | None:
+    ffmpeg = get_ffmpeg_path() or 'ffmpeg'
+    cmd = [
+        ffmpeg, '-hide_banner', '-nostats', '-i', path, '-map', '0:a:0', '-vn', '-sn', '-dn',
+        '-af', f"loudnorm={_target_args()}:print_format=json", '-f', 'null', '-',
+    ]
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, timeout=MEASURE_TIMEOUT_SECONDS)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug("响度测量执行失败: %s, %s", path, e)
+        return None
+    stderr = result.stderr.decode('utf-8', errors='ignore')
+    if result.returncode != 0:
+        logger.debug("响度测量失败: %s, %s", path, stderr.strip()[-500:])
+        return None
+    return _parse_loudnorm_json(stderr)
+
+
+def measure_loudness(path: str, use_cache: bool = True) -> Dict[str, float] | None:
+    """返回首遍测量值（MEASURED_FIELDS）；没有音轨或测量失败时返回 None。命中探测缓存时不启动 ffmpeg。"""
+    info = probe_media(path)
+    if info is None or not info.has_audio:
+        return None
+    if use_cache and info.loudness:
+        return info.loudness
+    measured = _run_measurement(path)
+    if measured is not None:
+        update_probe_cache(path, loudness=measured)
+        logger.debug("响度测量: %s, %s", path, measured)
+    return measured
+
+
+def measure_loudness_many(paths: List[str], max_workers: int = 4,
+                          use_cache: bool = True) -> Dict[str, Dict[str, float] | None]:
+    """并发测量多个文件，返回 路径 -> 测量值（失败为 None），结束后写回探测缓存"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    results: Dict[str, Dict[str, float] | None] = {}
+    if not paths:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        for path, measured in zip(paths, pool.map(lambda p: measure_loudness(p, use_cache), paths)):
+            results[path] = measured
+    save_probe_cache()
+    return results
+
+
+def loudnorm_filter(measured: Dict[str, float], sample_rate: int = 48000) -> str:
+    """
+    第二遍滤镜：线性模式（整体增益，不做动态压缩）使用首遍实测值；
+    loudnorm 内部以 192 kHz 输出，末尾重采样回目标采样率。
+    """
+    return (
+        f"loudnorm={_target_args()}"
+        f":measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+        f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+        f":linear=true:print_format=none,aresample={sample_rate}"
+    )
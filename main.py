@@ -21,8 +21,101 @@ def ask_execute(task_name: str, task_function, *args, **kwargs):
         print(f"❌ {task_name} 执行失败: {e}")
         return None
 
+# 启动标记：记录已满足的依赖集合与解释器；校验通过时跳过整个安装流程
+# 2：依赖集合去掉了 moviepy，旧标记中记录的 moviepy 位置不再参与校验
+BOOTSTRAP_STAMP_VERSION = 2
+BOOTSTRAP_STAMP_NAME = '.bootstrap_stamp.json'
+# pip 包名 -> 导入名
+# numpy 与 pillow 用于间隔片段的标题卡渲染（merge.generate_gap_segment）；合并全程直接调用 ffmpeg，不需要 moviepy
+BOOTSTRAP_MODULES = {'pillow': 'PIL', 'numpy': 'numpy', 'yutto': 'yutto', 'playwright': 'playwright'}
+
+
+def _required_packages() -> list:
+    if sys.platform.startswith('linux'):
+        has_display = os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')
+        return ['pillow', 'numpy', 'yutto'] + (['playwright'] if has_display else [])
+    return ['playwright', 'yutto', 'pillow', 'numpy']
+
+
+def _bootstrap_python(project_root: str) -> str:
+    if sys.platform.startswith('linux'):
+        return os.path.join(project_root, '.venv', 'bin', 'python')
+    return sys.executable
+
+
+def _python_identity(python: str) -> dict:
+    real = os.path.realpath(python)
+    st = os.stat(real)
+    return {'python': real, 'python_size': st.st_size, 'python_mtime_ns': st.st_mtime_ns}
+
+
+def _bootstrap_stamp_valid(project_root: str) -> bool:
+    """只做文件存在性与 stat 比较（毫秒级），不启动任何子进程"""
+    if os.environ.get('BILI_FORCE_BOOTSTRAP') == '1':
+        return False
+    import json
+    try:
+        with open(os.path.join(project_root, BOOTSTRAP_STAMP_NAME), 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+        if stamp.get('version') != BOOTSTRAP_STAMP_VERSION or stamp.get('platform') != sys.platform:
+            return False
+        if any(stamp.get(k) != v for k, v in _python_identity(_bootstrap_python(project_root)).items()):
+            return False
+        origins = stamp.get('modules', {})
+        if not set(_required_packages()) <= set(origins):
+            return False
+        if not all(os.path.exists(path) for path in origins.values()):
+            return False
+        return bool(shutil.which('ffmpeg')) or not sys.platform.startswith('linux')
+    except (OSError, ValueError):
+        return False
+
+
+def _write_bootstrap_stamp(project_root: str, packages: list) -> None:
+    """安装完成后，用目标解释器解析各依赖的安装位置并写入启动标记"""
+    import json
+    python = _bootstrap_python(project_root)
+    modules = {pkg: BOOTSTRAP_MODULES[pkg] for pkg in packages}
+    snippet = (
+        "import importlib.util, json, sys\n"
+        "mods = json.loads(sys.argv[1])\n"
+        "print(json.dumps({pkg: getattr(importlib.util.find_spec(mod), 'origin', None) for pkg, mod in mods.items()}))"
+    )
+    try:
+        result = subprocess.run([python, '-c', snippet, json.dumps(modules)], capture_output=True, text=True, check=True)
+        origins = json.loads(result.stdout)
+        if not all(origins.values()):
+            print(f"⚠️ 部分依赖未能导入，不写入启动标记: {[k for k, v in origins.items() if not v]}")
+            return
+        stamp = {'version': BOOTSTRAP_STAMP_VERSION, 'platform': sys.platform, 'modules': origins}
+        stamp.update(_python_identity(python))
+        with open(os.path.join(project_root, BOOTSTRAP_STAMP_NAME), 'w', encoding='utf-8') as f:
+            json.dump(stamp, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"⚠️ 写入启动标记失败（下次启动将重新检查依赖）: {e}")
+
+
+def _reexec_in_venv(venv_dir: str, venv_python: str) -> None:
+    # 若当前不是 venv 解释器，则切换到 venv 并重启自身
+    if os.path.realpath(sys.executable) != os.path.realpath(venv_python) and os.environ.get('BILI_VENV_ACTIVATED') != '1':
+        print("🔁 切换到虚拟环境解释器重新启动程序...")
+        env2 = os.environ.copy()
+        env2['BILI_VENV_ACTIVATED'] = '1'
+        env2['VIRTUAL_ENV'] = venv_dir
+        env2['PATH'] = os.path.join(venv_dir, 'bin') + os.pathsep + env2.get('PATH', '')
+        os.execvpe(venv_python, [venv_python] + sys.argv, env2)
+
+
 def _ensure_dependencies():
     """在导入任何依赖这些库的模块前，确保第三方依赖已安装。"""
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    if _bootstrap_stamp_valid(project_root):
+        print("⚡ 依赖已就绪，跳过安装（设置 BILI_FORCE_BOOTSTRAP=1 可强制重新检查）")
+        if sys.platform.startswith('linux'):
+            venv_dir = os.path.join(project_root, '.venv')
+            _reexec_in_venv(venv_dir, os.path.join(venv_dir, 'bin', 'python'))
+        return
+
     print("📦 检查并安装依赖...")
 
     # Linux: 检测并安装系统依赖，使用虚拟环境安装Python包
@@ -68,7 +161,6 @@ def _ensure_dependencies():
             print("✅ 系统依赖检查通过")
 
         # 使用项目本地虚拟环境安装 Python 包
-        project_root = os.path.dirname(os.path.abspath(__file__))
         venv_dir = os.path.join(project_root, '.venv')
         venv_python = os.path.join(venv_dir, 'bin', 'python')
         venv_pip = os.path.join(venv_dir, 'bin', 'pip')
@@ -106,7 +198,7 @@ trusted-host = pypi.tuna.tsinghua.edu.cn
             # 不使用 requirements.txt，手动安装依赖
             print("📦 安装默认依赖...")
             # 确保安装所有必需的依赖，包括pillow (PIL)
-            core_packages = ['moviepy', 'pillow', 'yutto']
+            core_packages = ['pillow', 'numpy', 'yutto']
             if has_display:
                 # 有图形界面，安装完整依赖
                 print(f"🖥️ 有图形界面环境，安装所有依赖: {core_packages + ['playwright']}")
@@ -123,7 +215,7 @@ trusted-host = pypi.tuna.tsinghua.edu.cn
                 installed_packages = result.stdout
                 print("📋 已安装的包列表:")
                 for line in installed_packages.split('\n'):
-                    if 'moviepy' in line.lower() or 'pillow' in line.lower() or 'yutto' in line.lower() or 'playwright' in line.lower():
+                    if 'pillow' in line.lower() or 'numpy' in line.lower() or 'yutto' in line.lower() or 'playwright' in line.lower():
                         print(f"  {line}")
             except subprocess.CalledProcessError:
                 print("⚠️ 无法获取已安装包列表")
@@ -159,18 +251,12 @@ trusted-host = pypi.tuna.tsinghua.edu.cn
             print("pip install -r requirements.txt")
             sys.exit(1)
 
-        # 若当前不是 venv 解释器，则切换到 venv 并重启自身
-        if os.path.realpath(sys.executable) != os.path.realpath(venv_python) and os.environ.get('BILI_VENV_ACTIVATED') != '1':
-            print("🔁 切换到虚拟环境解释器重新启动程序...")
-            env2 = os.environ.copy()
-            env2['BILI_VENV_ACTIVATED'] = '1'
-            env2['VIRTUAL_ENV'] = venv_dir
-            env2['PATH'] = os.path.join(venv_dir, 'bin') + os.pathsep + env2.get('PATH', '')
-            os.execvpe(venv_python, [venv_python] + sys.argv, env2)
+        _write_bootstrap_stamp(project_root, _required_packages())
+        _reexec_in_venv(venv_dir, venv_python)
 
     else:
         # Windows/macOS: 沿用当前 Python 安装依赖
-        required_packages = ['playwright', 'yutto', 'moviepy', 'pillow']
+        required_packages = ['playwright', 'yutto', 'pillow', 'numpy']
         for pkg in required_packages:
             try:
                 __import__(pkg)
@@ -198,12 +284,116 @@ trusted-host = pypi.tuna.tsinghua.edu.cn
             subprocess.run([sys.executable, "-m", "playwright", "install-deps", "chromium"], check=True)
             subprocess.run([sys.executable, "-m", "playwright", "install", "chromium"], check=True)
             print("✅ Playwright 浏览器内核安装完成")
+            _write_bootstrap_stamp(project_root, required_packages)
         except subprocess.CalledProcessError as e:
             print(f"❌ Playwright 浏览器安装失败: {e}")
             print("提示：您也可以手动运行以下命令安装:")
             print("npx playwright install chromium")
 
-def main():
+def _build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Bilibili 视频下载与合并。不带参数时进入交互模式；带任意任务参数时以无交互批处理模式运行。"
+    )
+    parser.add_argument('--config', help="JSON 任务配置文件（命令行参数覆盖其中的同名字段）")
+    parser.add_argument('--bv', nargs='+', help="要下载的 BV 号")
+    parser.add_argument('--bv-file', help="包含 BV 号的文本文件")
+    parser.add_argument('--download-dir', help="下载目录（默认 ./download）")
+    parser.add_argument('--encoder', help="编码器名称（默认自动选择最佳 HEVC 编码器）")
+    parser.add_argument('--output', help="合并结果的文件名（不含扩展名，默认 merged）")
+    parser.add_argument('--output-dir', help="合并结果的保存目录（默认脚本所在目录）")
+    parser.add_argument('--select', help="合并选择：new（最近一批下载，默认）、all 或序号如 1,3,5-7")
+    parser.add_argument('--workers', type=int, help="并发下载数（自适应并发的硬上限）")
+    parser.add_argument('--pipeline', action='store_true', default=None, help="边下载边转码")
+    parser.add_argument('--audio-only', action='store_true', default=None, help="仅音频：只下载音轨，合并为带章节的音乐合集")
+    parser.add_argument('--audio-format', choices=['mp3', 'm4a'], help="仅音频模式的输出格式（默认 mp3）")
+    parser.add_argument('--loudnorm', action='store_true', default=None,
+                        help="按 EBU R128 归一化各片段响度（测量结果随探测缓存保存，或环境变量 BILI_LOUDNORM=1）")
+    parser.add_argument('--no-download', dest='download', action='store_false', default=None, help="只合并，不下载")
+    parser.add_argument('--no-merge', dest='merge', action='store_false', default=None, help="只下载，不合并")
+    parser.add_argument('--force-download', action='store_true', default=None, help="忽略下载清单，重新下载已下载过的 BV")
+    parser.add_argument('--batch', action='store_true', help="强制无交互模式")
+    parser.add_argument('--log-level', help="日志级别：DEBUG/INFO/WARNING/ERROR（默认 INFO，或环境变量 BILI_LOG_LEVEL）")
+    parser.add_argument('--log-file', help="同时写入的日志文件（记录 DEBUG 级别，或环境变量 BILI_LOG_FILE）")
+    return parser
+
+
+def _job_spec_from_args(args) -> dict:
+    """合并配置文件与命令行参数，得到任务规格（字段同 jobs.load_job_spec）"""
+    spec: dict = {}
+    if args.config:
+        from jobs import load_job_spec
+        spec.update(load_job_spec(args.config))
+    overrides = {
+        'bv': args.bv, 'bv_file': args.bv_file, 'download_dir': args.download_dir,
+        'encoder': args.encoder, 'output': args.output, 'output_dir': args.output_dir,
+        'select': args.select, 'workers': args.workers, 'pipeline': args.pipeline,
+        'download': args.download, 'merge': args.merge, 'force_download': args.force_download,
+        'audio_only': args.audio_only, 'audio_format': args.audio_format,
+        'loudnorm': args.loudnorm,
+    }
+    spec.update({k: v for k, v in overrides.items() if v is not None})
+    return spec
+
+
+def run_batch(spec: dict) -> int:
+    """按任务规格无交互运行，返回进程退出码（0 成功，1 失败）"""
+    from jobs import DownloadJob, MergeJob, run_pipeline
+
+    download_dir = spec.get('download_dir', 'download')
+    # 配置文件中 "bv" 可以是单个字符串
+    bv = spec.get('bv') or []
+    download_job = DownloadJob(
+        bv_list=[bv] if isinstance(bv, str) else list(bv),
+        bv_file=spec.get('bv_file'),
+        save_path=download_dir,
+        max_workers=spec.get('workers'),
+        skip_existing=not spec.get('force_download', False),
+        audio_only=bool(spec.get('audio_only', False)),
+    )
+    merge_job = MergeJob(
+        download_dir=download_dir,
+        selection=str(spec.get('select', 'new')),
+        encoder=spec.get('encoder'),
+        output_name=spec.get('output', 'merged'),
+        output_dir=spec.get('output_dir'),
+        audio_only=bool(spec.get('audio_only', False)),
+        audio_format=spec.get('audio_format', 'mp3'),
+        loudnorm=spec.get('loudnorm'),
+    )
+    has_bv = bool(download_job.bv_list or download_job.bv_file)
+    do_download = spec.get('download', has_bv)
+    do_merge = spec.get('merge', True)
+    try:
+        if spec.get('pipeline') and do_download and do_merge:
+            result = run_pipeline(download_job, merge_job)
+            return 0 if result.ok else 1
+        if do_download:
+            results = download_job.run()
+            if not all(r.ok for r in results):
+                print("⚠️ 部分 BV 下载失败，继续合并已下载的文件")
+        if do_merge:
+            result = merge_job.run()
+            if not result.ok:
+                return 1
+            print(f"🎉 合并完成：{result.video or result.audio}")
+        return 0
+    except Exception as e:
+        print(f"❌ 批处理失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+def main(argv=None):
+    args = _build_arg_parser().parse_args(argv)
+    batch_mode = args.batch or any(
+        v is not None for k, v in vars(args).items() if k not in ('batch', 'log_level', 'log_file')
+    )
+    # log 模块只依赖标准库，可以在依赖安装前配置
+    from log import setup_logging
+    setup_logging(args.log_level, args.log_file)
+
     print("=" * 60)
     print("🎬 Bilibili 视频处理自动化流程")
     print("=" * 60)
@@ -232,6 +422,33 @@ def main():
         print("请检查依赖是否正确安装")
         sys.exit(1)
 
+    if batch_mode:
+        sys.exit(run_batch(_job_spec_from_args(args)))
+
+    audio_mode = input("是否使用仅音频模式（只下载音轨，合并为带章节的音乐合集）？(y/N): ").strip().lower() == 'y'
+    if audio_mode:
+        from audio_merge import run_audio_compilation
+        audio_done = ask_execute("【🎵 音乐合集（仅音频）】", run_audio_compilation)
+        print("\n" + "=" * 60)
+        print("📋 执行摘要")
+        print("=" * 60)
+        print(f"• 仅音频下载与合并: {'✅ 已执行' if audio_done else '⚠️ 跳过'}")
+        print("\n🎉 处理完成！")
+        input("\n👉 请按任意键退出...")
+        return
+
+    pipeline_mode = input("是否使用流水线模式（边下载边转码，完成后直接合并）？(y/N): ").strip().lower() == 'y'
+    if pipeline_mode:
+        from merge import run_pipelined_merge
+        pipeline_done = ask_execute("【⚡ 下载并合并（流水线）】", run_pipelined_merge)
+        print("\n" + "=" * 60)
+        print("📋 执行摘要")
+        print("=" * 60)
+        print(f"• 流水线下载与合并: {'✅ 已执行' if pipeline_done else '⚠️ 跳过'}")
+        print("\n🎉 处理完成！")
+        input("\n👉 请按任意键退出...")
+        return
+
     download_result = ask_execute("【📥 视频下载】", run_download)
 
     download_dir = "./download"
@@ -264,4 +481,6 @@ if __name__ == "__main__":
         print("\n\n👋 程序被用户中断。")
     except Exception as e:
         print(f"\n❌ 程序错误: {e}")
-        input("按任意键退出...")
+        if sys.stdin.isatty():
+            input("按任意键退出...")
+        sys.exit(1)
@@ -1,87 +1,33 @@
 import os
-from typing import List, Dict
+import re
+from typing import List, Dict, Tuple, NamedTuple
 import subprocess
 import traceback
 
 from utils import (
-    get_video_resolution,
-    get_video_files,
+    get_merge_candidates,
     move_file,
-    get_media_duration_seconds,
-    ass_time_add,
     get_last_download_files,
+    insert_gap,
 )
+from probe import probe_many
+from merge_manifest import MergeManifest, source_fingerprint
+from log import get_logger
 
-# moviepy 将在需要时延迟导入
+logger = get_logger('merge')
 
 
 def choose_encoder() -> str:
-    print("[DEBUG] 开始选择编码器")
-    # 检测可用的硬件编码器
-    import subprocess
-    import platform
-    
-    system = platform.system().lower()
-    print(f"[DEBUG] 系统类型: {system}")
-    if 'windows' in system:
-        candidates = {
-            'h264_nvenc': 'NVIDIA H.264 (NVENC)',
-            'hevc_nvenc': 'NVIDIA H.265 (NVENC)',
-            'h264_amf': 'AMD H.264 (AMF)',
-            'hevc_amf': 'AMD H.265 (AMF)',
-            'h264_qsv': 'Intel H.264 (QSV)',
-            'hevc_qsv': 'Intel H.265 (QSV)',
-        }
-    elif 'linux' in system:
-        candidates = {
-            'h264_nvenc': 'NVIDIA H.264 (NVENC)',
-            'hevc_nvenc': 'NVIDIA H.265 (NVENC)',
-            'h264_amf': 'AMD H.264 (AMF)',
-            'hevc_amf': 'AMD H.265 (AMF)',
-            'h264_vaapi': 'VAAPI H.264',
-            'hevc_vaapi': 'VAAPI H.265',
-            'h264_qsv': 'Intel H.264 (QSV)',
-            'hevc_qsv': 'Intel H.265 (QSV)',
-        }
-    elif 'darwin' in system:
-        candidates = {
-            'h264_videotoolbox': 'Apple H.264 (VideoToolbox)',
-            'hevc_videotoolbox': 'Apple H.265 (VideoToolbox)',
-        }
-    else:
-        candidates = {}
-    
-    # 添加 CPU 编码器作为备选
-    candidates.update({'libx264': 'CPU H.264', 'libx265': 'CPU H.265'})
-    print(f"[DEBUG] 候选编码器: {list(candidates.keys())}")
-    
-    # 检测可用的编码器
-    available = []
-    try:
-        result = subprocess.run(['ffmpeg', '-encoders'], capture_output=True, text=True, timeout=10)
-        print(f"[DEBUG] FFmpeg返回码: {result.returncode}")
-        if result.returncode == 0:
-            ffmpeg_encoders = result.stdout.lower()
-            print(f"[DEBUG] FFmpeg编码器列表长度: {len(ffmpeg_encoders)}")
-            for enc, desc in candidates.items():
-                if enc in ffmpeg_encoders:
-                    print(f"[DEBUG] 发现可用编码器: {enc}")
-                    available.append((enc, desc))
-    except Exception as e:
-        print(f"[DEBUG] 检测编码器时出错: {e}")
-        traceback.print_exc()
-        pass
-    
-    if not available:
-        print("[DEBUG] 未找到可用编码器，使用默认CPU编码器")
-        available = [('libx264', 'CPU H.264'), ('libx265', 'CPU H.265')]
-    
+    """交互选择编码器；只列出经试编码验证可用的编码器，回车时按优先级自动选择"""
+    from encoders import best_encoder, verified_encoders
+    available = verified_encoders()
+
     print("\n可用的编码器列表：")
     for idx, (enc, desc) in enumerate(available):
         print(f"  {idx+1}. {enc} - {desc}")
     print("按回车直接使用推荐编码器（自动优先硬件）：")
     choice = input("请选择编码器编号（如 1），或直接回车：").strip()
-    print(f"[DEBUG] 用户选择: {choice}")
+    logger.debug("用户选择: %s", choice)
     if choice.isdigit():
         idx = int(choice) - 1
         if 0 <= idx < len(available):
@@ -89,19 +35,10 @@ def choose_encoder() -> str:
             return available[idx][0]
         else:
             print("无效编号，使用默认推荐编码器。")
-    
+
     # 自动选择最佳编码器（优先硬件）
-    priority = ['hevc_nvenc', 'hevc_amf', 'hevc_qsv', 'hevc_vaapi', 'hevc_videotoolbox', 'libx265', 'h264_nvenc', 'h264_amf', 'h264_qsv', 'h264_vaapi', 'h264_videotoolbox', 'libx264']
-    print(f"[DEBUG] 编码器优先级: {priority}")
-    for enc in priority:
-        for available_enc, _ in available:
-            if enc == available_enc:
-                print(f"🎯 自动选择编码器: {enc}")
-                return enc
-    
-    # 默认使用 libx264
-    encoder = 'libx264'
-    print(f"自动选择编码器：{encoder}")
+    encoder = best_encoder(available)
+    print(f"🎯 自动选择编码器: {encoder}")
     return encoder
 
 
@@ -109,124 +46,45 @@ TRANSCODE_PARAMS = {
     'fps': 60,
     'bitrate': '2M',
     'audio_bitrate': '320k',
-    'pix_fmt': 'yuv420p'
+    'audio_rate': 48000,
+    'audio_channels': 2,
+    'pix_fmt': 'yuv420p',
+    # 段的色彩参数（Bilibili 源多为 BT.709 有限范围）：标题卡与转码片段都显式转换并写入这些标记，
+    # 两者的 SPS（含 VUI 色彩信息）才会逐字节一致，拼接才能走流复制
+    'color_space': 'bt709',
+    'color_range': 'tv',
 }
 
+# 每个视频前插入的标题卡时长（秒）
+GAP_SECONDS = 2.0
+
 
 def find_subtitle(video_path: str) -> str | None:
-    print(f"[DEBUG] 查找字幕文件: {video_path}")
+    logger.debug("查找字幕文件: %s", video_path)
     dirname = os.path.dirname(video_path)
     basename = os.path.splitext(os.path.basename(video_path))[0]
     subtitle_path = os.path.join(dirname, basename + ".ass")
-    print(f"[DEBUG] 检查ASS字幕: {subtitle_path}")
+    logger.debug("检查ASS字幕: %s", subtitle_path)
     if os.path.isfile(subtitle_path):
-        print(f"[DEBUG] 找到ASS字幕")
+        logger.debug("找到ASS字幕")
         return subtitle_path
     subtitle_extensions = ['.ass', '.srt', '.vtt', '.sub']
     for ext in subtitle_extensions:
         alt_subtitle_path = os.path.join(dirname, basename + ext)
-        print(f"[DEBUG] 检查字幕: {alt_subtitle_path}")
+        logger.debug("检查字幕: %s", alt_subtitle_path)
         if os.path.isfile(alt_subtitle_path):
-            print(f"[DEBUG] 找到字幕: {ext}")
+            logger.debug("找到字幕: %s", ext)
             return alt_subtitle_path
-    print("[DEBUG] 未找到字幕文件")
+    logger.debug("未找到字幕文件")
     return None
 
 
-def merge_ass_with_offsets(subtitle_entries: List[tuple], clip_durations: List[float], gap_seconds: float, merged_subtitle_path: str) -> None:
-    print(f"[DEBUG] 合并ASS字幕，条目数: {len(subtitle_entries)}, 间隔秒数: {gap_seconds}")
-    print(f"[DEBUG] 合并后字幕路径: {merged_subtitle_path}")
-    def cumulative_offset_for_index(index: int) -> float:
-        if index <= 0:
-            return 0.0
-        total = sum(clip_durations[:index])
-        total += gap_seconds * index
-        print(f"[DEBUG] 索引 {index} 的累计偏移: {total} 秒")
-        return total
-
-    with open(merged_subtitle_path, "w", encoding="utf-8") as fout:
-        wrote_header = False
-        for entry_idx, (sub_path, clip_index) in enumerate(subtitle_entries):
-            print(f"[DEBUG] 处理字幕条目 {entry_idx}: {sub_path}, 剪辑索引: {clip_index}")
-            with open(sub_path, "r", encoding="utf-8") as fin:
-                lines = fin.readlines()
-            in_events = False
-            offset = cumulative_offset_for_index(clip_index)
-            for line in lines:
-                # 首段：写入头部直到 [Events]，并从此开始处理事件
-                if not wrote_header:
-                    if line.strip().lower() == "[events]":
-                        print(f"[DEBUG] 写入Events头部")
-                        fout.write(line)
-                        wrote_header = True
-                        in_events = True
-                        continue
-                    else:
-                        fout.write(line)
-                        continue
-
-                # 后续段：跳过头部，遇到 [Events] 后开始处理事件
-                if not in_events:
-                    if line.strip().lower() == "[events]":
-                        print(f"[DEBUG] 检测到Events部分")
-                        in_events = True
-                    continue
-
-                # 进入事件段：去重 Format 行，仅写入对齐后的 Dialogue 与其它事件行
-                lower = line.strip().lower()
-                if lower.startswith('format:'):
-                    continue
-                if line.startswith("Dialogue:"):
-                    parts = line.split(",", 9)
-                    if len(parts) >= 3:
-                        old_start = parts[1]
-                        old_end = parts[2]
-                        parts[1] = ass_time_add(parts[1], offset)
-                        parts[2] = ass_time_add(parts[2], offset)
-                        print(f"[DEBUG] 时间偏移 {offset} 秒: {old_start} -> {parts[1]}, {old_end} -> {parts[2]}")
-                        fout.write(",".join(parts))
-                    else:
-                        fout.write(line)
-                else:
-                    fout.write(line)
-    print("[DEBUG] 字幕合并完成")
-
-
-import subprocess
-
-# Check if moviepy is available
-
-
-def generate_gap_segment(tmpdir, index, video_name, fontfile=None):
-    """
-    使用 Pillow 生成 2 秒的间隔视频，显示居中的视频名称（淡入淡出效果）
-    """
-    # 延迟导入 PIL 相关模块
-    try:
-        from PIL import Image, ImageDraw, ImageFont
-    except ImportError:
-        raise ImportError("PIL (Pillow) 库未安装，请运行 'pip install Pillow'")
-    
-    print(f"[DEBUG] 生成间隔片段，索引: {index}, 名称: {video_name}")
-    # 检查 moviepy 是否可用
-    try:
-        print("[DEBUG] 尝试导入moviepy")
-        from moviepy import ImageClip, AudioFileClip, VideoFileClip, concatenate_videoclips, ImageSequenceClip
-        moviepy_available = True
-        print("[DEBUG] Moviepy导入成功")
-    except ImportError:
-        moviepy_available = False
-        print("[DEBUG] Moviepy导入失败")
-        raise ImportError("moviepy 库未安装，无法生成间隔片段。请运行 'pip install -r requirements.txt'")
-    
-    gap_seg = os.path.join(tmpdir, f'gap_{index:03d}.mp4')  # 改为 MP4 格式
-    print(f"[DEBUG] 间隔片段路径: {gap_seg}")
-    
-    # 确定字体文件路径（跨平台）
+def resolve_title_font(fontfile: str | None = None) -> str | None:
+    """确定标题卡使用的字体文件路径（跨平台）；找不到时返回 None 表示使用 Pillow 默认字体"""
     if fontfile is None:
         import platform
         system = platform.system().lower()
-        print(f"[DEBUG] 系统类型: {system}")
+        logger.debug("系统类型: %s", system)
         if 'windows' in system:
             fontfile = "C:/Windows/Fonts/msyh.ttc"
             if not os.path.exists(fontfile):
@@ -246,186 +104,1127 @@ def generate_gap_segment(tmpdir, index, video_name, fontfile=None):
             for font_path in possible_fonts:
                 if os.path.exists(font_path):
                     fontfile = font_path
-                    print(f"[DEBUG] 找到字体文件: {font_path}")
+                    logger.debug("找到字体文件: %s", font_path)
                     break
-    
+
     # 如果仍然没有找到字体文件，使用默认字体
     if fontfile and not os.path.exists(fontfile):
-        print(f"[DEBUG] 字体文件不存在: {fontfile}")
-        fontfile = None  # 使用默认字体
-    
-    # 创建空白帧图像
+        logger.debug("字体文件不存在: %s", fontfile)
+        fontfile = None
+    return fontfile
+
+
+def render_title_mask(video_name: str, fontfile: str | None, width: int = 1920, height: int = 1080):
+    """把居中的标题文字渲染为一张灰度 alpha 蒙版（numpy uint8 数组，只渲染一次）"""
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        raise ImportError("PIL (Pillow) 库未安装，请运行 'pip install Pillow'")
+    import numpy as np
+
+    try:
+        if fontfile:
+            logger.debug("使用字体文件: %s", fontfile)
+            font = ImageFont.truetype(fontfile, 48)
+        else:
+            logger.debug("使用默认字体")
+            font = ImageFont.load_default()
+    except Exception as e:
+        logger.debug("字体加载失败，使用默认字体: %s", e)
+        font = ImageFont.load_default()
+
+    mask = Image.new('L', (width, height), 0)
+    draw = ImageDraw.Draw(mask)
+    try:
+        bbox = draw.textbbox((0, 0), video_name, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+    except Exception:
+        # 如果失败，默认一个尺寸
+        text_width, text_height = 100, 20
+    position = ((width - text_width) // 2, (height - text_height) // 2)
+    logger.debug("文本尺寸: %sx%s, 位置: %s", text_width, text_height, position)
+    draw.text(position, video_name, fill=255, font=font)
+    return np.asarray(mask, dtype=np.uint8)
+
+
+def generate_gap_segment(tmpdir, index, video_name, fontfile=None, encoder: str = 'libx264'):
+    """
+    生成 2 秒的间隔片段，显示居中的视频名称（淡入淡出效果）。
+    文字只渲染一次为蒙版，每帧按淡入淡出系数缩放后以 rawvideo 直接写入单个 ffmpeg 编码进程，
+    输出与视频片段相同的 TS 段格式，不产生中间图片文件。
+    """
+    import numpy as np
+
+    logger.debug("生成间隔片段，索引: %s, 名称: %s", index, video_name)
+    gap_seg = os.path.join(tmpdir, f'gap_{index:03d}.ts')
+    logger.debug("间隔片段路径: %s", gap_seg)
+
     width, height = 1920, 1080
-    duration = 2.0
+    duration = GAP_SECONDS
     fps = TRANSCODE_PARAMS['fps']
-    print(f"[DEBUG] 视频参数: {width}x{height}, 时长: {duration}秒, FPS: {fps}")
-    
-    # 创建临时图像文件夹
-    temp_frames_dir = os.path.join(tmpdir, f'frames_gap_{index:03d}')
-    print(f"[DEBUG] 临时帧目录: {temp_frames_dir}")
-    os.makedirs(temp_frames_dir, exist_ok=True)
-    
-    # 生成帧图像
     total_frames = int(duration * fps)
-    print(f"[DEBUG] 需要生成帧数: {total_frames}")
-    for frame in range(total_frames):
-        t = frame / fps
-        # 创建黑色背景图像
-        image = Image.new('RGB', (width, height), (0, 0, 0))
-        draw = ImageDraw.Draw(image)
-        
-        # 计算透明度（淡入淡出）
-        if t < 0.5:
-            alpha = int(255 * t * 2)
-        elif t > 1.5:
-            alpha = int(255 * (2 - t * 2))
-        else:
-            alpha = 255
-        print(f"[DEBUG] 帧 {frame}, 时间: {t}, 透明度: {alpha}")
-            
-        # 添加文字（白色）
-        try:
-            if fontfile:
-                print(f"[DEBUG] 使用字体文件: {fontfile}")
-                font = ImageFont.truetype(fontfile, 48)
+    logger.debug("视频参数: %sx%s, 时长: %s秒, FPS: %s, 帧数: %s", width, height, duration, fps, total_frames)
+
+    mask = render_title_mask(video_name, resolve_title_font(fontfile), width, height).astype(np.uint16)
+
+    # 静音音轨由 anullsrc 生成，与视频帧在同一个 ffmpeg 进程内编码
+    cmd: List[str] = ['ffmpeg', '-y', '-hide_banner', '-nostats', '-loglevel', 'error']
+    cmd += _hw_device_args(encoder, for_decode=False)
+    cmd += [
+        '-f', 'rawvideo', '-pix_fmt', 'gray', '-s', f'{width}x{height}', '-r', str(fps), '-i', 'pipe:0',
+        '-f', 'lavfi', '-t', str(duration),
+        '-i', f"anullsrc=r={TRANSCODE_PARAMS['audio_rate']}:cl=stereo",
+        '-map', '0:v:0', '-map', '1:a:0', '-shortest',
+    ]
+    # 灰度蒙版是全范围（0-255）数据，显式按全范围输入转换为段的有限范围 BT.709
+    cmd += _segment_encode_args(encoder, [], gap_seg, in_range='pc')
+    logger.debug("FFmpeg命令: %s", ' '.join(cmd))
+
+    # 目标可能是指向缓存条目的链接，先删除，避免覆盖写入改动缓存内容
+    if os.path.lexists(gap_seg):
+        os.remove(gap_seg)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    fade = 0.5
+    try:
+        full_frame = None
+        for frame in range(total_frames):
+            t = frame / fps
+            # 计算透明度（淡入淡出）：淡出按剩余时间计算，并限制在 0..255
+            alpha = max(0, min(255, int(255 * min(t, duration - t, fade) / fade)))
+            if alpha == 255:
+                # 中间段各帧完全相同，只计算一次
+                if full_frame is None:
+                    full_frame = mask.astype(np.uint8).tobytes()
+                proc.stdin.write(full_frame)
             else:
-                print("[DEBUG] 使用默认字体")
-                font = ImageFont.load_default()
-        except Exception as e:
-            print(f"[DEBUG] 字体加载失败，使用默认字体: {e}")
-            font = ImageFont.load_default()
-        
-        # 使用新的方法获取文本尺寸（兼容新版本PIL）
+                proc.stdin.write((mask * alpha // 255).astype(np.uint8).tobytes())
+    except BrokenPipeError:
+        # ffmpeg 提前退出，错误信息见下方的返回码与 stderr
+        pass
+    except BaseException:
+        # 其他任何异常都不能留下孤儿 ffmpeg 进程
+        proc.kill()
+        proc.wait()
+        proc.stderr.close()
+        raise
+    finally:
         try:
-            # 新版本PIL使用textlength和getbbox
-            bbox = draw.textbbox((0, 0), video_name, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except:
-            # 如果失败，默认一个尺寸
-            text_width, text_height = 100, 20
-        print(f"[DEBUG] 文本尺寸: {text_width}x{text_height}")
-        
-        position = ((width - text_width) // 2, (height - text_height) // 2)
-        print(f"[DEBUG] 文本位置: {position}")
-        
-        # 绘制文本，应用透明度
-        draw.text(position, video_name, fill=(alpha, alpha, alpha), font=font)
-        
-        # 保存帧
-        frame_path = os.path.join(temp_frames_dir, f"frame_{frame:04d}.png")
-        print(f"[DEBUG] 保存帧: {frame_path}")
-        image.save(frame_path)
-    
-    # 创建视频片段
-    image_files = [os.path.join(temp_frames_dir, f"frame_{i:04d}.png") for i in range(int(duration * fps))]
-    print(f"[DEBUG] 图像文件列表生成完成，共 {len(image_files)} 个文件")
-    
-    # 创建静音音频（直接用moviepy生成）
-    duration = 2.0
-    fps = TRANSCODE_PARAMS['fps']
-    def make_silence(t):
-        return 0.0
-    try:
-        from moviepy import AudioClip
-        print("[DEBUG] 创建静音音频")
-        audio = AudioClip(make_silence, duration=duration, fps=44100)
-    except ImportError:
-        print("[DEBUG] 无法创建音频")
-        audio = None
-    
-    # 从图像序列创建视频片段
-    print("[DEBUG] 从图像序列创建视频剪辑")
-    clip = ImageSequenceClip(image_files, fps=fps)
-    
-    # 写入文件（直接包含音频）
-    print(f"[DEBUG] 写入视频文件: {gap_seg}")
-    if audio:
-        clip.write_videofile(gap_seg, fps=fps, codec='libx264', audio_codec='aac', bitrate="1000k", audio=audio)
+            proc.stdin.close()
+        except OSError:
+            pass
+    stderr_text = proc.stderr.read().decode('utf-8', errors='ignore').strip()
+    proc.stderr.close()
+    returncode = proc.wait()
+    if returncode != 0:
+        raise RuntimeError(f"生成间隔片段失败（ffmpeg 返回码 {returncode}）：{stderr_text[-2000:]}")
+
+    logger.debug("间隔片段生成完成: %s", gap_seg)
+    return gap_seg
+
+
+def _hw_device_args(encoder: str, for_decode: bool = True) -> List[str]:
+    """硬件编码器所需的设备参数；for_decode=False 时输入不是可硬解的文件（如 rawvideo 管道）"""
+    args: List[str] = []
+    if encoder.endswith('_vaapi'):
+        from utils import get_vaapi_device_path
+        vaapi_dev = get_vaapi_device_path()
+        if vaapi_dev:
+            args += ['-vaapi_device', vaapi_dev]
+            logger.debug("VAAPI设备: %s", vaapi_dev)
+    elif encoder.endswith('_qsv'):
+        if for_decode:
+            args += ['-hwaccel', 'qsv']
+        else:
+            args += ['-init_hw_device', 'qsv=hw', '-filter_hw_device', 'hw']
+        logger.debug("QSV硬件加速")
+    return args
+
+
+def color_filter(in_range: str | None = None) -> str:
+    """把帧转换为段的色彩矩阵与范围；in_range 指定输入范围（默认取帧自身的标记）"""
+    options = f"out_color_matrix={TRANSCODE_PARAMS['color_space']}:out_range={TRANSCODE_PARAMS['color_range']}"
+    if in_range:
+        options = f"in_range={in_range}:" + options
+    return 'scale=' + options
+
+
+def color_args() -> List[str]:
+    """写入输出流的色彩标记（编码器据此生成 VUI），不随源文件的标记变化"""
+    space = TRANSCODE_PARAMS['color_space']
+    return ['-color_range', TRANSCODE_PARAMS['color_range'], '-colorspace', space,
+            '-color_primaries', space, '-color_trc', space]
+
+
+def _segment_encode_args(encoder: str, vf_filters: List[str], dst: str,
+                         audio_filter: str | None = None, in_range: str | None = None) -> List[str]:
+    """
+    统一的段输出参数：滤镜链、色彩转换与像素宽高比、帧率、像素格式、编码器与 TS 容器；
+    audio_filter 为可选的音频滤镜（如响度归一化），in_range 为输入帧的色彩范围（见 color_filter）。
+    """
+    # 像素宽高比同样写入 SPS：rawvideo 管道没有 SAR，源文件各不相同，统一为 1:1
+    vf_chain = list(vf_filters) + [color_filter(in_range), 'setsar=1']
+    if encoder.endswith('_vaapi'):
+        vf_chain += ['format=nv12', 'hwupload']
+    elif encoder.endswith('_qsv'):
+        vf_chain += ['format=nv12', 'hwupload=extra_hw_frames=64']
+    args: List[str] = []
+    if vf_chain:
+        args += ['-vf', ','.join(vf_chain)]
+    if audio_filter:
+        args += ['-af', audio_filter]
+    args += [
+        '-r', str(TRANSCODE_PARAMS['fps']),
+        '-vsync', 'cfr',
+    ]
+    if not (encoder.endswith('_vaapi') or encoder.endswith('_qsv')):
+        args += ['-pix_fmt', TRANSCODE_PARAMS['pix_fmt']]
+    args += color_args()
+    args += [
+        '-c:v', encoder,
+        '-b:v', TRANSCODE_PARAMS['bitrate'],
+        '-c:a', 'aac',
+        '-b:a', TRANSCODE_PARAMS['audio_bitrate'],
+        '-ar', str(TRANSCODE_PARAMS['audio_rate']),
+        '-ac', str(TRANSCODE_PARAMS['audio_channels']),
+        '-f', 'mpegts',
+        dst
+    ]
+    return args
+
+
+def build_transcode_cmd(src: str, dst: str, encoder: str, width: int = 1920, height: int = 1080,
+                        audio_filter: str | None = None) -> List[str]:
+    """构造把任意源统一转码为 clip_XXX.ts 段格式的 ffmpeg 命令（与间隔片段共用输出参数，保证参数一致）"""
+    vf_filters: List[str] = []
+    if width != 1920 or height != 1080:
+        vf_filters.append("scale=1920:1080:force_original_aspect_ratio=decrease")
+        vf_filters.append("pad=1920:1080:(ow-iw)/2:(oh-ih)/2")
+    vf_filters.append(f"fps={TRANSCODE_PARAMS['fps']}")
+    logger.debug("视频滤镜: %s", vf_filters)
+    cmd: List[str] = ['ffmpeg', '-y']
+    cmd += _hw_device_args(encoder)
+    cmd += ['-i', src]
+    cmd += _segment_encode_args(encoder, vf_filters, dst, audio_filter)
+    return cmd
+
+
+# 各类硬件编码器同时打开的会话数有限（如消费级 NVENC 驱动限制并发数），按后缀设置并发上限
+ENCODER_SESSION_LIMITS = {
+    '_nvenc': 3,
+    '_amf': 2,
+    '_qsv': 2,
+    '_vaapi': 2,
+    '_videotoolbox': 2,
+}
+
+
+def get_transcode_workers(encoder: str, requested: int | None = None) -> int:
+    """计算转码并发数：优先使用参数，其次环境变量 BILI_TRANSCODE_WORKERS，再按编码器上限截断"""
+    workers = requested
+    if workers is None:
+        env_value = os.environ.get('BILI_TRANSCODE_WORKERS', '').strip()
+        if env_value.isdigit() and int(env_value) > 0:
+            workers = int(env_value)
+    if workers is None:
+        # libx264/libx265 本身多线程，每个进程大约分配 4 个核心
+        workers = max(1, (os.cpu_count() or 1) // 4)
+    for suffix, limit in ENCODER_SESSION_LIMITS.items():
+        if encoder.endswith(suffix):
+            workers = min(workers, limit)
+            break
+    workers = max(1, workers)
+    logger.debug("编码器 %s 的转码并发数: %s", encoder, workers)
+    return workers
+
+
+class ClipJob(NamedTuple):
+    """一个视频片段的处理任务：mode 为 'transcode'（完整转码）、'remux'（音视频直接复制）或 'remux_audio'（视频复制、音频重编码）"""
+    src: str
+    dst: str
+    width: int = 1920
+    height: int = 1080
+    mode: str = 'transcode'
+    # 响度归一化第二遍的音频滤镜（loudness.loudnorm_filter），None 表示不归一化
+    loudnorm: str | None = None
+
+
+def with_loudnorm(job: ClipJob, measured: dict | None) -> ClipJob:
+    """
+    把首遍测量值折叠进片段任务：音频必须重编码，因此 'remux' 降为 'remux_audio'（视频仍直接复制）。
+    没有测量值（无音轨或测量失败）时原样返回。
+    """
+    if not measured:
+        return job
+    from loudness import loudnorm_filter
+    mode = 'remux_audio' if job.mode == 'remux' else job.mode
+    return job._replace(mode=mode, loudnorm=loudnorm_filter(measured, TRANSCODE_PARAMS['audio_rate']))
+
+
+def target_codec(encoder: str) -> str:
+    """编码器输出的视频编码（用于判断源视频能否直接复制）"""
+    return 'hevc' if encoder.startswith('hevc_') or encoder == 'libx265' else 'h264'
+
+
+def plan_clip_mode(info, encoder: str, reference: tuple | None = None) -> str:
+    """
+    根据探测结果决定片段处理方式：分辨率、帧率、像素格式、编码（及参考段的 profile、level）均与目标段一致时
+    只做封装转换；音频不符合段格式时只重编码音频；其余情况完整转码。
+    """
+    if info is None or not info.has_video or not info.has_audio:
+        return 'transcode'
+    fps = info.fps
+    if (info.width, info.height) != (1920, 1080) or fps is None or abs(fps - TRANSCODE_PARAMS['fps']) > 0.01:
+        return 'transcode'
+    if info.pix_fmt != TRANSCODE_PARAMS['pix_fmt'] or info.video_codec != target_codec(encoder):
+        return 'transcode'
+    if reference is not None and reference[:VIDEO_PARAMS_LEN] != segment_signature(info)[:VIDEO_PARAMS_LEN]:
+        # 与间隔片段的视频参数（含 profile、level、帧率表示）不完全一致时，直接复制会破坏流复制拼接；
+        # 参数集本身的差异在封装为 TS 段后比较，不一致的片段单独重新转码（retranscode_mismatched_remuxes）
+        return 'transcode'
+    audio_ok = (
+        info.audio_codec == 'aac'
+        and info.sample_rate == TRANSCODE_PARAMS['audio_rate']
+        and info.channels == TRANSCODE_PARAMS['audio_channels']
+    )
+    return 'remux' if audio_ok else 'remux_audio'
+
+
+def build_remux_cmd(src: str, dst: str, copy_audio: bool, audio_filter: str | None = None) -> List[str]:
+    """已符合目标格式的源只做封装转换为 TS 段：视频 -c:v copy，音频按需复制或重编码"""
+    cmd: List[str] = ['ffmpeg', '-y', '-i', src, '-map', '0:v:0', '-map', '0:a:0', '-c:v', 'copy']
+    if copy_audio:
+        cmd += ['-c:a', 'copy']
     else:
-        clip.write_videofile(gap_seg, fps=fps, codec='libx264', audio_codec='aac', bitrate="1000k")
-    
-    # 清理临时文件
+        if audio_filter:
+            cmd += ['-af', audio_filter]
+        cmd += [
+            '-c:a', 'aac',
+            '-b:a', TRANSCODE_PARAMS['audio_bitrate'],
+            '-ar', str(TRANSCODE_PARAMS['audio_rate']),
+            '-ac', str(TRANSCODE_PARAMS['audio_channels']),
+        ]
+    cmd += ['-f', 'mpegts', dst]
+    return cmd
+
+
+def build_clip_cmd(job: ClipJob, encoder: str) -> List[str]:
+    if job.mode == 'transcode':
+        return build_transcode_cmd(job.src, job.dst, encoder, job.width, job.height, job.loudnorm)
+    return build_remux_cmd(job.src, job.dst, copy_audio=job.mode == 'remux', audio_filter=job.loudnorm)
+
+
+def clip_params(job: ClipJob, encoder: str) -> dict:
+    """决定一个 clip_XXX.ts 内容的全部输入与参数（用于合并清单判断产物是否可复用）"""
+    return {
+        'source': source_fingerprint(job.src),
+        'encoder': encoder,
+        'resolution': [job.width, job.height],
+        'mode': job.mode,
+        'transcode': TRANSCODE_PARAMS,
+        'loudnorm': job.loudnorm,
+    }
+
+
+def clip_cache_key(cache, job: ClipJob, encoder: str) -> str | None:
+    """
+    转码片段缓存键：源文件内容指纹 + 决定输出的全部参数（编码器、分辨率、处理方式、段编码参数、响度滤镜）。
+    纯封装转换（'remux'）重做的代价低于占用缓存空间，不缓存，返回 None。
+    """
+    from merge_manifest import content_fingerprint
+    if job.mode == 'remux':
+        return None
+    digest = content_fingerprint(job.src)
+    if digest is None:
+        return None
+    return cache.make_key('clip', digest, encoder, [job.width, job.height], job.mode, TRANSCODE_PARAMS, job.loudnorm)
+
+
+def restore_cached_clip(job: ClipJob, encoder: str, cache) -> bool:
+    """转码缓存命中时把缓存片段链接到 job.dst，返回是否命中"""
+    from utils import link_or_copy
+    key = clip_cache_key(cache, job, encoder) if cache is not None else None
+    cached = cache.lookup(key) if key else None
+    if not cached:
+        return False
+    link_or_copy(cached, job.dst)
+    logger.debug("转码缓存命中: %s -> %s", job.src, job.dst)
+    return True
+
+
+def run_clip_job(job: ClipJob, encoder: str, manifest: MergeManifest | None = None,
+                 on_progress=None, duration: float | None = None, cache=None) -> str:
+    """
+    执行单个片段任务并记入清单；清单中已完成且参数一致时直接返回，转码缓存（cache）命中时直接链接。
+    失败抛出 FFmpegError。on_progress(FFmpegProgress) 接收流式进度，duration 为源时长（用于百分比与 ETA）。
+    """
+    from progress import run_with_progress
+    if manifest is not None and manifest.lookup(_artifact_name(job.dst), clip_params(job, encoder)):
+        logger.debug("片段已完成，跳过: %s", job.dst)
+        return job.dst
+    if restore_cached_clip(job, encoder, cache):
+        if manifest is not None:
+            manifest.record(_artifact_name(job.dst), clip_params(job, encoder), [job.dst])
+        return job.dst
+    # dst 可能是上次从缓存链接来的硬链接，先删除再写，避免改写缓存中的同一 inode
+    if os.path.lexists(job.dst):
+        os.remove(job.dst)
+    cmd = build_clip_cmd(job, encoder)
+    cmd[1:1] = ['-hide_banner', '-loglevel', 'error']
+    logger.debug("FFmpeg命令: %s", ' '.join(cmd))
+    run_with_progress(cmd, total=duration, on_progress=on_progress)
+    key = clip_cache_key(cache, job, encoder) if cache is not None else None
+    if key:
+        cache.store(key, job.dst)
+    if manifest is not None:
+        manifest.record(_artifact_name(job.dst), clip_params(job, encoder), [job.dst])
+    return job.dst
+
+
+def transcode_clips(jobs: List[ClipJob], encoder: str, max_workers: int | None = None, manifest: MergeManifest | None = None,
+                    cache=None) -> Tuple[Dict[int, str], Dict[int, str]]:
+    """
+    并发执行片段任务（完整转码或封装转换）。
+    返回 (成功: 索引 -> 输出路径, 失败: 索引 -> 错误信息)；按索引取结果即可保持原始顺序，
+    单个片段失败不会影响其它已完成的片段。提供 manifest 时跳过清单中已完成的片段，
+    提供 cache（segment_cache.get_clip_cache）时直接复用其它合并中已转码过的片段。
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    done: Dict[int, str] = {}
+    failures: Dict[int, str] = {}
+    pending: List[int] = []
+    for index, job in enumerate(jobs):
+        if manifest is not None and manifest.lookup(_artifact_name(job.dst), clip_params(job, encoder)):
+            done[index] = job.dst
+        else:
+            pending.append(index)
+    if done:
+        print(f"♻️ {len(done)} 个片段已在上次运行中完成，跳过转码")
+    if cache is not None:
+        hits = [index for index in pending if restore_cached_clip(jobs[index], encoder, cache)]
+        for index in hits:
+            done[index] = jobs[index].dst
+            if manifest is not None:
+                manifest.record(_artifact_name(jobs[index].dst), clip_params(jobs[index], encoder), [jobs[index].dst])
+        pending = [index for index in pending if index not in done]
+        if hits:
+            print(f"♻️ {len(hits)} 个片段命中转码缓存，无需重新转码")
+    if not pending:
+        return done, failures
+    workers = min(get_transcode_workers(encoder, max_workers), len(pending))
+    # 源时长来自探测缓存，用于汇总进度与预计剩余时间
+    from progress import ProgressAggregator
+    infos = probe_many([jobs[index].src for index in pending])
+    durations = {index: infos[jobs[index].src].duration if infos.get(jobs[index].src) else 0.0 for index in pending}
+    tracker = ProgressAggregator("转码进度", durations)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_clip_job, jobs[index], encoder, manifest, tracker.report(index), durations[index] or None,
+                        cache): index
+            for index in pending
+        }
+        finished = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            src = jobs[index].src
+            finished += 1
+            try:
+                done[index] = future.result()
+                print(f"🎞️  [{finished}/{len(pending)}] 转码完成：{os.path.basename(src)}")
+            except Exception as e:
+                failures[index] = str(e)
+                print(f"❌ [{finished}/{len(pending)}] 转码失败：{os.path.basename(src)}")
+    return done, failures
+
+
+def _artifact_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def gap_cache_key(cache, video_name: str, fontfile: str | None, encoder: str) -> str:
+    """标题卡缓存键：标题、字体、分辨率、帧率、编码器、时长及段编码参数"""
+    return cache.make_key(
+        'gap', video_name, fontfile, (1920, 1080), TRANSCODE_PARAMS['fps'], encoder, GAP_SECONDS,
+        TRANSCODE_PARAMS['bitrate'], TRANSCODE_PARAMS['pix_fmt'],
+        TRANSCODE_PARAMS['color_space'], TRANSCODE_PARAMS['color_range'],
+        TRANSCODE_PARAMS['audio_bitrate'], TRANSCODE_PARAMS['audio_rate'], TRANSCODE_PARAMS['audio_channels'],
+    )
+
+
+def prepare_gap(tmpdir: str, index: int, video_name: str, encoder: str, fontfile: str | None, cache, manifest: MergeManifest | None = None) -> str:
+    """
+    准备一个间隔片段：清单中已完成的直接复用；持久缓存命中则链接到工作目录；否则渲染并写入缓存。
+    """
+    key = gap_cache_key(cache, video_name, fontfile, encoder)
+    gap_path = os.path.join(tmpdir, f'gap_{index:03d}.ts')
+    if manifest is not None and manifest.lookup(_artifact_name(gap_path), {'gap': key}):
+        return gap_path
+    cached = cache.lookup(key)
+    if cached:
+        linked: List[str] = []
+        insert_gap(linked, tmpdir, cached, index)
+        gap_path = linked[0]
+    else:
+        # gap_path 可能是上次从缓存链接来的硬链接，先删除再写，避免改写缓存中的同一 inode
+        if os.path.lexists(gap_path):
+            os.remove(gap_path)
+        gap_path = generate_gap_segment(tmpdir, index, video_name, fontfile, encoder)
+        cache.store(key, gap_path)
+    if manifest is not None:
+        manifest.record(_artifact_name(gap_path), {'gap': key}, [gap_path])
+    return gap_path
+
+
+def generate_gap_segments(tmpdir: str, video_names: List[str], encoder: str, max_workers: int | None = None, manifest: MergeManifest | None = None) -> Tuple[Dict[int, str], Dict[int, str]]:
+    """
+    并发生成所有间隔片段，返回 (成功: 索引 -> 路径, 失败: 索引 -> 错误信息)。
+    清单中已完成的直接复用；已在持久缓存中的标题卡直接链接到工作目录，不再重新渲染。
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from segment_cache import get_gap_cache
+
+    done: Dict[int, str] = {}
+    failures: Dict[int, str] = {}
+    if not video_names:
+        return done, failures
+    cache = get_gap_cache()
+    fontfile = resolve_title_font()
+
+    workers = min(get_transcode_workers(encoder, max_workers), len(video_names))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(prepare_gap, tmpdir, i, name, encoder, fontfile, cache, manifest): i
+            for i, name in enumerate(video_names)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                done[i] = future.result()
+                print(f"🎨 间隔片段 {len(done)}/{len(video_names)}：{video_names[i]}")
+            except Exception as e:
+                failures[i] = str(e)
+    return done, failures
+
+
+# 段签名包含的 MediaInfo 字段。前 VIDEO_PARAMS_LEN 项是与容器无关的视频参数；其后的 extradata 哈希随容器而变
+# （MP4 为 avcC/hvcC，TS 为 Annex B 参数集），只在同为 TS 段的签名之间比较
+SIGNATURE_FIELDS = (
+    'video_codec', 'video_profile', 'video_level', 'width', 'height', 'pix_fmt', 'frame_rate',
+    'video_extradata_hash',
+    'audio_codec', 'sample_rate', 'channels',
+)
+VIDEO_PARAMS_LEN = 7
+
+
+def segment_signature(info) -> tuple | None:
+    """由探测结果得到段的编码参数签名（视频/音频流）；无视频流返回 None"""
+    if info is None or not info.has_video:
+        return None
+    return tuple(getattr(info, name) for name in SIGNATURE_FIELDS)
+
+
+def incompatibility_reason(segments: List[str]) -> str | None:
+    """所有段的编码参数（含 level 与 SPS/PPS 哈希）完全一致时返回 None，否则返回不能流复制拼接的原因"""
+    if not segments:
+        return "没有可拼接的段"
+    infos = probe_many(segments)
+    first = first_seg = None
+    for seg in segments:
+        signature = segment_signature(infos.get(seg))
+        logger.debug("段参数签名 %s: %s", os.path.basename(seg), signature)
+        if signature is None:
+            return f"{os.path.basename(seg)} 探测失败或没有视频流"
+        if first is None:
+            first, first_seg = signature, seg
+        elif signature != first:
+            diff = ', '.join(
+                f"{name}={a!r}/{b!r}" for name, a, b in zip(SIGNATURE_FIELDS, first, signature) if a != b)
+            return f"{os.path.basename(first_seg)} 与 {os.path.basename(seg)} 参数不一致（{diff}）"
+    return None
+
+
+def segments_compatible(segments: List[str]) -> bool:
+    """所有段的编码参数完全一致时，才能直接流复制拼接（原因见 incompatibility_reason）"""
+    return incompatibility_reason(segments) is None
+
+
+def _mp3_output_args(audio_output: str, source: str) -> List[str]:
+    """附加的 MP3 输出（与视频输出在同一个 ffmpeg 进程内完成，不再单独解码一遍）"""
+    return ['-map', source, '-vn', '-c:a', 'libmp3lame', '-b:a', '320k', audio_output]
+
+
+def write_concat_list(segments: List[str], list_path: str) -> str:
+    """写入 concat demuxer 的文件列表（路径转义单引号），返回列表路径"""
+    logger.debug("写入拼接列表: %s", list_path)
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for seg in segments:
+            escaped = os.path.abspath(seg).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def concat_segments_copy(segments: List[str], output: str, list_path: str, audio_output: str | None = None) -> None:
+    """
+    使用 ffmpeg concat demuxer 以 -c copy 拼接参数一致的段，不做任何重新编码。
+    指定 audio_output 时同一进程顺带把音轨编码为 MP3。
+    """
+    from utils import run_ffmpeg
+    write_concat_list(segments, list_path)
+    cmd = [
+        'ffmpeg', '-y',
+        '-f', 'concat', '-safe', '0',
+        '-i', list_path,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c', 'copy',
+        '-bsf:a', 'aac_adtstoasc',
+        '-movflags', '+faststart',
+        output
+    ]
+    outputs = [output]
+    if audio_output:
+        cmd += _mp3_output_args(audio_output, '0:a:0')
+        outputs.append(audio_output)
+    run_ffmpeg(cmd, output_paths=outputs)
+
+
+def software_fallback_encoder(encoder: str) -> str:
+    """硬件编码器对应的 CPU 编码器（同一编码标准）"""
+    return 'libx265' if encoder.startswith('hevc_') or encoder == 'libx265' else 'libx264'
+
+
+def _final_encoder_args(encoder: str) -> List[str]:
+    """最终输出的编码参数（按编码器类型附加质量选项）"""
+    args = ['-c:v', encoder]
+    if encoder.endswith('_nvenc'):
+        args += ['-preset', 'p7', '-tune', 'hq']
+    elif encoder.endswith('_amf'):
+        args += ['-quality', 'quality']
+    elif encoder.endswith('_qsv'):
+        args += ['-preset', 'medium']
+    elif encoder in ('libx264', 'libx265'):
+        args += ['-preset', 'ultrafast']
+    args += ['-b:v', '5000k', '-c:a', 'aac', '-b:a', TRANSCODE_PARAMS['audio_bitrate']]
+    return args
+
+
+def build_concat_encode_cmd(list_path: str, output: str, encoder: str, has_audio: bool = True,
+                            audio_output: str | None = None) -> List[str]:
+    """
+    构造单次编码拼接命令：各段已在转码时统一为段格式，concat demuxer 把它们作为一个输入连续解码，
+    只有一个解码器、不再逐段做缩放/补边等归一化，直接交给所选编码器；整个时间线只编码一次。
+    音频经 aresample=async=1 按时间戳补齐（个别没有音轨的段以静音填充）。
+    """
+    cmd: List[str] = ['ffmpeg', '-y']
+    cmd += _hw_device_args(encoder, for_decode=False)
+    cmd += ['-f', 'concat', '-safe', '0', '-i', list_path]
+    filters: List[str] = []
+    video_out = '0:v:0'
+    if encoder.endswith('_vaapi'):
+        filters.append("[0:v:0]format=nv12,hwupload[vout]")
+        video_out = '[vout]'
+    elif encoder.endswith('_qsv'):
+        filters.append("[0:v:0]format=nv12,hwupload=extra_hw_frames=64[vout]")
+        video_out = '[vout]'
+    if has_audio:
+        if audio_output:
+            filters.append("[0:a:0]aresample=async=1,asplit=2[aout][amp3]")
+        else:
+            filters.append("[0:a:0]aresample=async=1[aout]")
+    if filters:
+        cmd += ['-filter_complex', ';'.join(filters)]
+    cmd += ['-map', video_out]
+    if has_audio:
+        cmd += ['-map', '[aout]']
+    if not (encoder.endswith('_vaapi') or encoder.endswith('_qsv')):
+        cmd += ['-pix_fmt', TRANSCODE_PARAMS['pix_fmt']]
+    cmd += color_args()
+    cmd += _final_encoder_args(encoder)
+    cmd += ['-movflags', '+faststart', output]
+    if has_audio and audio_output:
+        cmd += _mp3_output_args(audio_output, '[amp3]')
+    return cmd
+
+
+def encode_concat(segments: List[str], output: str, encoder: str, audio_output: str | None = None) -> str:
+    """
+    用所选编码器一次编码拼接所有段；仅当硬件编码确实失败时才回退到同标准的 CPU 编码器。
+    指定 audio_output 时同一进程顺带输出 MP3。返回实际使用的编码器。
+    """
+    from utils import run_ffmpeg
+    # concat demuxer 的流布局取自第一个段
+    first = probe_many(segments[:1]).get(segments[0]) if segments else None
+    has_audio = first is not None and first.has_audio
+    list_path = write_concat_list(segments, os.path.splitext(output)[0] + '_concat_list.txt')
+    outputs = [output] + ([audio_output] if audio_output else [])
+    cmd = build_concat_encode_cmd(list_path, output, encoder, has_audio, audio_output)
     try:
-        print("[DEBUG] 清理临时文件")
-        for f in os.listdir(temp_frames_dir):
-            os.remove(os.path.join(temp_frames_dir, f))
-        os.rmdir(temp_frames_dir)
-    except Exception as e:
-        print(f"[DEBUG] 清理临时文件时出错: {e}")
-        pass
-    
-    print(f"[DEBUG] 间隔片段生成完成: {gap_seg}")
-    return gap_seg
+        print(f"🔄 使用编码器 {encoder} 一次编码拼接...")
+        run_ffmpeg(cmd, output_paths=outputs)
+        return encoder
+    except subprocess.CalledProcessError as e:
+        fallback = software_fallback_encoder(encoder)
+        if fallback == encoder:
+            raise
+        print(f"⚠️ 编码器 {encoder} 编码失败，回退到 CPU 编码器 {fallback}: {e}")
+    run_ffmpeg(build_concat_encode_cmd(list_path, output, fallback, has_audio, audio_output), output_paths=outputs)
+    return fallback
 
-def merge_videos_with_best_hevc(download_dir: str | None = None, encoder: str | None = None) -> bool:
-    print(f"[DEBUG] 开始合并视频，下载目录: {download_dir}, 编码器: {encoder}")
-    # 检查 moviepy 是否可用
+
+def retranscode_mismatched_remuxes(clip_jobs: List[ClipJob], gap_ts_paths: Dict[int, str], ts_paths: Dict[int, str],
+                                   encoder: str, manifest: MergeManifest | None = None, cache=None) -> List[int]:
+    """
+    封装转换得到的片段沿用源的参数集（SPS/PPS），与参考段不一致时只把这些片段改为完整转码，
+    而不是让整条时间线走编码拼接。参考段为第一个间隔片段，没有间隔片段时为第一个完整转码的片段。
+    就地更新 clip_jobs，返回重新转码成功的索引。
+    """
+    remuxed = [i for i in sorted(ts_paths) if clip_jobs[i].mode != 'transcode']
+    if not remuxed:
+        return []
+    if gap_ts_paths:
+        reference_path = gap_ts_paths[min(gap_ts_paths)]
+    else:
+        reference_path = next((ts_paths[i] for i in sorted(ts_paths) if clip_jobs[i].mode == 'transcode'), None)
+    if reference_path is None:
+        return []
+    infos = probe_many([reference_path] + [ts_paths[i] for i in remuxed])
+    reference = segment_signature(infos.get(reference_path))
+    redone: List[int] = []
+    for i in remuxed:
+        if segment_signature(infos.get(ts_paths[i])) == reference:
+            continue
+        job = clip_jobs[i]._replace(mode='transcode')
+        logger.info("封装转换的片段与参考段参数集不一致，改为完整转码: %s", os.path.basename(job.src))
+        try:
+            run_clip_job(job, encoder, manifest, cache=cache)
+        except Exception as e:
+            print(f"⚠️ 片段重新转码失败，保留封装转换结果：{os.path.basename(job.src)}: {e}")
+            continue
+        clip_jobs[i] = job
+        redone.append(i)
+    return redone
+
+
+def assemble_segments(tmpdir: str, files: List[str], clip_jobs: List[ClipJob], gap_ts_paths: Dict[int, str], ts_paths: Dict[int, str], encoder: str, manifest: MergeManifest) -> Tuple[str, str | None, str | None]:
+    """
+    按原始顺序拼接已完成的片段，并在同一进程中输出 MP3、合并字幕。
+    参数集与其它段不一致的封装转换片段先单独重新转码，保证拼接能走流复制。
+    返回 (merged.mp4 路径, MP3 路径或 None, 字幕路径或 None)。
+    """
+    from segment_cache import get_clip_cache
+    redone = retranscode_mismatched_remuxes(clip_jobs, gap_ts_paths, ts_paths, encoder, manifest, get_clip_cache())
+    if redone:
+        print(f"🔁 {len(redone)} 个封装转换的片段参数集与其它段不一致，已单独重新转码")
+    # 按原始顺序排列所有段：每个视频前加间隔片段；字幕索引映射到成功片段中的位置
+    # 时长优先取清单中的记录，缺失的才探测并写回清单
+    known_durations: Dict[int, float] = {}
+    for i, ts in ts_paths.items():
+        entry = manifest.lookup(_artifact_name(ts), clip_params(clip_jobs[i], encoder))
+        if entry and entry.get('duration'):
+            known_durations[i] = entry['duration']
+    ts_infos = probe_many([ts for i, ts in ts_paths.items() if i not in known_durations])
+    for i, ts in ts_paths.items():
+        if i not in known_durations:
+            ts_info = ts_infos.get(ts)
+            known_durations[i] = ts_info.duration if ts_info else 0.0
+            manifest.update(_artifact_name(ts), duration=known_durations[i])
+
+    clip_durations: List[float] = []
+    gaps_before: List[float] = []
+    subtitle_clips: List[tuple] = []
+    segments: List[str] = []
+    for i in range(len(files)):
+        if i not in ts_paths:
+            continue
+        subtitle = find_subtitle(files[i])
+        if subtitle:
+            logger.debug("找到字幕文件: %s", subtitle)
+            subtitle_clips.append((subtitle, len(clip_durations), files[i]))
+        if i in gap_ts_paths:
+            segments.append(gap_ts_paths[i])
+        gaps_before.append(GAP_SECONDS if i in gap_ts_paths else 0.0)
+        segments.append(ts_paths[i])
+        duration = known_durations[i]
+        logger.debug("剪辑时长: %s 秒", duration)
+        clip_durations.append(duration)
+
+    # 输出文件路径
+    output = os.path.join(tmpdir, "merged.mp4")
+    logger.debug("输出文件路径: %s", output)
+
+    # MP3 作为最终拼接进程的第二个输出一并生成
+    has_audio = any(info is not None and info.has_audio for info in probe_many(segments).values())
+    audio_path = os.path.splitext(output)[0] + ".mp3" if has_audio else None
+    logger.debug("音频路径: %s", audio_path)
+
+    concat_params = {
+        'segments': [source_fingerprint(seg) for seg in segments],
+        'encoder': encoder,
+        'audio': audio_path is not None,
+    }
+    concat_outputs = [output] + ([audio_path] if audio_path else [])
+    # concat_mode 记入清单（'copy' 或 'encode'），可据此确认实际走的拼接路径
+    previous = manifest.lookup('merged', concat_params)
+    if previous:
+        print("♻️ 拼接结果已在上次运行中完成，跳过拼接")
+        concat_mode = previous.get('concat_mode', 'copy')
+    else:
+        concat_mode = 'encode'
+        reason = incompatibility_reason(segments)
+        if reason is None:
+            print("\n🎬 正在拼接视频（流复制，无需重新编码）...")
+            try:
+                concat_segments_copy(segments, output, os.path.join(tmpdir, "concat_list.txt"), audio_path)
+                concat_mode = 'copy'
+            except Exception as e:
+                reason = f"流复制拼接失败：{e}"
+                traceback.print_exc()
+        if concat_mode == 'encode':
+            logger.info("改为一次编码拼接，原因：%s", reason)
+            print("\n🎬 正在拼接视频（一次编码）...")
+            encode_concat(segments, output, encoder, audio_path)
+    manifest.record('merged', concat_params, concat_outputs, concat_mode=concat_mode)
+    if audio_path:
+        print(f"✅ 音轨分离完成：{audio_path}")
+    else:
+        print("ℹ️ 视频没有音频轨道，跳过音轨分离")
+
+    merged_subtitle = None
+    if subtitle_clips:
+        from subtitles import SubtitleSource, clip_start_offsets, merge_subtitles
+        merged_subtitle = os.path.splitext(output)[0] + ".ass"
+        print(f"⚠ 正在按精确累计时长合并字幕，并包含每段之前的 {GAP_SECONDS:g} 秒间隔...")
+        offsets = clip_start_offsets(clip_durations, gaps_before)
+        # MicroDVD 字幕按源视频帧率换算（探测结果已缓存）
+        source_infos = probe_many([src for _, _, src in subtitle_clips])
+        subtitle_sources = [
+            SubtitleSource(sub, offsets[k], source_infos[src].fps if source_infos.get(src) else None)
+            for sub, k, src in subtitle_clips
+        ]
+        merge_subtitles(subtitle_sources, merged_subtitle)
+        print(f"✅ 字幕合并完成：{merged_subtitle}")
+    else:
+        print("ℹ️ 未检测到可合并的字幕文件。")
+
+    return output, audio_path, merged_subtitle
+
+
+def is_valid_output_name(name: str) -> bool:
+    return bool(name) and all(c not in name for c in r'\/:*?"<>|')
+
+
+def save_merge_outputs(output: str, audio_path: str | None, merged_subtitle: str | None,
+                       new_name: str | None = None, target_dir: str | None = None) -> Tuple[str | None, str | None, str | None]:
+    """
+    把合并结果移动到 target_dir（默认脚本所在目录），返回 (视频, 音频, 字幕) 的最终路径（未保存的为 None）。
+    未指定 new_name 时交互询问；指定了但不合法时抛出 ValueError。
+    """
+    if new_name is None:
+        print("\n📢 合并已完成，请输入合并后视频的新文件名（不含路径和扩展名，自动保存在脚本同一目录下）：")
+        while True:
+            new_name = input("请输入文件名（如 myvideo）：").strip()
+            logger.debug("用户输入文件名: %s", new_name)
+            if is_valid_output_name(new_name):
+                break
+            print("❌ 文件名无效，请重新输入（不能包含特殊字符）")
+    elif not is_valid_output_name(new_name):
+        raise ValueError(f"文件名无效（不能包含特殊字符）: {new_name}")
+    base_dir = target_dir or os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(base_dir, exist_ok=True)
+    logger.debug("基础目录: %s", base_dir)
+
+    subtitle_target = audio_target = None
+    video_target = move_file(output, base_dir, new_name)
+    if video_target:
+        print(f"✅ 视频已保存为：{video_target}")
+        if merged_subtitle:
+            subtitle_target = move_file(merged_subtitle, base_dir, new_name)
+            if subtitle_target:
+                print(f"✅ 字幕已保存为：{subtitle_target}")
+        if audio_path:
+            audio_target = move_file(audio_path, base_dir, new_name)
+            if audio_target:
+                print(f"✅ 音频已保存为：{audio_target}")
+    return video_target, audio_target, subtitle_target
+
+
+class ClipPipeline:
+    """
+    流水线合并：每个源文件一到达就在工作线程中依次完成 探测 → 间隔片段 → 转码，
+    全部提交完毕后 finish() 等待最后一个片段完成并立即拼接。
+    """
+
+    def __init__(self, base_dir: str, encoder: str, max_workers: int | None = None, loudnorm: bool | None = None,
+                 work_name: str | None = None):
+        from concurrent.futures import ThreadPoolExecutor
+        from loudness import loudnorm_enabled
+        from segment_cache import get_clip_cache, get_gap_cache
+
+        self.tmpdir = work_dir_path(os.path.abspath(base_dir), work_name)
+        os.makedirs(self.tmpdir, exist_ok=True)
+        self.encoder = encoder
+        self.manifest = MergeManifest(self.tmpdir)
+        self.cache = get_gap_cache()
+        self.clip_cache = get_clip_cache()
+        self.fontfile = resolve_title_font()
+        self.loudnorm = loudnorm_enabled(loudnorm)
+        self._pool = ThreadPoolExecutor(max_workers=get_transcode_workers(encoder, max_workers))
+        self._items: List[tuple] = []
+
+    def submit(self, src: str, slot: int, order_key: tuple) -> None:
+        """提交一个源文件；slot 决定工作目录中的文件编号，order_key 决定最终拼接顺序"""
+        print(f"📥 加入流水线：{os.path.basename(src)}")
+        future = self._pool.submit(self._process, src, slot)
+        self._items.append((order_key, src, future))
+
+    def _process(self, src: str, slot: int) -> Tuple[str | None, ClipJob]:
+        from probe import probe_media
+        video_name = os.path.splitext(os.path.basename(src))[0]
+        gap = None
+        try:
+            gap = prepare_gap(self.tmpdir, slot, video_name, self.encoder, self.fontfile, self.cache, self.manifest)
+        except Exception as e:
+            print(f"⚠️ 间隔片段生成失败，将不插入该间隔：{video_name}: {e}")
+        info = probe_media(src)
+        reference = segment_signature(probe_media(gap)) if gap else None
+        res = info.resolution if info else None
+        width, height = res if res else (1920, 1080)
+        job = ClipJob(src, os.path.join(self.tmpdir, f"clip_{slot:03d}.ts"), width, height,
+                      plan_clip_mode(info, self.encoder, reference))
+        if self.loudnorm:
+            from loudness import measure_loudness
+            job = with_loudnorm(job, measure_loudness(src))
+        run_clip_job(job, self.encoder, self.manifest, cache=self.clip_cache)
+        print(f"🎞️  流水线片段完成：{video_name}")
+        return gap, job
+
+    def finish(self) -> Tuple[str, str | None, str | None] | None:
+        """等待所有片段完成，按 order_key 顺序拼接；没有可用片段时返回 None"""
+        from probe import save_probe_cache
+        self._pool.shutdown(wait=True)
+        save_probe_cache()
+        files: List[str] = []
+        clip_jobs: List[ClipJob] = []
+        gap_ts_paths: Dict[int, str] = {}
+        ts_paths: Dict[int, str] = {}
+        for order_key, src, future in sorted(self._items, key=lambda item: item[0]):
+            index = len(files)
+            files.append(src)
+            try:
+                gap, job = future.result()
+            except Exception as e:
+                print(f"❌ 转码失败，将跳过：{os.path.basename(src)}: {str(e).splitlines()[-1] if str(e) else ''}")
+                clip_jobs.append(ClipJob(src, ''))
+                continue
+            clip_jobs.append(job)
+            ts_paths[index] = job.dst
+            if gap:
+                gap_ts_paths[index] = gap
+        if not ts_paths:
+            print("❌ 没有可用的视频片段")
+            return None
+        return assemble_segments(self.tmpdir, files, clip_jobs, gap_ts_paths, ts_paths, self.encoder, self.manifest)
+
+
+def pipelined_merge(bv_list: List[str], save_path: str, sessdata: str, encoder: str,
+                    max_workers: int | None = None, skip_existing: bool = True,
+                    loudnorm: bool | None = None, work_name: str | None = None
+                    ) -> Tuple[list, Tuple[str, str | None, str | None] | None]:
+    """
+    无交互的流水线：每个 BV 下载完成即进入转码流水线，最后一个片段完成后立即拼接。
+    work_name 见 work_dir_path。返回 (下载结果列表, 合并结果或 None)。
+    """
+    from download import download_bvs, print_download_summary
+
+    pipeline = ClipPipeline(save_path, encoder, loudnorm=loudnorm, work_name=work_name)
+    extra_slots = [len(bv_list)]
+
+    def _on_result(result) -> None:
+        for k, path in enumerate(result.files):
+            if k == 0:
+                slot = result.index
+            else:
+                slot = extra_slots[0]
+                extra_slots[0] += 1
+            pipeline.submit(path, slot, (result.index, k))
+
+    results = download_bvs(bv_list, save_path, sessdata, max_workers=max_workers,
+                           on_result=_on_result, skip_existing=skip_existing)
+    print_download_summary(results)
+    return results, pipeline.finish()
+
+
+def run_pipelined_merge(encoder: str | None = None) -> bool:
+    """边下载边转码：每个 BV 下载完成即进入转码流水线，最后一个片段完成后立即拼接"""
+    from download import get_save_path, get_sessdata, read_bv_list
     try:
-        print("[DEBUG] 检查moviepy是否可用")
-        from moviepy import ImageClip, AudioFileClip, VideoFileClip, concatenate_videoclips, ImageSequenceClip
-        moviepy_available = True
-        print("[DEBUG] Moviepy可用")
-    except ImportError as e:
-        moviepy_available = False
-        print("❌ moviepy 库未安装，无法执行视频合并功能。")
-        print("请运行 'pip install -r requirements.txt' 安装所有依赖。")
-        print(f"[DEBUG] ImportError: {e}")
+        save_path = get_save_path()
+        sessdata = get_sessdata()
+        bv_list = read_bv_list()
+        if not bv_list:
+            print("❌ 未识别任何 BV")
+            return False
+        if encoder is None:
+            encoder = choose_encoder()
+        _, merged = pipelined_merge(bv_list, save_path, sessdata, encoder)
+        if merged is None:
+            return False
+        save_merge_outputs(*merged)
+        print("\n🎉 合并及保存全部完成！文件均已保存在脚本同一目录下。")
+        return True
+    except Exception as e:
+        print(f"❌ 程序运行失败：{e}")
+        traceback.print_exc()
         return False
-        
-    def work_dir_path(base_dir: str) -> str:
-        # 在源目录下创建工作目录，避免跨盘复制，提升性能
-        path = os.path.join(base_dir, '.merge_work')
-        print(f"[DEBUG] 工作目录路径: {path}")
-        return path
-        
-    def parse_selection(selection: str, upper_bound: int) -> List[int]:
-        # 解析类似 "1,3,5-7" 的输入，返回去重且按出现顺序的索引（0-based）
-        print(f"[DEBUG] 解析用户选择: {selection}, 上限: {upper_bound}")
-        tokens = [t.strip() for t in selection.split(',') if t.strip()]
-        result: List[int] = []
-        seen = set()
-        for tok in tokens:
-            if '-' in tok:
-                a, b = tok.split('-', 1)
-                print(f"[DEBUG] 解析范围: {a}-{b}")
-                if a.isdigit() and b.isdigit():
-                    start_i = int(a)
-                    end_i = int(b)
-                    if start_i <= end_i:
-                        for v in range(start_i, end_i + 1):
-                            idx0 = v - 1
-                            if 0 <= idx0 < upper_bound and idx0 not in seen:
-                                seen.add(idx0)
-                                result.append(idx0)
-                    else:
-                        for v in range(end_i, start_i + 1):
-                            idx0 = v - 1
-                            if 0 <= idx0 < upper_bound and idx0 not in seen:
-                                seen.add(idx0)
-                                result.append(idx0)
-            elif tok.isdigit():
-                idx0 = int(tok) - 1
-                print(f"[DEBUG] 解析单个数字: {tok} -> 索引 {idx0}")
-                if 0 <= idx0 < upper_bound and idx0 not in seen:
-                    seen.add(idx0)
-                    result.append(idx0)
-        print(f"[DEBUG] 解析结果: {result}")
-        return result
 
+
+def work_dir_path(base_dir: str, job: str | None = None) -> str:
+    # 在源目录下创建工作目录，避免跨盘复制，提升性能
+    # 给出 job（批处理任务的输出名）时每个任务使用自己的工作目录：同一下载目录上并行的任务不会互相覆盖片段与清单，
+    # 同名任务重新运行时仍能从清单续做
+    name = '.merge_work' if not job else '.merge_work_' + re.sub(r'[^\w.-]+', '_', job)
+    path = os.path.join(base_dir, name)
+    logger.debug("工作目录路径: %s", path)
+    return path
+
+
+def parse_selection(selection: str, upper_bound: int) -> List[int]:
+    """解析类似 "1,3,5-7" 的输入，返回去重且按出现顺序的索引（0-based）"""
+    logger.debug("解析用户选择: %s, 上限: %s", selection, upper_bound)
+    tokens = [t.strip() for t in selection.split(',') if t.strip()]
+    result: List[int] = []
+    seen = set()
+    for tok in tokens:
+        if '-' in tok:
+            a, b = tok.split('-', 1)
+            logger.debug("解析范围: %s-%s", a, b)
+            if a.isdigit() and b.isdigit():
+                start_i = int(a)
+                end_i = int(b)
+                if start_i <= end_i:
+                    for v in range(start_i, end_i + 1):
+                        idx0 = v - 1
+                        if 0 <= idx0 < upper_bound and idx0 not in seen:
+                            seen.add(idx0)
+                            result.append(idx0)
+                else:
+                    for v in range(end_i, start_i + 1):
+                        idx0 = v - 1
+                        if 0 <= idx0 < upper_bound and idx0 not in seen:
+                            seen.add(idx0)
+                            result.append(idx0)
+        elif tok.isdigit():
+            idx0 = int(tok) - 1
+            logger.debug("解析单个数字: %s -> 索引 %s", tok, idx0)
+            if 0 <= idx0 < upper_bound and idx0 not in seen:
+                seen.add(idx0)
+                result.append(idx0)
+    logger.debug("解析结果: %s", result)
+    return result
+
+
+def select_merge_files(download_dir: str, selection: str | None = None, audio_only: bool = False) -> List[str]:
+    """
+    无交互地选出要合并的文件：
+    'new'（默认）为最近一批下载（没有时退回全部），'all' 为全部候选，
+    其他值按 "1,3,5-7" 解析为候选列表（最近下载的在前）中的序号。
+    audio_only=True 时目录扫描的候选为音频文件。
+    """
+    from utils import AUDIO_FILE_EXTENSIONS, VIDEO_FILE_EXTENSIONS
+    all_files = get_merge_candidates(download_dir, AUDIO_FILE_EXTENSIONS if audio_only else VIDEO_FILE_EXTENSIONS)
+    selection = (selection or 'new').strip().lower()
+    if selection == 'all':
+        return all_files
+    if selection == 'new':
+        return get_last_download_files(download_dir) or all_files
+    idxs = parse_selection(selection, upper_bound=len(all_files))
+    if not idxs:
+        raise ValueError(f"无效的合并选择: {selection}")
+    return [all_files[i] for i in idxs]
+
+
+def merge_files(files: List[str], download_dir: str | None, encoder: str,
+                loudnorm: bool | None = None, work_name: str | None = None) -> Tuple[str, str | None, str | None] | None:
+    """
+    无交互地合并给定文件：间隔片段 → 转码 → 拼接。
+    loudnorm 为 True（默认读取 BILI_LOUDNORM）时各片段在转码时按 EBU R128 归一化响度；work_name 见 work_dir_path。
+    返回 (merged.mp4 路径, MP3 路径或 None, 字幕路径或 None)；没有可用片段时返回 None。
+    """
+    # 在源目录内直接工作，避免复制源文件
+    if download_dir is None:
+        # 若调用端未提供目录，则用所有文件的共同父目录
+        common_dir = os.path.dirname(files[0]) if files else os.path.dirname(os.path.abspath(__file__))
+    else:
+        common_dir = os.path.abspath(download_dir)
+    logger.debug("共同目录: %s", common_dir)
+    tmpdir = work_dir_path(common_dir, work_name)
+    logger.debug("创建工作目录: %s", tmpdir)
+    os.makedirs(tmpdir, exist_ok=True)
+    # 合并清单：记录已完成的产物，中断后重新运行时从第一个缺失/失效的产物继续
+    manifest = MergeManifest(tmpdir)
+    tmp_files: List[str] = list(files)
+    # 为每个视频生成带文件名的间隔片段（每个视频前都加），直接输出为 TS 段格式
+    video_names = [os.path.splitext(os.path.basename(fp))[0] for fp in files]
+    gap_ts_paths, gap_failures = generate_gap_segments(tmpdir, video_names, encoder, manifest=manifest)
+    for i, err in gap_failures.items():
+        print(f"⚠️ 间隔片段 {i+1} 生成失败，将不插入该间隔：{err}")
+
+    # 一次性并发探测所有源文件（命中缓存时不启动 ffprobe）
+    source_infos = probe_many(tmp_files)
+    # 以间隔片段的参数为参考，已符合目标段格式的源只做封装转换
+    reference = None
+    if gap_ts_paths:
+        first_gap = gap_ts_paths[min(gap_ts_paths)]
+        reference = segment_signature(probe_many([first_gap]).get(first_gap))
+    clip_jobs: List[ClipJob] = []
+    for i, f in enumerate(tmp_files):
+        ts = os.path.join(tmpdir, f"clip_{i:03d}.ts")
+        logger.debug("TS文件路径: %s", ts)
+        info = source_infos.get(f)
+        res = info.resolution if info else None
+        width, height = res if res else (1920, 1080)
+        mode = plan_clip_mode(info, encoder, reference)
+        logger.debug("视频分辨率: %sx%s, 处理方式: %s", width, height, mode)
+        clip_jobs.append(ClipJob(f, ts, width, height, mode))
+    from loudness import loudnorm_enabled
+    if loudnorm_enabled(loudnorm):
+        from loudness import measure_loudness_many
+        print("🔊 正在分析响度（已分析过的文件直接使用缓存）...")
+        measurements = measure_loudness_many(tmp_files)
+        clip_jobs = [with_loudnorm(job, measurements.get(job.src)) for job in clip_jobs]
+    remux_count = sum(1 for job in clip_jobs if job.mode != 'transcode')
+    if remux_count:
+        print(f"⚡ {remux_count} 个视频已符合目标格式，仅做封装转换")
+    print(f"\n🎞️  并发转码 {len(clip_jobs) - remux_count} 个视频...")
+    from segment_cache import get_clip_cache
+    ts_paths, clip_failures = transcode_clips(clip_jobs, encoder, manifest=manifest, cache=get_clip_cache())
+    if clip_failures:
+        print(f"\n⚠️ 以下 {len(clip_failures)} 个视频转码失败，将跳过（已完成的片段保留）：")
+        for i in sorted(clip_failures):
+            print(f"   • {os.path.basename(tmp_files[i])}: {clip_failures[i].splitlines()[-1] if clip_failures[i] else ''}")
+    if not ts_paths:
+        print("❌ 没有可用的视频片段")
+        return None
+
+    return assemble_segments(tmpdir, files, clip_jobs, gap_ts_paths, ts_paths, encoder, manifest)
+
+
+def merge_videos_with_best_hevc(download_dir: str | None = None, encoder: str | None = None) -> bool:
+    logger.debug("开始合并视频，下载目录: %s, 编码器: %s", download_dir, encoder)
     try:
-        print("[DEBUG] 获取最后下载的文件")
-        files = get_last_download_files()
+        logger.debug("获取最后下载的文件")
+        download_dir = download_dir or "./download"
+        files = get_last_download_files(download_dir)
+        all_files = get_merge_candidates(download_dir)
         if not files:
-            download_dir = download_dir or "./download"
-            print(f"[DEBUG] 未找到最后下载的文件，从目录获取: {download_dir}")
-            files = get_video_files(download_dir)
+            logger.debug("未找到最后下载的文件，从目录获取: %s", download_dir)
+            files = all_files
 
         print(f"\n🔎 找到以下视频文件：")
-        all_files = get_video_files(download_dir) if download_dir else []
-        print(f"[DEBUG] 所有文件数量: {len(all_files)}")
-        # 展示用列表：按创建时间倒序显示（Windows 下为创建时间）
-        display_files = sorted(all_files, key=os.path.getctime, reverse=True)
+        logger.debug("所有文件数量: %s", len(all_files))
+        # 展示用列表：最近下载的在前
+        display_files = list(all_files)
         is_new_file = {f: f in files for f in all_files} if files and all_files else {}
         for idx, f in enumerate(display_files):
             marker = " [新增]" if is_new_file.get(f) else ""
@@ -436,7 +1235,7 @@ def merge_videos_with_best_hevc(download_dir: str | None = None, encoder: str |
         if files and len(files) != len(all_files):
             print(f"\n detected {len(files)} new file(s).")
             choice = input("是否只合并新增文件？(Y/n，输入'n'将合并所有文件): ").strip().lower()
-            print(f"[DEBUG] 用户选择是否只合并新增文件: {choice}")
+            logger.debug("用户选择是否只合并新增文件: %s", choice)
             if choice != 'n':
                 default_files = files
                 just_new_only = True
@@ -448,14 +1247,14 @@ def merge_videos_with_best_hevc(download_dir: str | None = None, encoder: str |
         # 若已选择"只合并新增文件"，则不再进行手动选择
         if not just_new_only:
             manual_choice = input("是否手动选择要合并的文件？(y/N): ").strip().lower()
-            print(f"[DEBUG] 用户选择是否手动选择: {manual_choice}")
+            logger.debug("用户选择是否手动选择: %s", manual_choice)
             if manual_choice == 'y':
                 print("请输入要合并的序号（用逗号分隔，支持范围，如 1,3,5-7）。")
                 print("直接回车确认当前选择；继续输入可追加选择：")
                 selected_indices: List[int] = []
                 while True:
                     selection = input("序号（回车确认）：").strip()
-                    print(f"[DEBUG] 用户输入选择: {selection}")
+                    logger.debug("用户输入选择: %s", selection)
                     if not selection:
                         break
                     idxs = parse_selection(selection, upper_bound=len(display_files))
@@ -488,229 +1287,15 @@ def merge_videos_with_best_hevc(download_dir: str | None = None, encoder: str |
             return False
 
         if encoder is None:
-            print("[DEBUG] 编码器未指定，开始选择")
+            logger.debug("编码器未指定，开始选择")
             encoder = choose_encoder()
         else:
             print(f"🧠 合并流程全程将使用指定编码器：{encoder}")
 
-        # 在源目录内直接工作，避免复制源文件
-        if download_dir is None:
-            # 若调用端未提供目录，则用所有文件的共同父目录
-            common_dir = os.path.dirname(files[0]) if files else os.path.dirname(os.path.abspath(__file__))
-        else:
-            common_dir = os.path.abspath(download_dir)
-        print(f"[DEBUG] 共同目录: {common_dir}")
-        tmpdir = work_dir_path(common_dir)
-        print(f"[DEBUG] 创建工作目录: {tmpdir}")
-        os.makedirs(tmpdir, exist_ok=True)
-        # 静默工作目录日志
-        tmp_files: List[str] = list(files)
-        subtitle_entries: List[tuple] = []
-        # 为每个视频生成带文件名的间隔片段（每个视频前都加）
-        gap_segments = []
-        for i, file_path in enumerate(files):
-            video_name = os.path.splitext(os.path.basename(file_path))[0]
-            print(f"🎨 生成间隔片段 {i+1}/{len(files)}：{video_name}")
-            try:
-                seg_path = generate_gap_segment(tmpdir, i, video_name)
-                gap_segments.append(seg_path)
-            except Exception as e:
-                print(f"⚠️ 生成间隔片段失败：{e}")
-                traceback.print_exc()
-                raise
-        clip_durations: List[float] = []
-        ts_paths: Dict[int, str] = {}
-        for i, f in enumerate(tmp_files):
-            print(f"\n🎞️  [{i+1}/{len(tmp_files)}] 转码视频：{os.path.basename(f)}")
-            ts = os.path.join(tmpdir, f"clip_{i:03d}.ts")
-            print(f"[DEBUG] TS文件路径: {ts}")
-            subtitle = find_subtitle(files[i])
-            if subtitle:
-                print(f"[DEBUG] 找到字幕文件: {subtitle}")
-                subtitle_entries.append((subtitle, i))
-            res = get_video_resolution(f)
-            width, height = res if res else (1920, 1080)
-            print(f"[DEBUG] 视频分辨率: {width}x{height}")
-            vf_filters: List[str] = []
-            if width != 1920 or height != 1080:
-                vf_filters.append("scale=1920:1080:force_original_aspect_ratio=decrease")
-                vf_filters.append("pad=1920:1080:(ow-iw)/2:(oh-ih)/2")
-            vf_filters.append(f"fps={TRANSCODE_PARAMS['fps']}")
-            print(f"[DEBUG] 视频滤镜: {vf_filters}")
-            cmd: List[str] = ['ffmpeg', '-y']
-            if encoder.endswith('_vaapi'):
-                from utils import get_vaapi_device_path
-                vaapi_dev = get_vaapi_device_path()
-                if vaapi_dev:
-                    cmd += ['-vaapi_device', vaapi_dev]
-                    print(f"[DEBUG] VAAPI设备: {vaapi_dev}")
-            elif encoder.endswith('_qsv'):
-                cmd += ['-hwaccel', 'qsv']
-                print("[DEBUG] QSV硬件加速")
-            cmd += ['-i', f]
-            vf_chain = list(vf_filters)
-            if encoder.endswith('_vaapi'):
-                vf_chain += ['format=nv12', 'hwupload']
-            elif encoder.endswith('_qsv'):
-                vf_chain += ['format=nv12', 'hwupload=extra_hw_frames=64']
-            cmd += ['-vf', ','.join(vf_chain)]
-            cmd += [
-                '-r', str(TRANSCODE_PARAMS['fps']),
-                '-vsync', 'cfr',
-            ]
-            if not (encoder.endswith('_vaapi') or encoder.endswith('_qsv')):
-                cmd += ['-pix_fmt', TRANSCODE_PARAMS['pix_fmt']]
-            cmd += [
-                '-c:v', encoder,
-                '-b:v', TRANSCODE_PARAMS['bitrate'],
-                '-c:a', 'aac',
-                '-b:a', TRANSCODE_PARAMS['audio_bitrate'],
-                '-f', 'mpegts',
-                ts
-            ]
-            print(f"[DEBUG] FFmpeg命令: {' '.join(cmd)}")
-            subprocess.run(cmd, check=True)
-            duration = get_media_duration_seconds(ts)
-            print(f"[DEBUG] 剪辑时长: {duration} 秒")
-            clip_durations.append(duration)
-            ts_paths[i] = ts
-
-        # 创建最终的视频剪辑
-        print("[DEBUG] 创建最终视频剪辑")
-        final_clips = []
-        for i, f in enumerate(tmp_files):
-            # 添加间隔片段（在每个视频前）
-            if i < len(gap_segments):
-                try:
-                    print(f"[DEBUG] 加载间隔片段: {gap_segments[i]}")
-                    final_clips.append(VideoFileClip(gap_segments[i]))
-                except Exception as e:
-                    print(f"⚠️ 加载间隔片段失败：{e}")
-                    traceback.print_exc()
-            # 添加转码后的视频片段
-            try:
-                print(f"[DEBUG] 加载视频片段: {ts_paths[i]}")
-                final_clips.append(VideoFileClip(ts_paths[i]))
-            except Exception as e:
-                print(f"⚠️ 加载视频片段失败：{e}")
-                traceback.print_exc()
-
-        if not final_clips:
-            print("❌ 没有可用的视频片段")
+        merged = merge_files(files, download_dir, encoder)
+        if merged is None:
             return False
-
-        print("\n🎬 正在拼接视频...")
-        final_video = concatenate_videoclips(final_clips, method="compose")
-        
-        # 输出文件路径
-        output = os.path.join(tmpdir, "merged.mp4")
-        print(f"[DEBUG] 输出文件路径: {output}")
-        
-        # 写入最终视频文件
-        if encoder.startswith(('h264_', 'hevc_')) and encoder != 'libx264' and encoder != 'libx265':
-            # 使用硬件编码器，先用 moviepy 生成临时文件，再用 ffmpeg 转码
-            temp_output = os.path.join(tmpdir, "temp_merged.mp4")
-            print(f"[DEBUG] 使用硬件编码器，先生成临时文件: {temp_output}")
-            final_video.write_videofile(
-                temp_output,
-                fps=TRANSCODE_PARAMS['fps'],
-                codec='libx264',  # 临时使用 CPU 编码
-                audio_codec='aac',
-                bitrate="5000k",
-                preset="ultrafast",
-                threads=4
-            )
-            
-            # 使用 ffmpeg 进行硬件编码转码
-            print(f"🔄 使用硬件编码器 {encoder} 进行最终转码...")
-            import subprocess as sp
-            cmd = ['ffmpeg', '-y', '-i', temp_output]
-            
-            # 根据编码器类型添加硬件加速参数
-            if encoder.endswith('_nvenc'):
-                cmd += ['-c:v', encoder, '-preset', 'p7', '-tune', 'hq']
-            elif encoder.endswith('_amf'):
-                cmd += ['-c:v', encoder, '-quality', 'quality']
-            elif encoder.endswith('_qsv'):
-                cmd += ['-c:v', encoder, '-preset', 'medium']
-            elif encoder.endswith('_vaapi'):
-                from utils import get_vaapi_device_path
-                vaapi_dev = get_vaapi_device_path()
-                if vaapi_dev:
-                    cmd += ['-c:v', encoder, '-vaapi_device', vaapi_dev]
-                else:
-                    cmd += ['-c:v', encoder]
-            elif encoder.endswith('_videotoolbox'):
-                cmd += ['-c:v', encoder]
-            else:
-                cmd += ['-c:v', encoder]
-            
-            cmd += ['-b:v', '5000k', '-c:a', 'aac', '-b:a', '320k', output]
-            
-            try:
-                print(f"[DEBUG] 硬件编码命令: {' '.join(cmd)}")
-                sp.run(cmd, check=True)
-                # 删除临时文件
-                if os.path.exists(temp_output):
-                    print(f"[DEBUG] 删除临时文件: {temp_output}")
-                    os.remove(temp_output)
-            except sp.CalledProcessError as e:
-                print(f"⚠️ 硬件编码失败，回退到 CPU 编码: {e}")
-                traceback.print_exc()
-                # 如果硬件编码失败，直接使用临时文件
-                if os.path.exists(temp_output):
-                    os.rename(temp_output, output)
-        else:
-            # 使用 CPU 编码器
-            print(f"[DEBUG] 使用CPU编码器: {encoder}")
-            final_video.write_videofile(
-                output,
-                fps=TRANSCODE_PARAMS['fps'],
-                codec=encoder,
-                audio_codec='aac',
-                bitrate="5000k",
-                preset="ultrafast",
-                threads=4
-            )
-        
-        merged_subtitle = None
-        if subtitle_entries:
-            merged_subtitle = os.path.splitext(output)[0] + ".ass"
-            print(f"⚠ 正在按精确累计时长合并字幕，并包含每段之间的 2 秒间隔...")
-            merge_ass_with_offsets(subtitle_entries, clip_durations, gap_seconds=2.0, merged_subtitle_path=merged_subtitle)
-            print(f"✅ 字幕合并完成：{merged_subtitle}")
-        else:
-            print("ℹ️ 未检测到可合并的字幕文件。")
-
-        audio_path = os.path.splitext(output)[0] + ".mp3"
-        print(f"[DEBUG] 音频路径: {audio_path}")
-        # 创建音频文件（使用MoviePy）
-        if final_video.audio is not None:
-            final_video.audio.write_audiofile(audio_path, codec='libmp3lame', bitrate="320k")
-            print(f"✅ 音轨分离完成：{audio_path}")
-        else:
-            print("ℹ️ 视频没有音频轨道，跳过音轨分离")
-
-        print("\n📢 合并已完成，请输入合并后视频的新文件名（不含路径和扩展名，自动保存在脚本同一目录下）：")
-        while True:
-            new_name = input("请输入文件名（如 myvideo）：").strip()
-            print(f"[DEBUG] 用户输入文件名: {new_name}")
-            if new_name and all(c not in new_name for c in r'\/:*?"<>|'):
-                break
-            print("❌ 文件名无效，请重新输入（不能包含特殊字符）")
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        print(f"[DEBUG] 基础目录: {base_dir}")
-
-        video_target = move_file(output, base_dir, new_name)
-        if video_target:
-            print(f"✅ 视频已保存为：{video_target}")
-            if merged_subtitle:
-                subtitle_target = move_file(merged_subtitle, base_dir, new_name)
-                if subtitle_target:
-                    print(f"✅ 字幕已保存为：{subtitle_target}")
-            audio_target = move_file(audio_path, base_dir, new_name)
-            if audio_target:
-                print(f"✅ 音频已保存为：{audio_target}")
+        save_merge_outputs(*merged)
 
         print("\n🎉 合并及保存全部完成！文件均已保存在脚本同一目录下。")
         return True
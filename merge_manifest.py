@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import threading
+
+from log import get_logger
+
+logger = get_logger('merge_manifest')
+
+
+def source_fingerprint(path: str) -> dict:
+    """源文件指纹：绝对路径 + 大小 + 修改时间（文件被替换或修改后指纹随之变化）"""
+    try:
+        st = os.stat(path)
+        return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    except OSError:
+        return {'path': os.path.abspath(path), 'size': None, 'mtime_ns': None}
+
+
+CONTENT_SAMPLE_BYTES = 1024 * 1024
+
+
+def content_fingerprint(path: str) -> str | None:
+    """
+    按内容（而非路径）识别源文件：大小 + 开头、中间、结尾各 1 MiB 的 SHA-256。
+    同一视频重新下载到别的目录后指纹不变；只读取约 3 MiB，不必对整个文件求哈希。
+    """
+    try:
+        size = os.path.getsize(path)
+        h = hashlib.sha256(str(size).encode('ascii'))
+        with open(path, 'rb') as f:
+            for offset in sorted({0, max(0, size // 2 - CONTENT_SAMPLE_BYTES // 2), max(0, size - CONTENT_SAMPLE_BYTES)}):
+                f.seek(offset)
+                h.update(f.read(CONTENT_SAMPLE_BYTES))
+        return h.hexdigest()
+    except OSError as e:
+        logger.debug("无法计算内容指纹: %s, %s", path, e)
+        return None
+
+
+def params_digest(params) -> str:
+    payload = json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MergeManifest:
+    """
+    记录 .merge_work 中已完成的产物（间隔片段、clip_XXX.ts、时长、拼接输出）及产生它们的输入与参数。
+    重新运行合并时，参数一致且文件完好的产物直接复用，从第一个缺失或失效的产物继续。
+    """
+
+    FILENAME = 'manifest.json'
+
+    def __init__(self, work_dir: str):
+        self.path = os.path.join(work_dir, self.FILENAME)
+        self._lock = threading.Lock()
+        self._entries: dict = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('artifacts', {})
+            logger.debug("载入合并清单，已记录产物: %s", len(self._entries))
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save(self) -> None:
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'artifacts': self._entries}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def lookup(self, name: str, params) -> dict | None:
+        """产物已完成、参数一致且文件大小未变时返回其记录，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(name)
+        if not entry or entry.get('digest') != params_digest(params):
+            return None
+        for output in entry.get('outputs', []):
+            try:
+                if os.path.getsize(output['path']) != output['size']:
+                    return None
+            except OSError:
+                return None
+        return entry
+
+    def record(self, name: str, params, outputs: list, **extra) -> None:
+        """记录一个完成的产物（立即写盘，中断后已完成的部分不会丢失）"""
+        entry = {
+            'digest': params_digest(params),
+            'outputs': [{'path': p, 'size': os.path.getsize(p)} for p in outputs],
+        }
+        entry.update(extra)
+        with self._lock:
+            self._entries[name] = entry
+            self._save()
+
+    def update(self, name: str, **extra) -> None:
+        """为已记录的产物补充信息（如探测到的时长）"""
+        with self._lock:
+            if name in self._entries:
+                self._entries[name].update(extra)
+                self._save()
+
+    def invalidate(self, name: str) -> None:
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._save()
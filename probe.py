@@ -0,0 +1,219 @@
+import os
+import json
+import subprocess
+import threading
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, List
+
+from utils import get_ffprobe_path, get_cache_dir
+from log import get_logger
+
+logger = get_logger('probe')
+
+
+@dataclass
+class MediaInfo:
+    """一次 ffprobe 得到的媒体信息（时长、分辨率、帧率、编码、音轨）"""
+    path: str
+    duration: float = 0.0
+    width: int | None = None
+    height: int | None = None
+    frame_rate: str | None = None
+    video_codec: str | None = None
+    video_profile: str | None = None
+    video_level: int | None = None
+    # 视频流 extradata（H.264/HEVC 的 SPS/PPS 等参数集）的 SHA-256
+    video_extradata_hash: str | None = None
+    pix_fmt: str | None = None
+    audio_codec: str | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    # EBU R128 首遍测量结果（loudness.measure_loudness 写入，随探测缓存一起保存）
+    loudness: dict | None = None
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_codec is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    @property
+    def resolution(self) -> tuple | None:
+        if self.width and self.height:
+            return (self.width, self.height)
+        return None
+
+    @property
+    def fps(self) -> float | None:
+        if not self.frame_rate:
+            return None
+        try:
+            num, _, den = self.frame_rate.partition('/')
+            return float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'MediaInfo':
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+_CACHE_LOCK = threading.Lock()
+_CACHE: Dict[str, dict] | None = None
+_CACHE_DIRTY = False
+
+
+def _cache_file() -> str:
+    return os.path.join(get_cache_dir(), 'probe_cache.json')
+
+
+def _load_cache() -> Dict[str, dict]:
+    global _CACHE
+    if _CACHE is None:
+        try:
+            with open(_cache_file(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # 只保留当前格式（以路径为键、条目内记录大小与修改时间、包含 MediaInfo 全部字段）的条目，
+            # 旧版本写入的条目直接丢弃、下次用到时重新探测
+            required = {f.name for f in fields(MediaInfo)} | {'file_size'}
+            _CACHE = {k: v for k, v in data.items() if isinstance(v, dict) and required <= v.keys()}
+            logger.debug("载入探测缓存，条目数: %s", len(_CACHE))
+        except (OSError, ValueError):
+            _CACHE = {}
+    return _CACHE
+
+
+def save_probe_cache() -> None:
+    """把探测缓存写回磁盘（剔除已不存在的文件的条目）"""
+    global _CACHE_DIRTY
+    with _CACHE_LOCK:
+        if _CACHE is None or not _CACHE_DIRTY:
+            return
+        for key in [k for k, v in _CACHE.items() if not os.path.exists(v.get('path', ''))]:
+            del _CACHE[key]
+        path = _cache_file()
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(_CACHE, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            _CACHE_DIRTY = False
+        except OSError as e:
+            logger.debug("写入探测缓存失败: %s", e)
+
+
+def _file_stamp(path: str) -> tuple | None:
+    """(缓存键, 大小, 修改时间)：以绝对路径为键，每个路径只有一个条目；同一路径的文件被改写时覆盖旧条目"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def _valid_entry(stamp: tuple) -> dict | None:
+    """调用方持有 _CACHE_LOCK；条目记录的大小与修改时间与文件当前一致时返回条目"""
+    key, size, mtime_ns = stamp
+    entry = _load_cache().get(key)
+    if entry is None or entry.get('file_size') != size or entry.get('file_mtime_ns') != mtime_ns:
+        return None
+    return entry
+
+
+def _run_ffprobe(path: str) -> MediaInfo | None:
+    ffprobe = get_ffprobe_path() or 'ffprobe'
+    cmd = [ffprobe, '-v', 'error', '-show_streams', '-show_format', '-show_data_hash', 'sha256', '-of', 'json', path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=60)
+    except Exception as e:
+        logger.debug("ffprobe 执行失败: %s, %s", path, e)
+        return None
+    if result.returncode != 0:
+        logger.debug("ffprobe 失败: %s, %s", path, result.stderr.decode('utf-8', errors='ignore').strip())
+        return None
+    try:
+        data = json.loads(result.stdout.decode('utf-8', errors='ignore') or '{}')
+    except ValueError:
+        return None
+
+    info = MediaInfo(path=os.path.abspath(path))
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type == 'video' and info.video_codec is None:
+            # 跳过封面图（attached_pic）
+            if (stream.get('disposition') or {}).get('attached_pic'):
+                continue
+            info.video_codec = stream.get('codec_name')
+            info.video_profile = stream.get('profile')
+            info.video_level = stream.get('level')
+            info.video_extradata_hash = stream.get('extradata_hash')
+            info.width = stream.get('width')
+            info.height = stream.get('height')
+            info.pix_fmt = stream.get('pix_fmt')
+            info.frame_rate = stream.get('r_frame_rate')
+        elif codec_type == 'audio' and info.audio_codec is None:
+            info.audio_codec = stream.get('codec_name')
+            info.sample_rate = int(stream['sample_rate']) if stream.get('sample_rate') else None
+            info.channels = stream.get('channels')
+    try:
+        info.duration = float((data.get('format') or {}).get('duration') or 0.0)
+    except ValueError:
+        info.duration = 0.0
+    return info
+
+
+def probe_media(path: str, use_cache: bool = True) -> MediaInfo | None:
+    """探测单个文件；命中磁盘缓存时不启动 ffprobe。失败返回 None。"""
+    global _CACHE_DIRTY
+    stamp = _file_stamp(path)
+    if stamp is None:
+        logger.debug("文件不存在，无法探测: %s", path)
+        return None
+    if use_cache:
+        with _CACHE_LOCK:
+            cached = _valid_entry(stamp)
+        if cached is not None:
+            return MediaInfo.from_dict(cached)
+    info = _run_ffprobe(path)
+    if info is not None:
+        entry = asdict(info)
+        entry.update(file_size=stamp[1], file_mtime_ns=stamp[2])
+        with _CACHE_LOCK:
+            _load_cache()[stamp[0]] = entry
+            _CACHE_DIRTY = True
+    return info
+
+
+def update_probe_cache(path: str, **values) -> None:
+    """把附加信息（如响度测量）写入该文件的探测缓存条目；条目不存在时先探测"""
+    global _CACHE_DIRTY
+    stamp = _file_stamp(path)
+    if stamp is None:
+        return
+    with _CACHE_LOCK:
+        entry = _valid_entry(stamp)
+    if entry is None:
+        if probe_media(path) is None:
+            return
+    with _CACHE_LOCK:
+        entry = _valid_entry(stamp)
+        if entry is not None:
+            entry.update(values)
+            _CACHE_DIRTY = True
+
+
+def probe_many(paths: List[str], max_workers: int = 8, use_cache: bool = True) -> Dict[str, MediaInfo | None]:
+    """并发探测多个文件，返回 路径 -> MediaInfo（失败为 None），结束后写回缓存"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    results: Dict[str, MediaInfo | None] = {}
+    if not paths:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        for path, info in zip(paths, pool.map(lambda p: probe_media(p, use_cache), paths)):
+            results[path] = info
+    save_probe_cache()
+    return results
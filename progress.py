@@ -0,0 +1,208 @@
+"""
+ffmpeg 进度：以 -progress pipe:1 逐块解析为结构化进度事件，stderr 只保留最后若干行（环形缓冲），
+长时间编码也不会在内存中累积输出。
+"""
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, List
+
+from log import get_logger
+
+logger = get_logger('progress')
+
+STDERR_TAIL_LINES = 200
+
+
+@dataclass
+class FFmpegProgress:
+    frame: int = 0
+    fps: float = 0.0
+    speed: float | None = None
+    # 已输出的媒体时长（秒）
+    out_time: float = 0.0
+    # 输入总时长（秒），未知时为 None
+    total: float | None = None
+    elapsed: float = 0.0
+    done: bool = False
+
+    @property
+    def fraction(self) -> float | None:
+        if not self.total:
+            return None
+        return min(1.0, self.out_time / self.total)
+
+    @property
+    def eta(self) -> float | None:
+        """剩余秒数：优先按编码速度估算，其次按已用时间外推"""
+        if self.done:
+            return 0.0
+        if not self.total:
+            return None
+        remaining = max(0.0, self.total - self.out_time)
+        if self.speed:
+            return remaining / self.speed
+        if self.out_time > 0:
+            return self.elapsed * remaining / self.out_time
+        return None
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def _parse_out_time(fields: dict) -> float | None:
+    # out_time_us 为微秒；旧版本的 out_time_ms 实际上也是微秒
+    for key in ('out_time_us', 'out_time_ms'):
+        value = fields.get(key, '')
+        if value.lstrip('-').isdigit():
+            return max(0, int(value)) / 1_000_000
+    value = fields.get('out_time', '')
+    if value and value != 'N/A':
+        try:
+            h, m, s = value.split(':')
+            return int(h) * 3600 + int(m) * 60 + float(s)
+        except ValueError:
+            return None
+    return None
+
+
+class FFmpegError(subprocess.CalledProcessError):
+    """ffmpeg 返回非零；stderr 为环形缓冲中的最后若干行"""
+
+    def __str__(self) -> str:
+        tail = (self.stderr or '').strip()
+        return tail[-2000:] if tail else f"ffmpeg 返回码 {self.returncode}"
+
+
+def with_progress_args(cmd: List[str]) -> List[str]:
+    """
+    在 ffmpeg 可执行文件之后（可能有 sudo 前缀）插入 -progress pipe:1 -nostats；
+    输出写到标准输出的命令不能使用进度管道，原样返回。
+    """
+    if any(arg in ('-', 'pipe:', 'pipe:1') for arg in cmd[1:]) or '-progress' in cmd:
+        return list(cmd)
+    index = next((i for i, arg in enumerate(cmd)
+                  if os.path.basename(str(arg)).lower() in ('ffmpeg', 'ffmpeg.exe')), 0)
+    return list(cmd[:index + 1]) + ['-progress', 'pipe:1', '-nostats'] + list(cmd[index + 1:])
+
+
+def run_with_progress(cmd: List[str], total: float | None = None,
+                      on_progress: Callable[[FFmpegProgress], None] | None = None,
+                      timeout: float | None = None, check: bool = True) -> subprocess.CompletedProcess:
+    """
+    运行 ffmpeg，逐块解析进度并回调 on_progress（每个进度块一次，结束时 done=True）。
+    返回 CompletedProcess（stderr 为最后若干行文本）；check=True 且失败时抛出 FFmpegError。
+    """
+    cmd = with_progress_args(cmd)
+    tail: deque = deque(maxlen=STDERR_TAIL_LINES)
+    start = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _drain_stderr() -> None:
+        for raw in proc.stderr:
+            tail.append(raw.decode('utf-8', errors='ignore').rstrip())
+
+    stderr_thread = threading.Thread(target=_drain_stderr, daemon=True)
+    stderr_thread.start()
+    timed_out = threading.Event()
+    timer = None
+    if timeout:
+        def _kill() -> None:
+            timed_out.set()
+            proc.kill()
+        timer = threading.Timer(timeout, _kill)
+        timer.start()
+
+    progress = FFmpegProgress(total=total)
+    fields: dict = {}
+    try:
+        for raw in proc.stdout:
+            key, sep, value = raw.decode('utf-8', errors='ignore').strip().partition('=')
+            if not sep:
+                continue
+            fields[key] = value
+            if key != 'progress':
+                continue
+            # 一个进度块以 progress=continue/end 结束
+            out_time = _parse_out_time(fields)
+            speed = fields.get('speed', '').rstrip('x')
+            progress = FFmpegProgress(
+                frame=int(fields['frame']) if fields.get('frame', '').isdigit() else progress.frame,
+                fps=float(fields['fps']) if fields.get('fps', '').replace('.', '', 1).isdigit() else progress.fps,
+                speed=float(speed) if speed.replace('.', '', 1).isdigit() and float(speed) > 0 else progress.speed,
+                out_time=out_time if out_time is not None else progress.out_time,
+                total=total,
+                elapsed=time.monotonic() - start,
+                done=value == 'end',
+            )
+            fields = {}
+            if on_progress is not None:
+                on_progress(progress)
+        returncode = proc.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        stderr_thread.join(timeout=5)
+        proc.stdout.close()
+        proc.stderr.close()
+
+    stderr_text = '\n'.join(tail)
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, stderr=stderr_text)
+    if check and returncode != 0:
+        raise FFmpegError(returncode, cmd, stderr=stderr_text)
+    logger.debug("ffmpeg 完成，用时 %.1f 秒: %s", time.monotonic() - start, cmd[-1])
+    return subprocess.CompletedProcess(cmd, returncode, stdout=None, stderr=stderr_text)
+
+
+class ProgressAggregator:
+    """
+    汇总多个并发任务的进度，按时间间隔节流输出一行总进度；
+    report(key) 返回可直接传给 run_with_progress 的回调。
+    """
+
+    def __init__(self, label: str, totals: dict, interval: float = 5.0,
+                 on_update: Callable[[str], None] | None = None):
+        self.label = label
+        self.totals = dict(totals)
+        self.interval = interval
+        self.on_update = on_update or print
+        self._done_time: dict = {}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._last_emit = 0.0
+
+    def report(self, key) -> Callable[[FFmpegProgress], None]:
+        def _callback(progress: FFmpegProgress) -> None:
+            with self._lock:
+                self._done_time[key] = self.totals.get(key, 0.0) if progress.done else progress.out_time
+                now = time.monotonic()
+                if now - self._last_emit < self.interval:
+                    return
+                self._last_emit = now
+                line = self.summary(now)
+            self.on_update(line)
+        return _callback
+
+    def summary(self, now: float | None = None) -> str:
+        now = now or time.monotonic()
+        total = sum(self.totals.values())
+        done = sum(min(self._done_time.get(k, 0.0), t) for k, t in self.totals.items())
+        if not total:
+            return f"⏳ {self.label}：已用时 {format_eta(now - self._start)}"
+        fraction = done / total
+        elapsed = now - self._start
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        return f"⏳ {self.label}：{fraction * 100:5.1f}%，已用时 {format_eta(elapsed)}，预计剩余 {format_eta(eta)}"
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from typing import List
+
+from utils import get_cache_dir, link_or_copy
+from log import get_logger
+
+logger = get_logger('segment_cache')
+
+
+class SegmentCache:
+    """
+    跨运行的内容寻址段缓存（间隔片段、转码片段等）。
+
+    条目按参数的 SHA-256 命名，存放在 <缓存目录>/<namespace>/ 下；命中时刷新访问时间（atime），
+    写入后按 atime 做 LRU 淘汰，使总大小不超过 max_bytes。
+    条目常以硬链接出现在合并工作目录中，与其共享 inode：只改 atime、不动 mtime，
+    否则每次命中都会改变工作目录中段的修改时间，使合并清单中以 mtime 为指纹的记录失效。
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, suffix: str = '.ts'):
+        self.root = get_cache_dir(namespace)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        logger.debug("段缓存目录: %s, 容量上限: %s 字节", self.root, max_bytes)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """把访问时间设为当前时间，保留修改时间"""
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+
+    def lookup(self, key: str) -> str | None:
+        """命中返回缓存文件路径（并刷新其 LRU 时间），否则返回 None"""
+        path = self._path(key)
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return None
+        self._touch(path)
+        logger.debug("段缓存命中: %s", key[:12])
+        return path
+
+    def store(self, key: str, src: str) -> str | None:
+        """把已生成的文件放入缓存（reflink/硬链接优先），返回缓存路径；失败返回 None"""
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            link_or_copy(src, tmp)
+            os.replace(tmp, path)
+            self._touch(path)
+        except OSError as e:
+            logger.debug("写入段缓存失败: %s", e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """按最近使用时间淘汰最旧的条目，直到总大小不超过上限"""
+        with self._lock:
+            entries: List[tuple] = []
+            total = 0
+            for dirpath, _, names in os.walk(self.root):
+                for name in names:
+                    if not name.endswith(self.suffix):
+                        continue
+                    full = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    entries.append((st.st_atime, st.st_size, full))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, full in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(full)
+                    total -= size
+                    logger.debug("淘汰段缓存: %s", os.path.basename(full))
+                except OSError:
+                    pass
+
+
+def _cache_limit_bytes(env_name: str, default_mb: int) -> int:
+    value = os.environ.get(env_name, '').strip()
+    mb = int(value) if value.isdigit() else default_mb
+    return mb * 1024 * 1024
+
+
+def get_gap_cache() -> SegmentCache:
+    """标题卡缓存，容量由 BILI_GAP_CACHE_MB 指定（默认 1024 MB）"""
+    return SegmentCache('gaps', _cache_limit_bytes('BILI_GAP_CACHE_MB', 1024))
+
+
+def get_clip_cache() -> SegmentCache | None:
+    """
+    转码片段缓存，容量由 BILI_CLIP_CACHE_MB 指定（默认 20480 MB）；设为 0 时不缓存。
+    不同合并中出现的同一源文件只转码一次。
+    """
+    limit = _cache_limit_bytes('BILI_CLIP_CACHE_MB', 20480)
+    if limit <= 0:
+        return None
+    return SegmentCache('clips', limit)
@@ -0,0 +1,305 @@
+"""
+字幕合并：把多个片段的字幕（ASS / SRT / VTT / MicroDVD .sub）按各片段在成片中的起始时间平移后，
+流式写入单个 ASS 字幕。
+
+- 偏移由 clip_start_offsets 一次性前缀和算出，每个事件只做一次加法
+- 事件逐行读取、逐条写出，内存占用与字幕条数无关
+- 第一遍只读各 ASS 文件 [Events] 之前的头部，合并样式；第二遍流式处理事件
+"""
+import os
+import re
+from itertools import accumulate
+from typing import Dict, Iterator, List, NamedTuple, TextIO, Tuple
+
+from log import get_logger
+
+logger = get_logger('subtitles')
+
+ASS_EVENT_FIELDS = ['Layer', 'Start', 'End', 'Style', 'Name', 'MarginL', 'MarginR', 'MarginV', 'Effect', 'Text']
+ASS_STYLE_FIELDS = ['Name', 'Fontname', 'Fontsize', 'PrimaryColour', 'SecondaryColour', 'OutlineColour', 'BackColour',
+                    'Bold', 'Italic', 'Underline', 'StrikeOut', 'ScaleX', 'ScaleY', 'Spacing', 'Angle', 'BorderStyle',
+                    'Outline', 'Shadow', 'Alignment', 'MarginL', 'MarginR', 'MarginV', 'Encoding']
+ASS_STYLE_FORMAT = 'Format: ' + ', '.join(ASS_STYLE_FIELDS)
+# SSA（[V4 Styles]）没有 Format 行时的默认字段顺序
+SSA_STYLE_FIELDS = ['Name', 'Fontname', 'Fontsize', 'PrimaryColour', 'SecondaryColour', 'TertiaryColour', 'BackColour',
+                    'Bold', 'Italic', 'BorderStyle', 'Outline', 'Shadow', 'Alignment', 'MarginL', 'MarginR', 'MarginV',
+                    'AlphaLevel', 'Encoding']
+# SRT/VTT/MicroDVD 事件使用的样式
+DEFAULT_STYLE = ('Style: Default,Arial,56,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,'
+                 '0,0,0,0,100,100,0,0,1,2,1,2,20,20,40,1')
+# 源样式缺少的字段取 DEFAULT_STYLE 中的值
+STYLE_DEFAULTS = dict(zip(ASS_STYLE_FIELDS, DEFAULT_STYLE[len('Style: '):].split(',')))
+MICRODVD_DEFAULT_FPS = 25.0
+
+_CUE_TIME = re.compile(
+    r'^\s*((?:\d+:)?\d{1,2}:\d{2}[,.]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[,.]\d{1,3})'
+)
+_MICRODVD = re.compile(r'^\{(\d+)\}\{(\d*)\}(.*)$')
+_HTML_TAGS = {
+    '<i>': r'{\i1}', '</i>': r'{\i0}', '<b>': r'{\b1}', '</b>': r'{\b0}',
+    '<u>': r'{\u1}', '</u>': r'{\u0}', '<s>': r'{\s1}', '</s>': r'{\s0}',
+}
+_ANY_TAG = re.compile(r'</?[^>]+>')
+
+
+class SubtitleSource(NamedTuple):
+    path: str
+    # 该片段在成片中的起始时间（秒）
+    offset: float
+    # 仅 MicroDVD（.sub）使用：文件未声明帧率时按此帧率换算
+    fps: float | None = None
+
+
+def clip_start_offsets(durations: List[float], gaps_before: List[float]) -> List[float]:
+    """
+    前缀和：第 i 个片段的起始时间 = 前面所有片段时长 + 前面（含自身之前）的所有间隔时长。
+    gaps_before[i] 为插在片段 i 之前的间隔时长（没有间隔时为 0）。
+    """
+    totals = list(accumulate((g + d for g, d in zip(gaps_before, durations)), initial=0.0))
+    return [totals[i] + gaps_before[i] for i in range(len(durations))]
+
+
+def parse_timestamp(text: str) -> float:
+    """解析 ASS（h:mm:ss.cc）、SRT（hh:mm:ss,mmm）与 VTT（[hh:]mm:ss.mmm）时间"""
+    text = text.strip().replace(',', '.')
+    parts = text.split(':')
+    seconds = float(parts[-1])
+    if len(parts) >= 2:
+        seconds += int(parts[-2]) * 60
+    if len(parts) >= 3:
+        seconds += int(parts[-3]) * 3600
+    return seconds
+
+
+def format_ass_time(seconds: float) -> str:
+    # 以整数厘秒运算，避免逐级进位
+    cs = max(0, int(round(seconds * 100)))
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+def _open(path: str) -> TextIO:
+    return open(path, 'r', encoding='utf-8-sig', errors='replace')
+
+
+def subtitle_format(path: str) -> str | None:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.ass', '.ssa'):
+        return 'ass'
+    if ext in ('.srt', '.vtt'):
+        return 'cue'
+    if ext == '.sub':
+        # 只支持文本的 MicroDVD；VobSub（.sub + .idx）是图像字幕，无法转为 ASS
+        with open(path, 'rb') as f:
+            head = f.read(64).lstrip(b'\xef\xbb\xbf')
+        return 'microdvd' if head.startswith(b'{') else None
+    return None
+
+
+# ---- ASS 头部 ----
+
+def _ssa_alignment(value: str) -> str:
+    """SSA 的对齐编号（底 1-3、顶 5-7、中 9-11）换算为 ASS 的小键盘编号（底 1-3、中 4-6、顶 7-9）"""
+    try:
+        n = int(value)
+    except ValueError:
+        return value
+    if n >= 9:
+        return str(n - 5)
+    if n >= 5:
+        return str(n + 2)
+    return str(n)
+
+
+def _remap_style(fields: List[str], rest: str, ssa: bool) -> str:
+    """按源文件的 Format 字段解析一行 Style，重排为 ASS_STYLE_FORMAT 的字段顺序；缺少的字段取默认值"""
+    values = dict(zip(fields, (v.strip() for v in rest.split(',', len(fields) - 1))))
+    if ssa:
+        # SSA 的 TertiaryColour 即 ASS 的 OutlineColour；AlphaLevel 在 ASS 中没有对应字段，丢弃
+        if 'TertiaryColour' in values:
+            values.setdefault('OutlineColour', values.pop('TertiaryColour'))
+        if 'Alignment' in values:
+            values['Alignment'] = _ssa_alignment(values['Alignment'])
+    return 'Style: ' + ','.join(values.get(name, STYLE_DEFAULTS[name]) for name in ASS_STYLE_FIELDS)
+
+
+def _read_ass_header(path: str) -> Tuple[List[str], Dict[str, str]]:
+    """
+    读取 [Events] 之前的部分，返回 (除样式外的头部行, 样式名 -> Style 行)。
+    Style 行按所在节的 Format 字段解析并重排为 ASS_STYLE_FORMAT 的顺序，SSA 的 [V4 Styles] 同样换算。
+    """
+    header: List[str] = []
+    styles: Dict[str, str] = {}
+    section = ''
+    fields: List[str] = ASS_STYLE_FIELDS
+    with _open(path) as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                section = stripped.lower()
+                if section == '[events]':
+                    break
+                if section == '[v4 styles]':
+                    fields = SSA_STYLE_FIELDS
+                elif section == '[v4+ styles]':
+                    fields = ASS_STYLE_FIELDS
+                else:
+                    header.append(stripped)
+                continue
+            if section in ('[v4+ styles]', '[v4 styles]'):
+                kind, _, rest = stripped.partition(':')
+                if kind.lower() == 'format':
+                    fields = [name.strip() for name in rest.split(',')]
+                elif kind.lower() == 'style':
+                    name = rest.split(',', 1)[0].strip()
+                    if name not in styles:
+                        styles[name] = _remap_style(fields, rest, section == '[v4 styles]')
+            elif stripped.lower().startswith('scripttype:'):
+                # 输出统一为 ASS（[V4+ Styles]）
+                header.append('ScriptType: v4.00+')
+            elif stripped:
+                header.append(stripped)
+    return header, styles
+
+
+def _write_header(fout: TextIO, sources: List[SubtitleSource], formats: List[str | None]) -> None:
+    script_info: List[str] = []
+    styles: Dict[str, str] = {}
+    for source, fmt in zip(sources, formats):
+        if fmt != 'ass':
+            continue
+        header, file_styles = _read_ass_header(source.path)
+        if not script_info:
+            script_info = header
+        for name, line in file_styles.items():
+            # 同名样式以先出现的为准
+            styles.setdefault(name, line)
+    if not script_info:
+        script_info = ['[Script Info]', 'ScriptType: v4.00+', 'PlayResX: 1920', 'PlayResY: 1080', 'WrapStyle: 0']
+    if any(fmt in ('cue', 'microdvd') for fmt in formats) and 'Default' not in styles:
+        styles['Default'] = DEFAULT_STYLE
+
+    fout.write('\n'.join(script_info) + '\n\n')
+    fout.write('[V4+ Styles]\n' + ASS_STYLE_FORMAT + '\n')
+    for line in styles.values():
+        fout.write(line + '\n')
+    fout.write('\n[Events]\nFormat: ' + ', '.join(ASS_EVENT_FIELDS) + '\n')
+
+
+# ---- 事件解析：逐行读取，产出 (类型, 开始秒, 结束秒, 其余字段 dict) ----
+
+def _iter_ass_events(f: TextIO) -> Iterator[Tuple[str, float, float, Dict[str, str]]]:
+    in_events = False
+    fields = ASS_EVENT_FIELDS
+    for line in f:
+        stripped = line.strip()
+        if stripped.startswith('[') and stripped.endswith(']'):
+            in_events = stripped.lower() == '[events]'
+            continue
+        if not in_events or ':' not in stripped:
+            continue
+        kind, _, rest = stripped.partition(':')
+        if kind.lower() == 'format':
+            fields = [name.strip() for name in rest.split(',')]
+            continue
+        if kind not in ('Dialogue', 'Comment'):
+            continue
+        values = rest.lstrip().split(',', len(fields) - 1)
+        if len(values) < len(fields):
+            continue
+        event = dict(zip(fields, values))
+        try:
+            start, end = parse_timestamp(event['Start']), parse_timestamp(event['End'])
+        except (KeyError, ValueError):
+            continue
+        yield kind, start, end, event
+
+
+def _cue_text_to_ass(lines: List[str]) -> str:
+    text = r'\N'.join(line.strip() for line in lines)
+    for tag, ass_tag in _HTML_TAGS.items():
+        text = text.replace(tag, ass_tag)
+    return _ANY_TAG.sub('', text)
+
+
+def _iter_cue_events(f: TextIO) -> Iterator[Tuple[str, float, float, Dict[str, str]]]:
+    """SRT 与 VTT 共用：遇到时间行开始一条字幕，空行结束；序号、NOTE/STYLE 块自然被跳过"""
+    start = end = None
+    text: List[str] = []
+    for line in f:
+        if start is None:
+            m = _CUE_TIME.match(line)
+            if m:
+                start, end = parse_timestamp(m.group(1)), parse_timestamp(m.group(2))
+                text = []
+            continue
+        if line.strip():
+            text.append(line)
+            continue
+        if text:
+            yield 'Dialogue', start, end, {'Style': 'Default', 'Text': _cue_text_to_ass(text)}
+        start = None
+    if start is not None and text:
+        yield 'Dialogue', start, end, {'Style': 'Default', 'Text': _cue_text_to_ass(text)}
+
+
+def _iter_microdvd_events(f: TextIO, fps: float | None) -> Iterator[Tuple[str, float, float, Dict[str, str]]]:
+    fps = fps or MICRODVD_DEFAULT_FPS
+    first = True
+    for line in f:
+        m = _MICRODVD.match(line.strip())
+        if not m:
+            continue
+        start_frame, end_frame, text = int(m.group(1)), m.group(2), m.group(3)
+        # 约定：首行 {1}{1}23.976 声明帧率
+        if first and start_frame == 1 and end_frame == '1':
+            try:
+                fps = float(text)
+                first = False
+                continue
+            except ValueError:
+                pass
+        first = False
+        end = int(end_frame) if end_frame else start_frame + int(fps * 3)
+        text = re.sub(r'\{[^}]*\}', '', text).replace('|', r'\N')
+        yield 'Dialogue', start_frame / fps, end / fps, {'Style': 'Default', 'Text': text}
+
+
+def _iter_events(source: SubtitleSource, fmt: str, f: TextIO):
+    if fmt == 'ass':
+        return _iter_ass_events(f)
+    if fmt == 'cue':
+        return _iter_cue_events(f)
+    return _iter_microdvd_events(f, source.fps)
+
+
+def merge_subtitles(sources: List[SubtitleSource], output_path: str) -> int:
+    """
+    按各自的 offset 平移并合并为单个 ASS 字幕，返回写入的事件数。
+    不支持的字幕（如图像 VobSub）跳过并给出警告。
+    """
+    formats = [subtitle_format(source.path) for source in sources]
+    for source, fmt in zip(sources, formats):
+        if fmt is None:
+            print(f"⚠️ 不支持的字幕格式，已跳过：{os.path.basename(source.path)}")
+
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as fout:
+        _write_header(fout, sources, formats)
+        write = fout.write
+        for source, fmt in zip(sources, formats):
+            if fmt is None:
+                continue
+            logger.debug("合并字幕: %s, 格式: %s, 偏移: %s 秒", source.path, fmt, source.offset)
+            offset = source.offset
+            with _open(source.path) as fin:
+                for kind, start, end, event in _iter_events(source, fmt, fin):
+                    write(f"{kind}: {event.get('Layer', '0')},{format_ass_time(start + offset)},"
+                          f"{format_ass_time(end + offset)},{event.get('Style', 'Default')},"
+                          f"{event.get('Name', '')},{event.get('MarginL', '0')},{event.get('MarginR', '0')},"
+                          f"{event.get('MarginV', '0')},{event.get('Effect', '')},{event.get('Text', '')}\n")
+                    count += 1
+    logger.debug("字幕合并完成，事件数: %s", count)
+    return count
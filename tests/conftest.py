@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# 仓库为平铺模块，测试直接从仓库根目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """每个测试使用独立的持久缓存目录，并从空的探测缓存开始"""
+    import probe
+    monkeypatch.setenv('BILI_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(probe, '_CACHE', None)
+    monkeypatch.setattr(probe, '_CACHE_DIRTY', False)
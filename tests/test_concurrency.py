@@ -0,0 +1,111 @@
+from concurrency import AdaptiveLimiter, _dir_size
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _limiter(initial, maximum, **kwargs):
+    clock = _Clock()
+    limiter = AdaptiveLimiter(initial, maximum, on_change=lambda message: None, clock=clock, **kwargs)
+    return limiter, clock
+
+
+def _grow(path, size):
+    with open(path / 'video.mp4', 'ab') as f:
+        f.write(b'x' * size)
+
+
+def test_additive_increase_only_when_saturated():
+    limiter, _ = _limiter(2, 4)
+    limiter.acquire('a')
+    limiter.acquire('b')
+    limiter.release('a', ok=True)
+    assert limiter.limit == 2.5
+    # 只剩一个下载时并发槽没有用满，不调整
+    limiter.release('b', ok=True)
+    assert limiter.limit == 2.5
+
+
+def test_throttle_halves_once_per_window():
+    limiter, clock = _limiter(4, 8)
+    for key in 'abc':
+        limiter.acquire(key)
+    limiter.release('a', ok=False, throttled=True)
+    assert limiter.limit == 2
+    limiter.release('b', ok=False, throttled=True)
+    assert limiter.limit == 2
+    # 冷却期内成功也不增加
+    limiter.acquire('d')
+    limiter.release('c', ok=True)
+    assert limiter.limit == 2
+    clock.now = limiter.window + 1
+    limiter.release('d', ok=False, throttled=True)
+    assert limiter.limit == 1
+    assert limiter.throttle_events == 3
+
+
+def test_plateau_steps_back_one_level(tmp_path):
+    limiter, clock = _limiter(1, 4)
+    (tmp_path / 'a').mkdir()
+    limiter.acquire('a', str(tmp_path / 'a'))
+    _grow(tmp_path / 'a', 10000)
+    limiter.release('a', ok=True)
+    assert limiter.limit == 2
+
+    (tmp_path / 'b').mkdir()
+    limiter.acquire('b', str(tmp_path / 'b'))
+    limiter.acquire('c')
+    clock.now = limiter.window + 1
+    _grow(tmp_path / 'b', 1000)
+    limiter.release('b', ok=True)
+    assert limiter.limit == 1
+
+
+def test_stalled_transfer_is_cancelled(tmp_path):
+    limiter, clock = _limiter(4, 8, stall_seconds=5)
+    limiter.acquire('a', str(tmp_path))
+    cancelled = []
+    limiter.set_cancel('a', lambda: cancelled.append('a'))
+    clock.now = 4
+    limiter.poll()
+    assert not cancelled
+    clock.now = 5
+    limiter.poll()
+    assert cancelled == ['a']
+    assert limiter.stall_events == 1 and limiter.limit == 2
+
+
+def test_bandwidth_ceiling_pauses_running_downloads(tmp_path):
+    limiter, clock = _limiter(4, 8, bandwidth_limit=100, stall_seconds=5)
+    calls = []
+    for key in 'ab':
+        (tmp_path / key).mkdir()
+        limiter.acquire(key, str(tmp_path / key))
+        limiter.set_cancel(key, lambda key=key: calls.append((key, 'cancel')),
+                           lambda paused, key=key: calls.append((key, paused)))
+    _grow(tmp_path / 'a', 2000)
+    clock.now = 1
+    limiter.poll()
+    clock.now = 2
+    limiter.poll()
+    # 最晚开始的先暂停
+    assert calls == [('b', True), ('a', True)]
+
+    # 吞吐回落后逐个恢复；暂停期间没有增长不算停滞
+    clock.now = limiter.window + 3
+    limiter.poll()
+    assert calls[2:] == [('a', False)]
+    limiter.release('b', ok=True)
+    assert calls[3:] == [('b', False)]
+    assert limiter.pause_events == 2 and limiter.stall_events == 0
+
+
+def test_dir_size_ignores_logs(tmp_path):
+    _grow(tmp_path, 100)
+    (tmp_path / 'yutto.log').write_bytes(b'x' * 50)
+    assert _dir_size(str(tmp_path)) == 100
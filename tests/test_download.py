@@ -0,0 +1,57 @@
+import pytest
+
+from download import _error_kind, classify_failure, is_throttled
+
+
+def _log(tmp_path, text):
+    path = tmp_path / 'yutto.log'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('line, kind', [
+    (' ERROR  HTTP 412 Precondition Failed', 'throttle'),
+    ('[ERROR] 请求过于频繁 code: -412', 'throttle'),
+    ('{"code": -404, "message": "啥都木有", "ttl": 1}', 'permanent'),
+    (' ERROR  稿件不可见', 'permanent'),
+    ('httpx.ConnectError: timed out', 'transient'),
+    (' ERROR  HTTP 502 Bad Gateway', 'transient'),
+])
+def test_error_kind(line, kind):
+    assert _error_kind(line) == kind
+
+
+@pytest.mark.parametrize('line', [
+    ' INFO  视频 412 号：Too Many Requests 合集',
+    '{"code": 0, "message": "0", "ttl": 1}',
+    ' INFO  接口返回 code: 0',
+    ' DEBUG  code: -404',
+    '下载进度 412/429 MiB',
+])
+def test_informational_lines_are_not_errors(line):
+    assert _error_kind(line) is None
+
+
+def test_throttle_wins_over_permanent(tmp_path):
+    log = _log(tmp_path, ' ERROR  稿件不可见\n ERROR  HTTP 429 Too Many Requests\n INFO  退出\n')
+    permanent, error = classify_failure(log)
+    assert not permanent and is_throttled(error)
+
+
+def test_permanent_error_is_not_retried(tmp_path):
+    log = _log(tmp_path, ' INFO  code: 0\n{"code": 62002, "message": "稿件不可见"}\n')
+    assert classify_failure(log) == (True, '{"code": 62002, "message": "稿件不可见"}')
+
+
+def test_only_this_attempt_is_classified(tmp_path):
+    first = ' ERROR  稿件不可见\n'
+    log = _log(tmp_path, first + ' ERROR  connection reset by peer\n')
+    permanent, error = classify_failure(log, offset=len(first.encode('utf-8')))
+    assert not permanent and 'connection reset' in error
+
+
+def test_no_error_lines_is_retryable(tmp_path):
+    log = _log(tmp_path, ' INFO  code: 0\n INFO  已完成 50%\n')
+    permanent, error = classify_failure(log)
+    assert not permanent and not is_throttled(error)
+    assert classify_failure(str(tmp_path / 'missing.log')) == (False, '')
@@ -0,0 +1,24 @@
+import merge
+from jobs import DownloadJob, MergeJob
+from main import run_batch
+
+
+def test_run_batch_accepts_a_single_bv_string(monkeypatch):
+    seen = []
+    monkeypatch.setattr(DownloadJob, 'run', lambda self: seen.append(self.bv_list) or [])
+    assert run_batch({'bv': 'BV1xx411c7mD', 'merge': False}) == 0
+    assert seen == [['BV1xx411c7mD']]
+
+
+def test_merge_jobs_on_one_directory_use_separate_work_dirs(tmp_path, monkeypatch):
+    work_dirs = []
+
+    def _merge_files(files, download_dir, encoder, loudnorm=None, work_name=None):
+        work_dirs.append(merge.work_dir_path(download_dir, work_name))
+    monkeypatch.setattr(merge, 'merge_files', _merge_files)
+    for name in ('playlist a', 'playlist/b'):
+        MergeJob(download_dir=str(tmp_path), files=['x.mp4'], encoder='libx264', output_name=name).run()
+
+    assert len(set(work_dirs)) == 2
+    assert all(path.startswith(str(tmp_path / '.merge_work_')) for path in work_dirs)
+    assert merge.work_dir_path(str(tmp_path)) == str(tmp_path / '.merge_work')
@@ -0,0 +1,154 @@
+import logging
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import merge
+from merge_manifest import MergeManifest
+from probe import MediaInfo
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None, reason="需要 ffmpeg 与 ffprobe")
+
+BT709_TAGS = ['-color_primaries', 'bt709', '-color_trc', 'bt709', '-colorspace', 'bt709', '-color_range', 'tv']
+
+
+def _make_source(path, tags, size='1280x720', rate=30):
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={rate}:duration=1',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:duration=1',
+        *tags, '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest', str(path),
+    ], check=True)
+    return str(path)
+
+
+def test_gap_and_clip_write_the_same_color_tags():
+    gap_args = merge._segment_encode_args('libx264', [], 'gap.ts', in_range='pc')
+    clip_cmd = merge.build_transcode_cmd('src.mp4', 'clip.ts', 'libx264', 1280, 720)
+    for args in (gap_args, clip_cmd):
+        joined = ' '.join(args)
+        assert ' '.join(merge.color_args()) in joined
+        assert 'out_color_matrix=bt709:out_range=tv' in joined
+    assert 'in_range=pc' in ' '.join(gap_args)
+
+
+def test_mismatched_remux_is_retranscoded_alone(monkeypatch):
+    infos = {
+        'gap.ts': MediaInfo('gap.ts', video_codec='h264', video_extradata_hash='a'),
+        'clip_0.ts': MediaInfo('clip_0.ts', video_codec='h264', video_extradata_hash='a'),
+        'clip_1.ts': MediaInfo('clip_1.ts', video_codec='h264', video_extradata_hash='b'),
+    }
+    ran = []
+    monkeypatch.setattr(merge, 'probe_many', lambda paths, **kw: {p: infos[p] for p in paths})
+    monkeypatch.setattr(merge, 'run_clip_job', lambda job, *a, **kw: ran.append(job) or job.dst)
+    jobs = [merge.ClipJob('a.mp4', 'clip_0.ts', mode='remux'), merge.ClipJob('b.mp4', 'clip_1.ts', mode='remux_audio')]
+
+    redone = merge.retranscode_mismatched_remuxes(jobs, {0: 'gap.ts'}, {0: 'clip_0.ts', 1: 'clip_1.ts'}, 'libx264')
+
+    assert redone == [1]
+    assert [job.src for job in ran] == ['b.mp4']
+    assert [job.mode for job in jobs] == ['remux', 'transcode']
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('tags', [[], BT709_TAGS], ids=['untagged', 'bt709'])
+def test_gap_card_and_transcoded_clip_take_copy_path(tmp_path, monkeypatch, tags):
+    pytest.importorskip('numpy')
+    pytest.importorskip('PIL')
+    src = _make_source(tmp_path / 'source.mp4', tags)
+    work = tmp_path / 'work'
+    work.mkdir()
+    gap = merge.generate_gap_segment(str(work), 0, 'source', encoder='libx264')
+    job = merge.ClipJob(src, str(work / 'clip_000.ts'), 1280, 720, 'transcode')
+    merge.run_clip_job(job, 'libx264')
+
+    assert merge.segments_compatible([gap, job.dst])
+
+    def _no_encode(*args, **kwargs):
+        raise AssertionError("不应回退到编码拼接")
+    monkeypatch.setattr(merge, 'encode_concat', _no_encode)
+    output, audio, _ = merge.assemble_segments(
+        str(work), [src], [job], {0: gap}, {0: job.dst}, 'libx264', MergeManifest(str(work)))
+    assert os.path.getsize(output) > 0
+    assert audio and os.path.getsize(audio) > 0
+
+
+def _fake_timeline(tmp_path, monkeypatch, clip_hash):
+    """一个间隔片段 + 一个转码片段，探测结果由 clip_hash 决定是否与间隔片段一致；返回 (调用记录, 拼接参数)"""
+    gap, clip = str(tmp_path / 'gap_000.ts'), str(tmp_path / 'clip_000.ts')
+    infos = {
+        gap: MediaInfo(gap, 2.0, 1920, 1080, '60/1', 'h264', audio_codec='aac', video_extradata_hash='a'),
+        clip: MediaInfo(clip, 5.0, 1920, 1080, '60/1', 'h264', audio_codec='aac', video_extradata_hash=clip_hash),
+    }
+    calls = []
+
+    def _concat(kind):
+        def run(segments, output, _list_or_encoder, audio_output=None):
+            calls.append(kind)
+            for path in filter(None, (output, audio_output)):
+                with open(path, 'wb') as f:
+                    f.write(b'merged')
+        return run
+    monkeypatch.setattr(merge, 'probe_many', lambda paths, **kw: {p: infos[p] for p in paths})
+    monkeypatch.setattr(merge, 'concat_segments_copy', _concat('copy'))
+    monkeypatch.setattr(merge, 'encode_concat', _concat('encode'))
+    job = merge.ClipJob(str(tmp_path / 'source.mp4'), clip)
+    return calls, (str(tmp_path), [job.src], [job], {0: gap}, {0: clip}, 'libx264', MergeManifest(str(tmp_path)))
+
+
+def test_matching_segments_take_copy_path(tmp_path, monkeypatch):
+    calls, args = _fake_timeline(tmp_path, monkeypatch, clip_hash='a')
+    merge.assemble_segments(*args)
+    assert calls == ['copy']
+    assert MergeManifest(str(tmp_path))._entries['merged']['concat_mode'] == 'copy'
+
+
+def test_fallback_to_encode_logs_the_reason(tmp_path, monkeypatch, caplog):
+    calls, args = _fake_timeline(tmp_path, monkeypatch, clip_hash='b')
+    # bili 日志器不向根日志器传播，直接挂上 caplog 的处理器
+    bili = logging.getLogger('bili')
+    bili.addHandler(caplog.handler)
+    try:
+        with caplog.at_level(logging.INFO, logger='bili'):
+            merge.assemble_segments(*args)
+    finally:
+        bili.removeHandler(caplog.handler)
+    assert calls == ['encode']
+    assert MergeManifest(str(tmp_path))._entries['merged']['concat_mode'] == 'encode'
+    assert any(r.levelno == logging.INFO and 'video_extradata_hash' in r.getMessage() for r in caplog.records)
+
+
+@pytest.mark.parametrize('encoder', ['libx264', 'hevc_vaapi'])
+def test_encode_concat_uses_a_single_concat_input(encoder):
+    cmd = merge.build_concat_encode_cmd('list.txt', 'out.mp4', encoder, has_audio=True, audio_output='out.mp3')
+    assert cmd.count('-i') == 1
+    assert cmd[cmd.index('-f') + 1] == 'concat' and cmd[cmd.index('-i') + 1] == 'list.txt'
+    assert 'scale=' not in ' '.join(cmd)
+    assert cmd[-1] == 'out.mp3'
+
+
+@requires_ffmpeg
+def test_encode_concat_joins_mismatched_segments(tmp_path):
+    pytest.importorskip('numpy')
+    pytest.importorskip('PIL')
+    from probe import probe_media
+    gap = merge.generate_gap_segment(str(tmp_path), 0, 'title', encoder='libx264')
+    # 转码参数不同于段格式（不同码率与 GOP），参数集与间隔片段不一致
+    clip = str(tmp_path / 'clip_000.ts')
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'testsrc2=size=1920x1080:rate=60:duration=1',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000:duration=1',
+        '-ac', '2', '-c:v', 'libx264', '-g', '7', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest', clip,
+    ], check=True)
+    assert not merge.segments_compatible([gap, clip])
+
+    output, audio = str(tmp_path / 'merged.mp4'), str(tmp_path / 'merged.mp3')
+    assert merge.encode_concat([gap, clip], output, 'libx264', audio) == 'libx264'
+    info = probe_media(output, use_cache=False)
+    assert info.has_video and info.has_audio
+    assert info.duration == pytest.approx(merge.GAP_SECONDS + 1.0, abs=0.2)
+    assert os.path.getsize(audio) > 0
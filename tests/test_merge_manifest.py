@@ -0,0 +1,58 @@
+import os
+
+from merge_manifest import MergeManifest, content_fingerprint, source_fingerprint
+
+
+def _write(path, data=b'segment'):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_recorded_artifact_survives_reload(tmp_path):
+    out = _write(tmp_path / 'clip_000.ts')
+    MergeManifest(str(tmp_path)).record('clip_000', {'mode': 'transcode'}, [out], duration=5.0)
+    entry = MergeManifest(str(tmp_path)).lookup('clip_000', {'mode': 'transcode'})
+    assert entry and entry['duration'] == 5.0
+
+
+def test_changed_params_miss(tmp_path):
+    out = _write(tmp_path / 'clip_000.ts')
+    manifest = MergeManifest(str(tmp_path))
+    manifest.record('clip_000', {'mode': 'transcode', 'crf': 23}, [out])
+    assert manifest.lookup('clip_000', {'mode': 'transcode', 'crf': 24}) is None
+
+
+def test_resized_or_missing_output_misses(tmp_path):
+    out = _write(tmp_path / 'clip_000.ts')
+    manifest = MergeManifest(str(tmp_path))
+    manifest.record('clip_000', {}, [out])
+    _write(tmp_path / 'clip_000.ts', b'truncated')
+    assert manifest.lookup('clip_000', {}) is None
+    os.remove(out)
+    assert manifest.lookup('clip_000', {}) is None
+
+
+def test_modified_source_changes_the_params(tmp_path):
+    src = _write(tmp_path / 'source.mp4', b'a' * 10)
+    out = _write(tmp_path / 'clip_000.ts')
+    manifest = MergeManifest(str(tmp_path))
+    manifest.record('clip_000', {'source': source_fingerprint(src)}, [out])
+    before = content_fingerprint(src)
+    _write(tmp_path / 'source.mp4', b'b' * 11)
+    assert manifest.lookup('clip_000', {'source': source_fingerprint(src)}) is None
+    assert content_fingerprint(src) != before
+
+
+def test_invalidate_and_update(tmp_path):
+    out = _write(tmp_path / 'merged.mp4')
+    manifest = MergeManifest(str(tmp_path))
+    manifest.record('merged', {}, [out])
+    manifest.update('merged', concat_mode='copy')
+    assert MergeManifest(str(tmp_path)).lookup('merged', {})['concat_mode'] == 'copy'
+    manifest.invalidate('merged')
+    assert MergeManifest(str(tmp_path)).lookup('merged', {}) is None
+
+
+def test_corrupt_manifest_starts_empty(tmp_path):
+    (tmp_path / MergeManifest.FILENAME).write_text('{not json', encoding='utf-8')
+    assert MergeManifest(str(tmp_path)).lookup('merged', {}) is None
@@ -0,0 +1,67 @@
+import json
+import os
+
+import probe
+from probe import MediaInfo, probe_many, probe_media, update_probe_cache
+
+
+def _fake_ffprobe(monkeypatch):
+    calls = []
+
+    def run(path):
+        calls.append(path)
+        return MediaInfo(os.path.abspath(path), duration=float(os.path.getsize(path)), video_codec='h264')
+    monkeypatch.setattr(probe, '_run_ffprobe', run)
+    return calls
+
+
+def _reload(monkeypatch):
+    monkeypatch.setattr(probe, '_CACHE', None)
+
+
+def test_cached_entry_skips_ffprobe_after_reload(tmp_path, monkeypatch):
+    calls = _fake_ffprobe(monkeypatch)
+    src = tmp_path / 'a.mp4'
+    src.write_bytes(b'x' * 10)
+    probe_many([str(src)])
+    _reload(monkeypatch)
+    assert probe_media(str(src)).duration == 10.0
+    assert len(calls) == 1
+
+
+def test_rewritten_file_replaces_its_entry(tmp_path, monkeypatch):
+    calls = _fake_ffprobe(monkeypatch)
+    src = tmp_path / 'a.mp4'
+    src.write_bytes(b'x' * 10)
+    probe_many([str(src)])
+    src.write_bytes(b'x' * 20)
+    os.utime(src, ns=(0, os.stat(src).st_mtime_ns + 1_000_000))
+    assert probe_many([str(src)])[str(src)].duration == 20.0
+    assert len(calls) == 2
+    with open(probe._cache_file(), encoding='utf-8') as f:
+        assert list(json.load(f)) == [str(src)]
+
+
+def test_old_format_entries_and_deleted_files_are_dropped(tmp_path, monkeypatch):
+    calls = _fake_ffprobe(monkeypatch)
+    src = tmp_path / 'a.mp4'
+    src.write_bytes(b'x')
+    gone = tmp_path / 'gone.mp4'
+    gone.write_bytes(b'x')
+    probe_many([str(src), str(gone)])
+    with open(probe._cache_file(), encoding='utf-8') as f:
+        data = json.load(f)
+    # 旧格式：以 路径|大小|修改时间 为键、条目内没有文件大小
+    data[f"{src}|1|0"] = {'path': str(src), 'duration': 1.0}
+    with open(probe._cache_file(), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    _reload(monkeypatch)
+    assert set(probe._load_cache()) == {str(src), str(gone)}
+
+    os.remove(gone)
+    update_probe_cache(str(src), loudness={'input_i': -20.0})
+    probe.save_probe_cache()
+    _reload(monkeypatch)
+    assert set(probe._load_cache()) == {str(src)}
+    assert probe_media(str(src)).loudness == {'input_i': -20.0}
+    assert len(calls) == 2
@@ -0,0 +1,53 @@
+import os
+
+from merge_manifest import MergeManifest, source_fingerprint
+from segment_cache import SegmentCache
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return str(path)
+
+
+def test_hit_does_not_touch_mtime_of_linked_segment(tmp_path):
+    cache = SegmentCache('clips', 10 * 1024 * 1024)
+    key = cache.make_key('clip', 'a')
+    work = tmp_path / 'work'
+    work.mkdir()
+    segment = _write(work / 'clip_000.ts', 100)
+    cached = cache.store(key, segment)
+    os.utime(cached, ns=(1_000_000_000, 2_000_000_000))
+    params = {'segments': [source_fingerprint(segment)]}
+    manifest = MergeManifest(str(work))
+    manifest.record('merged', params, [segment])
+
+    assert cache.lookup(key) == cached
+
+    assert os.stat(segment).st_mtime_ns == 2_000_000_000
+    assert os.stat(cached).st_atime_ns > 1_000_000_000
+    assert MergeManifest(str(work)).lookup('merged', {'segments': [source_fingerprint(segment)]})
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = SegmentCache('gaps', 250)
+    keys = [cache.make_key('gap', name) for name in 'abc']
+    paths = [cache.store(key, _write(tmp_path / f'{i}.ts', 100)) for i, key in enumerate(keys[:2])]
+    # a 比 b 更早写入，但随后被命中，应保留；最久未使用的 b 被淘汰
+    os.utime(paths[0], ns=(1_000_000_000, 1_000_000_000))
+    os.utime(paths[1], ns=(2_000_000_000, 2_000_000_000))
+    cache.lookup(keys[0])
+
+    cache.store(keys[2], _write(tmp_path / '2.ts', 100))
+
+    assert cache.lookup(keys[0]) is not None
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[2]) is not None
+
+
+def test_empty_or_missing_entries_miss(tmp_path):
+    cache = SegmentCache('gaps', 1024)
+    key = cache.make_key('gap', 'empty')
+    assert cache.lookup(key) is None
+    cache.store(key, _write(tmp_path / 'empty.ts', 0))
+    assert cache.lookup(key) is None
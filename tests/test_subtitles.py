@@ -0,0 +1,66 @@
+from subtitles import (
+    ASS_STYLE_FIELDS, SubtitleSource, _remap_style, clip_start_offsets, format_ass_time, merge_subtitles,
+)
+
+ASS_SOURCE = """[Script Info]
+ScriptType: v4.00+
+
+[V4+ Styles]
+Format: Name, Fontsize, Fontname, Alignment, PrimaryColour
+Style: Top,30,SimHei,8,&H0000FFFF
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 1,0:00:01.00,0:00:02.50,Top,,0,0,0,,你好，世界
+"""
+
+SSA_SOURCE = """[Script Info]
+ScriptType: v4.00
+
+[V4 Styles]
+Style: Mid,Arial,20,&H00FFFFFF,&H00000000,&H00112233,&H00000000,0,0,1,2,0,10,10,10,10,0,134
+
+[Events]
+Format: Marked, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: Marked=0,0:00:00.50,0:00:01.00,Mid,,0,0,0,,SSA
+"""
+
+
+def _styles(text):
+    return {line.split(',', 1)[0][len('Style: '):]: dict(zip(ASS_STYLE_FIELDS, line[len('Style: '):].split(',')))
+            for line in text.splitlines() if line.startswith('Style: ')}
+
+
+def test_remap_style_follows_the_source_format():
+    style = _remap_style(['Name', 'Fontsize', 'Fontname'], 'Top, 30, SimHei', ssa=False)
+    values = dict(zip(ASS_STYLE_FIELDS, style[len('Style: '):].split(',')))
+    assert (values['Name'], values['Fontname'], values['Fontsize']) == ('Top', 'SimHei', '30')
+    assert values['ScaleX'] == '100'
+
+
+def test_merged_styles_and_events(tmp_path):
+    ass, ssa, srt = tmp_path / 'a.ass', tmp_path / 'b.ssa', tmp_path / 'c.srt'
+    ass.write_text(ASS_SOURCE, encoding='utf-8')
+    ssa.write_text(SSA_SOURCE, encoding='utf-8')
+    srt.write_text('1\n00:00:01,000 --> 00:00:02,000\n<i>srt</i>\n\n', encoding='utf-8')
+    output = tmp_path / 'merged.ass'
+
+    count = merge_subtitles([SubtitleSource(str(ass), 10), SubtitleSource(str(ssa), 20),
+                             SubtitleSource(str(srt), 30)], str(output))
+
+    text = output.read_text(encoding='utf-8')
+    styles = _styles(text)
+    assert styles['Top']['Fontname'] == 'SimHei' and styles['Top']['Alignment'] == '8'
+    # SSA：TertiaryColour → OutlineColour，对齐 10（中间居中）→ 5
+    assert styles['Mid']['OutlineColour'] == '&H00112233' and styles['Mid']['Alignment'] == '5'
+    assert styles['Mid']['Encoding'] == '134'
+    assert 'Default' in styles
+    assert count == 3
+    assert 'Dialogue: 1,0:00:11.00,0:00:12.50,Top,,0,0,0,,你好，世界' in text
+    assert 'Dialogue: 0,0:00:20.50,0:00:21.00,Mid,,0,0,0,,SSA' in text
+    assert r'Dialogue: 0,0:00:31.00,0:00:32.00,Default,,0,0,0,,{\i1}srt{\i0}' in text
+
+
+def test_offsets_and_time_format():
+    assert clip_start_offsets([5.0, 3.0, 4.0], [2.0, 2.0, 0.0]) == [2.0, 9.0, 12.0]
+    assert format_ass_time(3599.999) == '1:00:00.00'
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+import yutto_worker
+
+
+def _open(execution, **kwargs):
+    async def run():
+        async with execution.create_client(**kwargs) as session:
+            return session
+    return asyncio.run(run())
+
+
+def test_jobs_share_one_http_session(monkeypatch):
+    execution = pytest.importorskip('yutto.core.execution')
+    monkeypatch.setattr(execution, 'create_client', execution.create_client)
+    close_sessions = yutto_worker._share_http_session()
+    assert close_sessions is not None
+
+    # 每个任务各自 asyncio.run，会话跨事件循环复用且不被关闭
+    first = _open(execution, cookies={'SESSDATA': 'a'}, trust_env=False)
+    second = _open(execution, cookies={'SESSDATA': 'a'}, trust_env=False)
+    other = _open(execution, cookies={'SESSDATA': 'b'}, trust_env=False)
+
+    assert first is second and not first.is_closed
+    assert other is not first
+    close_sessions()
+    assert first.is_closed and other.is_closed
@@ -0,0 +1,281 @@
+"""
+常驻 yutto 工作进程：每个工作进程只启动一次解释器、只导入一次 yutto，然后在进程内逐个执行下载任务，
+不再为每个 BV 启动一个 `python -m yutto`。
+
+父进程通过 YuttoWorkerPool 调度（每个并发槽一个工作进程），协议为按行 JSON：
+    父 -> 子  {"argv": [...], "log": "<日志路径>"}
+    子 -> 父  {"ready": true} 启动完成；{"returncode": n} 每个任务一行
+任务执行期间文件描述符 1/2 重定向到该 BV 的日志文件（yutto 调用的 ffmpeg 子进程同样写入日志），
+协议使用单独复制出的描述符，不会被任务输出打乱。
+同一工作进程内的任务共用 yutto 的 HTTP 会话（见 _share_http_session），连接池跨 BV 保留。
+"""
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import traceback
+from contextlib import asynccontextmanager
+from typing import Callable, List
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+# 任务启动回调：收到 (终止回调, 暂停/恢复回调或 None)
+OnStart = Callable[[Callable[[], None], Callable[[bool], None] | None], None]
+
+
+def _reply(channel, **message) -> None:
+    channel.write(json.dumps(message, ensure_ascii=False) + '\n')
+    channel.flush()
+
+
+def _exit_code(code) -> int:
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+
+def _run_job(yutto_main, argv: List[str], log_path: str) -> int:
+    """在本进程内执行一次 yutto 命令行，输出写入 log_path，返回退出码"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = (os.dup(1), os.dup(2))
+    saved_argv = sys.argv
+    try:
+        with open(log_path, 'ab') as log:
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+            sys.argv = ['yutto'] + list(argv)
+            try:
+                yutto_main()
+                code = 0
+            except SystemExit as e:
+                code = _exit_code(e.code)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+    finally:
+        sys.argv = saved_argv
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+    return code
+
+
+def _share_http_session() -> Callable[[], None] | None:
+    """
+    让本进程内的各个任务复用同一个 yutto HTTP 会话（保留连接池与 TLS 会话，避免每个 BV 重新握手）。
+    yutto 每次执行都通过 yutto.core.execution.create_client 新建会话、结束时关闭；这里把它换成
+    按请求参数（cookies、代理、超时等）缓存会话且不关闭的版本。会话是原生对象，不绑定事件循环，
+    可以跨任务（每个任务各自的 asyncio.run）使用。
+    返回关闭全部会话的函数；当前 yutto 版本没有这些接口时返回 None，仍由 yutto 为每个任务新建会话。
+    """
+    try:
+        from yutto.core import execution
+        from yutto.utils import fetcher
+        session_type = fetcher.YuttoSession
+        original = execution.create_client
+    except (ImportError, AttributeError):
+        return None
+    sessions = {}
+
+    def _new_session(headers, cookies, trust_env, proxy, timeout, verify):
+        # 与 fetcher.create_client 的构造参数保持一致
+        ca_cert_file = os.environ.get("SSL_CERT_FILE") if trust_env and verify else None
+        ca_cert_dir = os.environ.get("SSL_CERT_DIR") if trust_env and verify and not ca_cert_file else None
+        return session_type(
+            headers=dict(headers or {}), cookies=dict(cookies or {}), proxy=proxy, use_system_proxy=trust_env,
+            accept_invalid_certs=not verify, ca_cert_file=ca_cert_file, ca_cert_dir=ca_cert_dir,
+            read_timeout=timeout, connect_timeout=timeout,
+        )
+
+    @asynccontextmanager
+    async def create_client(headers=fetcher.DEFAULT_HEADERS, cookies=None, trust_env=fetcher.DEFAULT_TRUST_ENV,
+                            proxy=fetcher.DEFAULT_PROXY, timeout=5, *, verify=False):
+        key = json.dumps([dict(headers or {}), dict(cookies or {}), trust_env, proxy, timeout, verify], sort_keys=True)
+        session = sessions.get(key)
+        if session is None or session.is_closed:
+            try:
+                session = sessions[key] = _new_session(headers, cookies, trust_env, proxy, timeout, verify)
+            except TypeError:
+                # 会话构造参数与本模块不符（yutto 版本变化），本次退回 yutto 自己的实现
+                async with original(headers, cookies, trust_env, proxy, timeout, verify=verify) as own:
+                    yield own
+                return
+        yield session
+
+    def close_all() -> None:
+        for session in sessions.values():
+            session.close()
+        sessions.clear()
+
+    execution.create_client = create_client
+    return close_all
+
+
+def worker_main() -> int:
+    # 协议通道使用复制出的描述符；原 stdin/stdout 指向空设备，任务的读写不会干扰协议
+    jobs = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    channel = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    null_in = os.open(os.devnull, os.O_RDONLY)
+    null_out = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(null_in, 0)
+    os.dup2(null_out, 1)
+    try:
+        from yutto.__main__ import main as yutto_main
+    except Exception as e:
+        _reply(channel, ready=False, error=repr(e))
+        return 1
+    close_sessions = _share_http_session()
+    _reply(channel, ready=True, shared_session=close_sessions is not None)
+    try:
+        for line in jobs:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            _reply(channel, returncode=_run_job(yutto_main, job['argv'], job['log']))
+    finally:
+        if close_sessions is not None:
+            close_sessions()
+    return 0
+
+
+class WorkerUnavailable(RuntimeError):
+    """工作进程无法启动（如 yutto 未安装在该解释器中）"""
+
+
+class YuttoWorker:
+    """父进程一侧的单个工作进程句柄；进程按需启动，意外退出后下一个任务自动重启"""
+
+    def __init__(self, python: str):
+        self.python = python
+        self.proc: subprocess.Popen | None = None
+        # 当前任务序号；kill 回调只在发出它的任务仍在执行时生效，不会误杀之后的任务
+        self._job = 0
+        self._running = False
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("yutto 工作进程意外退出")
+        return json.loads(line)
+
+    def _start(self) -> None:
+        from log import get_logger
+        self.proc = subprocess.Popen(
+            [self.python, WORKER_SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, encoding='utf-8',
+        )
+        try:
+            hello = self._read()
+        except (RuntimeError, ValueError) as e:
+            hello = {'ready': False, 'error': str(e)}
+        if not hello.get('ready'):
+            self.close()
+            raise WorkerUnavailable(hello.get('error') or "未知错误")
+        get_logger('yutto_worker').debug(
+            "yutto 工作进程已启动: pid=%s, 共享 HTTP 会话=%s", self.proc.pid, hello.get('shared_session', False))
+
+    def _killer(self, job: int) -> Callable[[], None]:
+        def kill() -> None:
+            with self._lock:
+                if self._running and self._job == job and self.proc is not None:
+                    self.proc.kill()
+        return kill
+
+    def _pauser(self, job: int) -> Callable[[bool], None] | None:
+        from concurrency import CAN_PAUSE, pause_process
+        if not CAN_PAUSE:
+            return None
+
+        def pause(paused: bool) -> None:
+            with self._lock:
+                if self.proc is None:
+                    return
+                # 暂停只针对仍在执行的这个任务；恢复总是发出，任务恰在暂停前结束时工作进程也不会一直停着
+                if not paused or (self._running and self._job == job):
+                    pause_process(self.proc, paused)
+        return pause
+
+    def run(self, argv: List[str], log_path: str, on_start: OnStart | None = None) -> int:
+        """
+        执行一个任务；on_start 收到终止本任务的回调（终止后工作进程在下一个任务时重启）
+        与暂停/恢复本任务的回调（平台不支持时为 None）
+        """
+        if self.proc is None or self.proc.poll() is not None:
+            self._start()
+        with self._lock:
+            self._job += 1
+            self._running = True
+            job = self._job
+        try:
+            self.proc.stdin.write(json.dumps({'argv': argv, 'log': log_path}, ensure_ascii=False) + '\n')
+            self.proc.stdin.flush()
+            if on_start is not None:
+                on_start(self._killer(job), self._pauser(job))
+            return int(self._read().get('returncode', 1))
+        except (OSError, RuntimeError, ValueError) as e:
+            # 工作进程在任务中途崩溃或被终止：记入该 BV 的日志，本任务按失败处理
+            with open(log_path, 'a', encoding='utf-8') as log:
+                log.write(f"\n[yutto 工作进程异常] {e}\n")
+            self.close()
+            return 1
+        finally:
+            with self._lock:
+                self._running = False
+
+    def close(self) -> None:
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+class YuttoWorkerPool:
+    """
+    固定数量的常驻工作进程（与下载并发数相同）；run() 取一个空闲进程执行任务。
+    第一次启动失败后整个池标记为不可用，此后 run() 直接抛出 WorkerUnavailable，由调用方退回逐个进程的方式。
+    """
+
+    def __init__(self, size: int, python: str):
+        self._idle: queue.Queue = queue.Queue()
+        for _ in range(max(1, size)):
+            self._idle.put(YuttoWorker(python))
+        self._lock = threading.Lock()
+        self.error: str | None = None
+
+    def run(self, argv: List[str], log_path: str, on_start: OnStart | None = None) -> int:
+        if self.error is not None:
+            raise WorkerUnavailable(self.error)
+        worker = self._idle.get()
+        try:
+            return worker.run(argv, log_path, on_start)
+        except WorkerUnavailable as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = str(e)
+                    print(f"⚠️ yutto 工作进程启动失败，改为每个 BV 单独启动进程：{e}")
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+if __name__ == '__main__':
+    sys.exit(worker_main())